@@ -0,0 +1,176 @@
+"""A stand-in for the Docker Engine API, served on a Unix socket. It answers
+the requests the CLI makes from the images and containers that fake_docker.py
+records in the shared state file.
+"""
+
+import fcntl
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlparse
+
+_STATS = {
+    "cpu_stats": {
+        "cpu_usage": {"total_usage": 4000000},
+        "system_cpu_usage": 40000000,
+        "online_cpus": 4,
+    },
+    "precpu_stats": {
+        "cpu_usage": {"total_usage": 2000000},
+        "system_cpu_usage": 20000000,
+    },
+    "memory_stats": {"usage": 600000000, "limit": 8000000000},
+    "networks": {"eth0": {"rx_bytes": 1000, "tx_bytes": 500}},
+    "blkio_stats": {"io_service_bytes_recursive": []},
+}
+
+
+class FakeDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, state_path: Path, docker_root: Path):
+        if socket_path.exists():
+            socket_path.unlink()
+        self.state_path = state_path
+        self.docker_root = docker_root
+        self.latency = float(os.environ.get("FAKE_DAEMON_LATENCY", "0"))
+        super().__init__(str(socket_path), _Handler)
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def state(self) -> Dict[str, Any]:
+        try:
+            with self.state_path.open("r") as state_file:
+                # Wait for fake_docker.py to finish writing
+                fcntl.flock(state_file, fcntl.LOCK_SH)
+                content = state_file.read()
+        except FileNotFoundError:
+            content = ""
+        state = json.loads(content) if content else {}
+        state.setdefault("images", {})
+        state.setdefault("containers", {})
+        return state
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeDaemon
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def address_string(self) -> str:
+        return "fake-daemon"
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        # Clients may put an API version in front of the path
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if len(parts) > 0 and parts[0].startswith("v1."):
+            parts = parts[1:]
+
+        state = self.server.state()
+        if parts == ["_ping"]:
+            self._send(200, "OK")
+        elif parts == ["info"]:
+            self._send_json(
+                {
+                    "Driver": "overlay2",
+                    "DockerRootDir": str(self.server.docker_root),
+                }
+            )
+        elif parts == ["version"]:
+            self._send_json({"Version": "24.0.5", "ApiVersion": "1.43"})
+        elif parts == ["images", "json"]:
+            self._send_json(list(state["images"].values()))
+        elif parts[:1] == ["images"] and parts[-1:] == ["json"]:
+            image = state["images"].get("/".join(parts[1:-1]))
+            self._send_json(image, 404 if image is None else 200)
+        elif parts == ["containers", "json"]:
+            self._send_json(self._containers(state, query))
+        elif parts[:1] == ["containers"] and len(parts) == 3:
+            container = state["containers"].get(parts[1])
+            if container is None:
+                self._send_json({"message": "No such container"}, 404)
+            elif parts[2] == "json":
+                self._send_json(_inspect(container))
+            elif parts[2] == "stats":
+                self._send_json(_STATS)
+            else:
+                self._send_json({"message": "Not implemented"}, 404)
+        else:
+            self._send_json({"message": "Not implemented"}, 404)
+
+    do_HEAD = do_GET
+
+    def _containers(self, state, query) -> List[dict]:
+        include_stopped = query.get("all", ["0"])[0] in ("1", "true", "True")
+        filters = json.loads(query.get("filters", ["{}"])[0])
+        labels = filters.get("label", [])
+        if isinstance(labels, dict):
+            labels = list(labels)
+
+        containers = []
+        for container in state["containers"].values():
+            if container["State"] != "running" and not include_stopped:
+                continue
+            if all(_has_label(container, label) for label in labels):
+                containers.append(container)
+        return containers
+
+    def _send_json(self, value: Any, status: int = 200) -> None:
+        self._send(status, json.dumps(value), "application/json")
+
+    def _send(
+        self, status: int, body: str, content_type: str = "text/plain"
+    ) -> None:
+        encoded = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(encoded)
+
+
+def _has_label(container: dict, label: str) -> bool:
+    key, _, value = label.partition("=")
+    if key not in container["Labels"]:
+        return False
+    return value == "" or container["Labels"][key] == value
+
+
+def _inspect(container: dict) -> dict:
+    running = container["State"] == "running"
+    return {
+        "Id": container["Id"],
+        "Name": container["Names"][0],
+        "RestartCount": 0,
+        "State": {
+            "Status": container["State"],
+            "Running": running,
+            "StartedAt": "2024-01-01T00:00:00.000000000Z",
+        },
+        "Config": {"Labels": container["Labels"], "Tty": False},
+    }
+
+
+if __name__ == "__main__":
+    # Usage: fake_daemon.py SOCKET STATE_FILE DOCKER_ROOT
+    daemon = FakeDaemon(
+        Path(sys.argv[1]), Path(sys.argv[2]), Path(sys.argv[3])
+    )
+    daemon.serve_forever()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""A stand-in for the docker and docker-compose commands, and for the system
+commands that change users and groups. The command it acts as is taken from
+the name it's run as, so the benchmark harness links it into a directory on
+the PATH under each name.
+
+Behaviour is controlled with environment variables:
+
+    FAKE_DOCKER_STATE         A JSON file holding pulled images and containers,
+                              shared with fake_daemon.py
+    FAKE_DOCKER_LATENCY       Seconds added to every command (default 0)
+    FAKE_DOCKER_PULL_SECONDS  Seconds each image takes to pull (default 0)
+    FAKE_DOCKER_SCRIPT        A JSON file of rules that override the default
+                              behaviour, like:
+                              [{"args": ["compose", "pull"], "latency": 2,
+                                "stdout": "...", "exit_code": 0}]
+                              A rule applies when its args are a prefix of the
+                              command's arguments, with Compose's --file and
+                              --env-file flags left out.
+    FAKE_DOCKER_LOG           If set, each command is appended to this file as
+                              a line of JSON
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import yaml
+
+COMPOSE_VERSION = "2.20.2"
+
+_COMPOSE_FLAGS_WITH_VALUES = ("--file", "-f", "--env-file", "--project-name")
+
+
+def main() -> int:
+    started_at = time.monotonic()
+    name = Path(sys.argv[0]).name
+    args = sys.argv[1:]
+
+    time.sleep(float(os.environ.get("FAKE_DOCKER_LATENCY", "0")))
+
+    try:
+        if name == "docker-compose":
+            exit_code = _compose(args)
+        elif name == "docker":
+            exit_code = _docker(args)
+        elif name == "id":
+            # Report membership of the groups the CLI checks for, so that it
+            # doesn't try to change them
+            print("root docker brainframe")
+            exit_code = 0
+        else:
+            # groupadd, usermod and anything else that would change the host
+            exit_code = 0
+    finally:
+        _log(name, args, time.monotonic() - started_at)
+    return exit_code
+
+
+def _docker(args: List[str]) -> int:
+    if len(args) > 0 and args[0] == "compose":
+        return _compose(args[1:])
+
+    rule = _matching_rule(args)
+    if rule is not None:
+        return _apply_rule(rule)
+
+    command = args[0] if len(args) > 0 else ""
+    if command == "pull":
+        _pull([args[-1]])
+    elif command == "version":
+        print("Docker version 24.0.5, build fake")
+    # run, exec, rm and the rest succeed without doing anything
+    return 0
+
+
+def _compose(args: List[str]) -> int:
+    files, env_file, project, rest = _split_compose_args(args)
+
+    rule = _matching_rule(["compose"] + rest)
+    if rule is not None:
+        return _apply_rule(rule)
+
+    command = rest[0] if len(rest) > 0 else ""
+    if command == "version":
+        print(COMPOSE_VERSION)
+        return 0
+    if len(files) == 0:
+        print("no configuration file provided", file=sys.stderr)
+        return 1
+
+    services = _services(files)
+    project = project or _project_name(files[0], env_file)
+    if command == "pull":
+        _pull(list(services.values()))
+    elif command in ("up", "start", "restart"):
+        _set_containers(project, services, "running")
+    elif command == "stop":
+        _set_containers(project, services, "exited")
+    elif command in ("down", "rm"):
+        _set_containers(project, services, None)
+    elif command == "config" and "--services" in rest:
+        print("\n".join(services))
+    return 0
+
+
+def _split_compose_args(
+    args: List[str],
+) -> Tuple[List[Path], Optional[Path], Optional[str], List[str]]:
+    files: List[Path] = []
+    env_file = None
+    project = None
+    rest = list(args)
+    while len(rest) > 0 and rest[0] in _COMPOSE_FLAGS_WITH_VALUES:
+        flag, value = rest[0], rest[1]
+        del rest[:2]
+        if flag in ("--file", "-f"):
+            files.append(Path(value))
+        elif flag == "--env-file":
+            env_file = Path(value)
+        else:
+            project = value
+    return files, env_file, project, rest
+
+
+def _services(files: List[Path]) -> Dict[str, str]:
+    """
+    :return: The image of each service in the Compose files
+    """
+    services: Dict[str, str] = {}
+    for path in files:
+        compose = yaml.safe_load(path.read_text()) or {}
+        for name, service in (compose.get("services") or {}).items():
+            if "image" in (service or {}):
+                services[name] = service["image"]
+    return services
+
+
+def _project_name(compose_path: Path, env_file: Optional[Path]) -> str:
+    name = os.environ.get("COMPOSE_PROJECT_NAME")
+    if not name and env_file is not None and env_file.is_file():
+        for line in env_file.read_text().splitlines():
+            if line.startswith("COMPOSE_PROJECT_NAME="):
+                name = line.split("=", 1)[1].strip()
+    return name or compose_path.absolute().parent.name
+
+
+def _pull(images: List[str]) -> None:
+    pull_seconds = float(os.environ.get("FAKE_DOCKER_PULL_SECONDS", "0"))
+    for image in images:
+        print(f"Pulling {image}")
+        time.sleep(pull_seconds)
+        with _state() as state:
+            state["images"][image] = {
+                "Id": "sha256:" + _digest(image + "-id"),
+                "RepoDigests": [
+                    f"{image.split(':')[0]}@sha256:{_digest(image)}"
+                ],
+                "Size": 512 * 1024 * 1024,
+            }
+
+
+def _set_containers(
+    project: str, services: Dict[str, str], status: Optional[str]
+) -> None:
+    with _state() as state:
+        for service, image in services.items():
+            container_id = _digest(f"{project}/{service}")
+            if status is None:
+                state["containers"].pop(container_id, None)
+                continue
+            state["containers"][container_id] = {
+                "Id": container_id,
+                "Names": [f"/{project}-{service}-1"],
+                "Image": image,
+                "State": status,
+                "Status": "Up 1 second" if status == "running" else "Exited",
+                "Labels": {
+                    "com.docker.compose.project": project,
+                    "com.docker.compose.service": service,
+                },
+            }
+
+
+@contextmanager
+def _state() -> Iterator[dict]:
+    """Loads the shared state, and saves it once the with block exits. Other
+    copies of this command wait until it's saved.
+    """
+    path = Path(os.environ["FAKE_DOCKER_STATE"])
+    with path.open("a+") as state_file:
+        fcntl.flock(state_file, fcntl.LOCK_EX)
+        state_file.seek(0)
+        content = state_file.read()
+        state = json.loads(content) if content else {}
+        state.setdefault("images", {})
+        state.setdefault("containers", {})
+        yield state
+        state_file.seek(0)
+        state_file.truncate()
+        json.dump(state, state_file)
+
+
+def _matching_rule(args: List[str]) -> Optional[dict]:
+    script_path = os.environ.get("FAKE_DOCKER_SCRIPT")
+    if not script_path:
+        return None
+    for rule in json.loads(Path(script_path).read_text()):
+        prefix = rule.get("args", [])
+        if args[: len(prefix)] == prefix:
+            return rule
+    return None
+
+
+def _apply_rule(rule: dict) -> int:
+    time.sleep(rule.get("latency", 0))
+    sys.stdout.write(rule.get("stdout", ""))
+    sys.stderr.write(rule.get("stderr", ""))
+    return int(rule.get("exit_code", 0))
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _log(name: str, args: List[str], duration: float) -> None:
+    log_path = os.environ.get("FAKE_DOCKER_LOG")
+    if log_path:
+        with open(log_path, "a") as log_file:
+            entry = {"command": name, "args": args, "duration": duration}
+            log_file.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""A stand-in for the release server at aotu.ai, which the CLI is pointed at
+with BRAINFRAME_RELEASES_URL. It serves the latest version tags and a
+docker-compose.yml for every version, and optionally a CLI binary.
+"""
+
+import hashlib
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from pathlib import Path
+from typing import Dict
+from typing import Optional
+
+_COMPOSE_TEMPLATE = """\
+services:
+  core:
+    image: aotuai/brainframe_core:{tag}
+    volumes:
+      - ${{BRAINFRAME_DATA_PATH}}:/var/lib/brainframe
+  database:
+    image: postgres:9.6.17-alpine
+    volumes:
+      - ${{BRAINFRAME_DATA_PATH}}/postgres:/var/lib/postgresql/data
+  http_proxy:
+    image: aotuai/brainframe_http_proxy:{tag}
+    ports:
+      - "80:80"
+  docs:
+    image: aotuai/brainframe_docs:{tag}
+"""
+
+
+class ReleaseServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latest_version: str,
+        cli_binary: Optional[Path] = None,
+        cli_version: str = "0.0.0",
+    ):
+        self.latest_version = latest_version
+        self.cli_version = cli_version
+        self.cli_binary = cli_binary
+        self.latency = float(os.environ.get("FAKE_RELEASES_LATENCY", "0"))
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def files(self) -> Dict[str, bytes]:
+        """
+        :return: The contents of each path that is served, other than
+            per-version docker-compose.yml files
+        """
+        files = {
+            "/releases/brainframe/latest": self.latest_version.encode(),
+            "/releases/brainframe-cli/latest": self.cli_version.encode(),
+        }
+        if self.cli_binary is not None:
+            binary = self.cli_binary.read_bytes()
+            files["/releases/brainframe-cli/brainframe"] = binary
+            files["/releases/brainframe-cli/brainframe.sha256"] = (
+                hashlib.sha256(binary).hexdigest().encode()
+            )
+        return files
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ReleaseServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+        body = self.server.files().get(self.path)
+
+        parts = self.path.strip("/").split("/")
+        if (
+            body is None
+            and len(parts) == 4
+            and parts[:2] == ["releases", "brainframe"]
+            and parts[3] == "docker-compose.yml"
+        ):
+            tag = parts[2].lstrip("v")
+            body = _COMPOSE_TEMPLATE.format(tag=tag).encode()
+
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Times the CLI's commands end to end, against stand-ins for Docker, Docker
+Compose and the release server, and keeps a history of the results.
+
+    python benchmarks/run.py [--quick] [--only NAME] [--repeat N]
+
+Commands that need root, like install and backup, are skipped when not run
+as root. They also need the "brainframe" group to exist, since the stand-ins
+don't change the host's users and groups.
+
+Each run is appended to a JSON file (benchmarks/results.json by default) and
+compared against the last run with the same settings.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+BENCHMARKS_PATH = Path(__file__).absolute().parent
+REPO_PATH = BENCHMARKS_PATH.parent
+sys.path.insert(0, str(BENCHMARKS_PATH))
+
+import trees  # noqa: E402
+from fakes.fake_daemon import FakeDaemon  # noqa: E402
+from fakes.release_server import ReleaseServer  # noqa: E402
+
+LATEST_VERSION = "v0.29.1"
+"""The version the release server reports as the latest"""
+
+_FAKE_COMMANDS = ["docker", "docker-compose", "id", "groupadd", "usermod"]
+
+_QUICK_TREES = {
+    "small": trees.TreeSpec(2000, 16 * 1024, 0, 0),
+    "large": trees.TreeSpec(0, 0, 2, 32 * 1024 * 1024),
+    "sparse": trees.TreeSpec(0, 0, 0, 0, 2, 64 * 1024 * 1024),
+}
+_FULL_TREES = {
+    "small": trees.TreeSpec(50000, 16 * 1024, 0, 0),
+    "large": trees.TreeSpec(0, 0, 4, 512 * 1024 * 1024),
+    "sparse": trees.TreeSpec(0, 0, 0, 0, 4, 1024 * 1024 * 1024),
+}
+
+
+class Workspace:
+    """The stand-ins and directories that the CLI runs against"""
+
+    def __init__(self, path: Path, cli: List[str], docker_latency: float):
+        self.path = path
+        self.cli = cli
+        path.mkdir(parents=True, exist_ok=True)
+
+        self.bin_path = path / "bin"
+        self.bin_path.mkdir(exist_ok=True)
+        fake_docker = BENCHMARKS_PATH / "fakes" / "fake_docker.py"
+        for name in _FAKE_COMMANDS:
+            link = self.bin_path / name
+            if link.is_symlink() or link.exists():
+                link.unlink()
+            link.symlink_to(fake_docker)
+
+        self.state_path = path / "docker-state.json"
+        self.state_path.write_text("")
+        docker_root = path / "docker-root"
+        docker_root.mkdir(exist_ok=True)
+        self.daemon = FakeDaemon(
+            path / "docker.sock", self.state_path, docker_root
+        )
+        self.daemon.start()
+        self.releases = ReleaseServer(LATEST_VERSION)
+        self.releases.start()
+
+        self.install_path = path / "install"
+        self.data_path = path / "data"
+        self.env = {
+            **os.environ,
+            "PATH": f"{self.bin_path}{os.pathsep}{os.environ['PATH']}",
+            "PYTHONPATH": str(REPO_PATH),
+            "DOCKER_HOST": f"unix://{path / 'docker.sock'}",
+            "BRAINFRAME_RELEASES_URL": self.releases.url,
+            "BRAINFRAME_INSTALL_PATH": str(self.install_path),
+            "BRAINFRAME_DATA_PATH": str(self.data_path),
+            "FAKE_DOCKER_STATE": str(self.state_path),
+            "FAKE_DOCKER_LATENCY": str(docker_latency),
+            "LOGNAME": os.environ.get("LOGNAME", "root"),
+            "NO_COLOR": "1",
+        }
+        self.env.pop("COMPOSE_PROJECT_NAME", None)
+
+    def run(self, args: List[str], **env: str) -> float:
+        """Runs the CLI and times it.
+
+        :return: How long it took, in seconds
+        :raises BenchmarkError: If the command fails
+        """
+        started_at = time.monotonic()
+        result = subprocess.run(
+            self.cli + args,
+            env={**self.env, **env},
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        duration = time.monotonic() - started_at
+        if result.returncode != 0:
+            output = result.stdout.decode(errors="replace")
+            raise BenchmarkError(
+                f"{' '.join(args)} exited with {result.returncode}:\n"
+                + "\n".join(output.splitlines()[-20:])
+            )
+        return duration
+
+    def install(self, install_path: Path, data_path: Path) -> float:
+        return self.run(
+            [
+                "install",
+                "--noninteractive",
+                "--install-path",
+                str(install_path),
+                "--data-path",
+                str(data_path),
+            ],
+            BRAINFRAME_INSTALL_PATH=str(install_path),
+            BRAINFRAME_DATA_PATH=str(data_path),
+        )
+
+    def close(self) -> None:
+        self.daemon.shutdown()
+        self.releases.shutdown()
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[Workspace, int], float]
+    """Runs the benchmark once, given the number of the sample, and returns
+    the time it took
+    """
+    needs_root: bool = False
+    needs: Optional[str] = None
+    """A command that must be installed for the benchmark to run"""
+
+
+def _installed(workspace: Workspace) -> None:
+    if not (workspace.install_path / "docker-compose.yml").is_file():
+        workspace.install(workspace.install_path, workspace.data_path)
+
+
+def _run_installed(args: List[str]) -> Callable[[Workspace, int], float]:
+    def run(workspace: Workspace, _sample: int) -> float:
+        _installed(workspace)
+        return workspace.run(args)
+
+    return run
+
+
+def _install(workspace: Workspace, sample: int) -> float:
+    install_path = workspace.path / "installs" / str(sample)
+    if install_path.exists():
+        shutil.rmtree(install_path)
+    return workspace.install(install_path, workspace.data_path)
+
+
+def _backup(
+    tree: str, engine: str = "rsync"
+) -> Callable[[Workspace, int], float]:
+    def run(workspace: Workspace, _sample: int) -> float:
+        _installed(workspace)
+        data_path = workspace.path / "trees" / tree
+        trees.build(data_path, workspace_trees[tree])
+        destination = workspace.path / "backup-destination"
+        if destination.exists():
+            shutil.rmtree(destination)
+        try:
+            return workspace.run(
+                [
+                    "backup",
+                    "--noninteractive",
+                    "--skip-preflight",
+                    "--engine",
+                    engine,
+                    "--destination",
+                    str(destination),
+                ],
+                BRAINFRAME_DATA_PATH=str(data_path),
+            )
+        finally:
+            shutil.rmtree(destination, ignore_errors=True)
+
+    return run
+
+
+workspace_trees: Dict[str, trees.TreeSpec] = dict(_FULL_TREES)
+
+BENCHMARKS = [
+    Benchmark("help", lambda w, _: w.run([])),
+    Benchmark("compose-startup", _run_installed(["compose", "ps"])),
+    Benchmark("info", _run_installed(["info"])),
+    Benchmark("status", _run_installed(["status"])),
+    Benchmark("install", _install, needs_root=True),
+    Benchmark(
+        "update",
+        _run_installed(["update", "--noninteractive", "--force", "--restart"]),
+        needs_root=True,
+    ),
+    Benchmark(
+        "backup-small-files", _backup("small"), needs_root=True, needs="rsync"
+    ),
+    Benchmark(
+        "backup-large-files", _backup("large"), needs_root=True, needs="rsync"
+    ),
+    Benchmark(
+        "backup-sparse-files",
+        _backup("sparse"),
+        needs_root=True,
+        needs="rsync",
+    ),
+    Benchmark(
+        "backup-small-files-native",
+        _backup("small", "native"),
+        needs_root=True,
+    ),
+    Benchmark(
+        "backup-large-files-native",
+        _backup("large", "native"),
+        needs_root=True,
+    ),
+    Benchmark(
+        "backup-sparse-files-native",
+        _backup("sparse", "native"),
+        needs_root=True,
+    ),
+]
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.quick:
+        workspace_trees.update(_QUICK_TREES)
+        args.repeat = args.repeat or 1
+    repeat = args.repeat or 5
+
+    benchmarks = [
+        b for b in BENCHMARKS if args.only is None or b.name in args.only
+    ]
+    cli = args.cli or [sys.executable, "-m", "brainframe.cli.main"]
+    workspace = Workspace(args.workdir, cli, args.docker_latency)
+
+    results: Dict[str, dict] = {}
+    try:
+        for benchmark in benchmarks:
+            skip_reason = _skip_reason(benchmark)
+            if skip_reason is not None:
+                print(f"{benchmark.name}: skipped, {skip_reason}")
+                continue
+
+            samples = []
+            try:
+                for sample in range(repeat):
+                    samples.append(benchmark.run(workspace, sample))
+            except BenchmarkError as exc:
+                print(f"{benchmark.name}: failed, {exc}")
+                results[benchmark.name] = {"error": str(exc)}
+                continue
+
+            results[benchmark.name] = {
+                "median": statistics.median(samples),
+                "min": min(samples),
+                "max": max(samples),
+                "samples": samples,
+            }
+            print(
+                f"{benchmark.name}: {statistics.median(samples):.3f}s median "
+                f"of {len(samples)}"
+            )
+    finally:
+        workspace.close()
+
+    settings = {
+        "quick": args.quick,
+        "docker_latency": args.docker_latency,
+        "cli": " ".join(args.cli) if args.cli else "source",
+        "trees": {k: v._asdict() for k, v in workspace_trees.items()},
+    }
+    entry = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _current_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "results": results,
+    }
+    history = _load_history(args.results)
+    _print_comparison(history, entry)
+    history.append(entry)
+    args.results.write_text(json.dumps(history, indent=2) + "\n")
+
+
+def _skip_reason(benchmark: Benchmark) -> Optional[str]:
+    if benchmark.needs_root and os.geteuid() != 0:
+        return "needs root"
+    if benchmark.needs_root:
+        try:
+            import grp
+
+            grp.getgrnam("brainframe")
+        except KeyError:
+            return 'needs the "brainframe" group'
+    if benchmark.needs is not None and shutil.which(benchmark.needs) is None:
+        return f"{benchmark.needs} is not installed"
+    return None
+
+
+def _print_comparison(history: List[dict], entry: dict) -> None:
+    previous = next(
+        (e for e in reversed(history) if e["settings"] == entry["settings"]),
+        None,
+    )
+    if previous is None:
+        return
+
+    print(f"\nCompared to {previous['commit']} ({previous['timestamp']}):")
+    for name, result in entry["results"].items():
+        before = previous["results"].get(name, {}).get("median")
+        after = result.get("median")
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100
+        print(f"  {name}: {before:.3f}s -> {after:.3f}s ({change:+.1f}%)")
+
+
+def _load_history(path: Path) -> List[dict]:
+    if not path.is_file():
+        return []
+    return json.loads(path.read_text())
+
+
+def _current_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=str(REPO_PATH),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _parse_args():
+    parser = ArgumentParser(description="Benchmarks the BrainFrame CLI")
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=[b.name for b in BENCHMARKS],
+        help="Only run this benchmark. May be provided multiple times.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        help="How many times to run each benchmark. Defaults to 5, or 1 with "
+        "--quick.",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Use small data trees, for checking that the benchmarks work",
+    )
+    parser.add_argument(
+        "--docker-latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every docker and docker-compose command",
+    )
+    parser.add_argument(
+        "--cli",
+        nargs="+",
+        help="The command that runs the CLI, like a frozen binary. Defaults "
+        "to running it from this repository.",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        default=Path(tempfile.gettempdir()) / "brainframe-cli-benchmarks",
+        help="Where the stand-ins and data trees are kept. Data trees are "
+        "reused between runs.",
+    )
+    parser.add_argument(
+        "--results",
+        type=Path,
+        default=BENCHMARKS_PATH / "results.json",
+        help="The JSON file that results are added to",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Builds synthetic data paths, laid out like BrainFrame's: a database
+directory, and a storage directory of many small snapshots and a few large
+recordings. Recordings can be sparse, like preallocated video files that
+haven't been filled in yet.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple
+
+_MARKER_FILE_NAME = ".benchmark-tree.json"
+_BLOCK_SIZE = 1024 * 1024
+_FILES_PER_DIRECTORY = 500
+
+
+class TreeSpec(NamedTuple):
+    small_files: int
+    small_file_size: int
+    large_files: int
+    large_file_size: int
+    sparse_files: int = 0
+    sparse_file_size: int = 0
+    """The full size of each sparse file, only a quarter of which is data"""
+
+
+def build(root: Path, spec: TreeSpec) -> None:
+    """Makes a data path that matches the spec. A tree that was already built
+    with the same spec is reused, since building a large one takes a while.
+    """
+    marker = root / _MARKER_FILE_NAME
+    if marker.is_file() and json.loads(marker.read_text()) == spec._asdict():
+        return
+    if root.exists():
+        shutil.rmtree(root)
+
+    # Random data keeps the files from being compressed or deduplicated by
+    # the filesystem, without generating random bytes for every file
+    block = os.urandom(_BLOCK_SIZE)
+
+    database = root / "postgres" / "base"
+    database.mkdir(parents=True)
+    for i in range(16):
+        _write(database / str(16384 + i), block, 256 * 1024)
+
+    snapshots = root / "storage" / "snapshots"
+    for i in range(spec.small_files):
+        directory = snapshots / f"{i // _FILES_PER_DIRECTORY:05d}"
+        if i % _FILES_PER_DIRECTORY == 0:
+            directory.mkdir(parents=True)
+        offset = (i * 4099) % (_BLOCK_SIZE - spec.small_file_size)
+        (directory / f"{i:08d}.jpg").write_bytes(
+            block[offset : offset + spec.small_file_size]
+        )
+
+    recordings = root / "storage" / "recordings"
+    recordings.mkdir(parents=True)
+    for i in range(spec.large_files):
+        _write(recordings / f"{i:03d}.mp4", block, spec.large_file_size)
+    for i in range(spec.sparse_files):
+        path = recordings / f"sparse-{i:03d}.mp4"
+        _write(path, block, spec.sparse_file_size // 4)
+        os.truncate(path, spec.sparse_file_size)
+
+    marker.write_text(json.dumps(spec._asdict()))
+
+
+def _write(path: Path, block: bytes, size: int) -> None:
+    with path.open("wb") as file_:
+        remaining = size
+        while remaining > 0:
+            file_.write(block[: min(remaining, len(block))])
+            remaining -= len(block)
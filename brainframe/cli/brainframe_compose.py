@@ -1,7 +1,10 @@
 import os
+import re
 import subprocess
 import sys
 from pathlib import Path
+from typing import Callable
+from typing import Dict
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -10,18 +13,26 @@ import i18n
 import requests
 import yaml
 
+from . import compose_override
 from . import config
+from . import docker_api
 from . import frozen_utils
+from . import install_metadata
 from . import os_utils
 from . import print_utils
+from . import tracing
 
 # The URL to the docker-compose.yml
-BRAINFRAME_DOCKER_COMPOSE_URL = "https://{subdomain}aotu.ai/releases/brainframe/{version}/docker-compose.yml"
+BRAINFRAME_DOCKER_COMPOSE_URL = (
+    "{prefix}/releases/brainframe/{version}/docker-compose.yml"
+)
 # The URL to the latest tag, which is just a file containing the latest version
 # as a string
-BRAINFRAME_LATEST_TAG_URL = (
-    "https://{subdomain}aotu.ai/releases/brainframe/latest"
-)
+BRAINFRAME_LATEST_TAG_URL = "{prefix}/releases/brainframe/latest"
+
+
+class DockerComposeNotFoundError(Exception):
+    """Raised when neither version of Docker Compose is installed"""
 
 
 def assert_installed(install_path: Path) -> None:
@@ -37,20 +48,22 @@ def assert_installed(install_path: Path) -> None:
 def get_docker_compose_command():
     try:
         # First, try to use 'docker compose'
-        compose_version = subprocess.check_output(
-            ["docker", "compose", "version", "--short"],
-            stderr=subprocess.DEVNULL,
-        )
-        return ["docker", "compose"], compose_version
-    except subprocess.CalledProcessError as e2:
-        try:
+        with tracing.span("docker compose version", "process"):
             compose_version = subprocess.check_output(
-                ["docker-compose", "version", "--short"],
+                ["docker", "compose", "version", "--short"],
                 stderr=subprocess.DEVNULL,
             )
+        return ["docker", "compose"], compose_version
+    except subprocess.CalledProcessError as e2:
+        try:
+            with tracing.span("docker-compose version", "process"):
+                compose_version = subprocess.check_output(
+                    ["docker-compose", "version", "--short"],
+                    stderr=subprocess.DEVNULL,
+                )
             return ["docker-compose"], compose_version
         except subprocess.CalledProcessError as e1:
-            message = f"Docker Compose V1: {e}; V2: {e}"
+            message = f"Docker Compose V1: {e1}; V2: {e2}"
             raise DockerComposeNotFoundError(message)
 
 
@@ -67,7 +80,7 @@ def run(install_path: Path, commands: List[str]) -> None:
     ]
 
     # Provide the override file if it exists
-    compose_override_path = install_path / "docker-compose.override.yml"
+    compose_override_path = compose_override.override_path(install_path)
     if compose_override_path.is_file():
         full_command += ["--file", str(compose_override_path)]
 
@@ -94,6 +107,195 @@ def run(install_path: Path, commands: List[str]) -> None:
         )
 
 
+def project_name(install_path: Path) -> str:
+    """Finds the Compose project name that BrainFrame's containers are labelled
+    with. This follows the same precedence as Docker Compose, without having to
+    start it.
+
+    :param install_path: The path BrainFrame is installed to
+    :return: The project name
+    """
+    name = os.environ.get("COMPOSE_PROJECT_NAME")
+
+    env_path = install_path / ".env"
+    if not name and env_path.is_file():
+        name = _read_env_file(env_path).get("COMPOSE_PROJECT_NAME")
+
+    compose_path = install_path / "docker-compose.yml"
+    if not name and compose_path.is_file():
+        # Only the top-level "name" is needed, so the whole file isn't parsed
+        with compose_path.open("r") as compose_file:
+            for line in compose_file:
+                match = _TOP_LEVEL_NAME_PATTERN.match(line)
+                if match is not None:
+                    name = match.group(1)
+                    break
+
+    if not name:
+        # Docker Compose defaults to the name of the project directory
+        name = install_path.absolute().name
+
+    return re.sub(r"[^a-z0-9_-]", "", name.lower())
+
+
+def project_containers(
+    install_path: Path, include_stopped: bool = False
+) -> List[dict]:
+    """Lists BrainFrame's containers using the Docker API.
+
+    :param install_path: The path BrainFrame is installed to
+    :param include_stopped: If True, stopped containers are listed as well
+    :return: A summary of each container, as returned by the Docker API, sorted
+        by service name
+    :raises docker_api.DockerAPIError: If the Docker daemon can't be reached
+    """
+    containers = docker_api.client().containers(
+        labels={docker_api.COMPOSE_PROJECT_LABEL: project_name(install_path)},
+        include_stopped=include_stopped,
+    )
+    return sorted(containers, key=service_name)
+
+
+def service_name(container: dict) -> str:
+    """
+    :param container: A container summary or inspection from the Docker API
+    :return: The name of the Compose service the container belongs to
+    """
+    labels = container.get("Labels") or container["Config"]["Labels"]
+    return labels.get(docker_api.COMPOSE_SERVICE_LABEL, "")
+
+
+def run_query(install_path: Path, commands: List[str]) -> bool:
+    """Answers some read-only Compose commands using the Docker API and the
+    docker-compose.yml, without starting Docker Compose. This is much faster,
+    which matters for monitoring scripts that run these commands frequently.
+
+    :param install_path: The path BrainFrame is installed to
+    :param commands: The arguments that would be passed to Docker Compose
+    :return: True if the command was answered. If False, the command isn't one
+        that can be answered this way or the Docker daemon couldn't be reached
+        directly, and the command should be run through Docker Compose instead.
+    """
+    query = _QUERIES.get(tuple(commands))
+    if query is None:
+        return False
+
+    try:
+        query(install_path)
+    except (docker_api.DockerAPIError, DockerComposeNotFoundError, OSError):
+        return False
+
+    return True
+
+
+def _ps(install_path: Path, services: bool) -> None:
+    """Answers "ps --quiet" and "ps --services" the way the installed version
+    of Docker Compose would. Version 1 lists stopped containers too, and lists
+    every service in the configuration instead of only those with containers.
+    Version 2 only lists what's running.
+    """
+    compose_v1 = _is_compose_v1()
+    if services and compose_v1:
+        _config_services(install_path)
+        return
+
+    containers = project_containers(install_path, include_stopped=compose_v1)
+    if services:
+        # Services with more than one container are listed once
+        names = [service_name(c) for c in containers]
+        for name in sorted(set(names), key=names.index):
+            print(name)
+    else:
+        for container in containers:
+            print(container["Id"])
+
+
+def _is_compose_v1() -> bool:
+    """
+    :raises DockerComposeNotFoundError: If Docker Compose isn't installed
+    """
+    _, compose_version = get_docker_compose_command()
+    major = compose_version.decode().strip().lstrip("v").split(".")[0]
+    return major == "1"
+
+
+def _images(install_path: Path, quiet: bool) -> None:
+    containers = project_containers(install_path, include_stopped=True)
+
+    if quiet:
+        image_ids = {c["ImageID"] for c in containers}
+        for image_id in sorted(image_ids):
+            print(image_id)
+        return
+
+    sizes = {
+        image["Id"]: image["Size"] for image in docker_api.client().images()
+    }
+    rows = []
+    for container in containers:
+        repository, separator, tag = container["Image"].rpartition(":")
+        if not separator or "/" in tag:
+            # There's no tag, but there may be a registry port
+            repository, tag = container["Image"], "latest"
+        image_id = container["ImageID"].split(":")[-1][:12]
+        size = sizes.get(container["ImageID"])
+        rows.append(
+            [
+                container["Names"][0].lstrip("/"),
+                repository,
+                tag,
+                image_id,
+                "" if size is None else f"{size / 1000000:.1f}MB",
+            ]
+        )
+
+    print_utils.print_table(
+        ["CONTAINER", "REPOSITORY", "TAG", "IMAGE ID", "SIZE"], rows
+    )
+
+
+def _config_services(install_path: Path) -> None:
+    services: List[str] = []
+    for name in ["docker-compose.yml", "docker-compose.override.yml"]:
+        path = install_path / name
+        if not path.is_file():
+            continue
+        compose = yaml.load(path.read_text(), Loader=yaml.SafeLoader)
+        for service in (compose or {}).get("services") or {}:
+            if service not in services:
+                services.append(service)
+
+    for service in services:
+        print(service)
+
+
+def _read_env_file(path: Path) -> Dict[str, str]:
+    values = {}
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line.startswith("#") or "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        values[key.strip()] = value.strip().strip("'\"")
+    return values
+
+
+_TOP_LEVEL_NAME_PATTERN = re.compile(r"""^name:\s*["']?([^"'\s#]+)""")
+
+_QUERIES: Dict[Tuple[str, ...], Callable[[Path], None]] = {
+    # The tables printed by "ps" differ between versions of Docker Compose,
+    # and are left to it
+    ("ps", "-q"): lambda p: _ps(p, services=False),
+    ("ps", "--quiet"): lambda p: _ps(p, services=False),
+    ("ps", "--services"): lambda p: _ps(p, services=True),
+    ("images",): lambda p: _images(p, quiet=False),
+    ("images", "-q"): lambda p: _images(p, quiet=True),
+    ("images", "--quiet"): lambda p: _images(p, quiet=True),
+    ("config", "--services"): _config_services,
+}
+"""Compose commands that can be answered without starting Docker Compose"""
+
+
 def download(target: Path, version: str = "latest") -> None:
     _assert_has_write_permissions(target.parent)
 
@@ -103,18 +305,21 @@ def download(target: Path, version: str = "latest") -> None:
     credentials = config.staging_credentials()
 
     url = BRAINFRAME_DOCKER_COMPOSE_URL.format(
-        subdomain="staging." if config.is_staging.value else "",
-        version=version,
+        prefix=config.releases_url_prefix(), version=version
     )
-    response = requests.get(url, auth=credentials, stream=True)
+    with tracing.span("download docker-compose.yml", "http", url=url) as span:
+        response = requests.get(url, auth=credentials, stream=True)
+        body = response.text
+        span.set("status", response.status_code)
     if not response.ok:
         print_utils.fail_translate(
             "general.error-downloading-docker-compose",
             status_code=response.status_code,
-            error_message=response.text,
+            error_message=body,
         )
 
-    target.write_text(response.text)
+    with tracing.span("write docker-compose.yml", "file", path=target):
+        target.write_text(body)
 
     if os_utils.is_root():
         # Fix the permissions of the docker-compose.yml so that the BrainFrame
@@ -128,21 +333,18 @@ def get_latest_version() -> str:
     """
     # Add the flags to authenticate with staging if the user wants to download
     # from there
-    subdomain = "staging." if config.is_staging.value else ""
     credentials = config.staging_credentials()
 
     # Check what the latest version is
-    url = BRAINFRAME_LATEST_TAG_URL.format(subdomain=subdomain)
-    response = requests.get(url, auth=credentials)
+    url = BRAINFRAME_LATEST_TAG_URL.format(prefix=config.releases_url_prefix())
+    with tracing.span("get latest version", "http", url=url) as span:
+        response = requests.get(url, auth=credentials)
+        span.set("status", response.status_code)
     return response.text
 
 
 def check_existing_version(install_path: Path) -> str:
-    compose_path = install_path / "docker-compose.yml"
-    compose = yaml.load(compose_path.read_text(), Loader=yaml.SafeLoader)
-    version = compose["services"]["core"]["image"].split(":")[-1]
-    version = "v" + version
-    return version
+    return install_metadata.load(install_path).server_version
 
 
 def assert_has_docker_permissions() -> None:
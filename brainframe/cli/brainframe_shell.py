@@ -1,29 +1,223 @@
 import getpass
+import hashlib
 import os
-import subprocess
-import sys
-
-import i18n
-import requests
-import yaml
+import re
+from typing import List
+from typing import Optional
 
+from . import docker_api
 from . import os_utils
 from . import print_utils
 from .brainframe_compose import assert_has_docker_permissions
 
+IMAGE_NAME = "aotuai/brainframe-cli-20.04:0.3.2"
+
+DEFAULT_TTL = 30 * 60
+"""The number of seconds a warm shell container may sit idle before it stops,
+if the shell_ttl option isn't set
+"""
+
+_CONTAINER_LABEL = "com.aotu.brainframe.shell.user"
+"""Marks warm shell containers, with the user they belong to as the value"""
+
+_WATCHDOG_INTERVAL = 15
+"""How often a warm shell container checks if it's being used, in seconds"""
 
-def run() -> None:
+_WATCHDOG_SCRIPT = """
+trap 'exit 0' TERM
+idle=0
+while [ "$idle" -lt "$1" ]; do
+  sleep "$2" &
+  wait $!
+  idle=$((idle + $2))
+  for process in /proc/[0-9]*; do
+    if [ "${process#/proc/}" != 1 ]; then
+      idle=0
+    fi
+  done
+done
+"""
+"""Runs as the warm shell container's main process, and exits once nothing
+else has run in the container for the TTL given as its first argument. Every
+shell is a "docker exec" session, which shows up as another process. Only
+shell builtins are used between sleeps, so the check itself is never mistaken
+for a session.
+"""
+
+
+def run(warm: bool = False, ttl: Optional[int] = None) -> None:
+    """Opens an interactive shell in the tools container, with the current
+    directory mounted at /host. This process is replaced by the shell.
+
+    :param warm: If True, a long-lived container for this user and directory
+        is started if there isn't one already, and the shell is attached to it.
+        Otherwise, a new container is created for this shell only.
+    :param ttl: The number of seconds a warm container may sit idle before it
+        stops. Defaults to DEFAULT_TTL.
+    """
     assert_has_docker_permissions()
 
-    image_name = "aotuai/brainframe-cli-20.04:0.3.2"
     host_user = getpass.getuser()
     host_dir = os.getcwd()
-    full_command = f"docker run -it --rm -v {host_dir}:/host -w /host -e HOST_USER={host_user} {image_name} bash"
 
-    print_utils.translate(full_command, color=print_utils.Color.GREEN)
+    if warm:
+        name = container_name(host_user, host_dir)
+        state = _container_state(name)
+        if state != "running":
+            if state is not None:
+                # A container that just timed out may still be on its way
+                # out, and keeps its name until it's gone
+                os_utils.run(
+                    ["docker", "rm", "--force", name],
+                    print_command=False,
+                    exit_on_failure=False,
+                    capture=True,
+                )
+            _start_warm_container(
+                name, host_user, host_dir, ttl or DEFAULT_TTL
+            )
+        command = [
+            "docker",
+            "exec",
+            "-it",
+            "-e",
+            f"HOST_USER={host_user}",
+            name,
+            "bash",
+        ]
+    else:
+        _announce_pull()
+        command = [
+            "docker",
+            "run",
+            "-it",
+            "--rm",
+            *_container_args(host_user, host_dir),
+            IMAGE_NAME,
+            "bash",
+        ]
+
+    print_utils.print_color(" ".join(command), print_utils.Color.GREEN)
+
+    try:
+        os.execvp(command[0], command)
+    except OSError as exc:
+        print_utils.fail_translate("shell.run-failed", error=exc)
+
+
+def stop_warm_containers() -> int:
+    """Stops the current user's warm shell containers, in every directory.
+
+    :return: The number of containers that were stopped
+    """
+    assert_has_docker_permissions()
+
+    containers = _warm_containers(getpass.getuser())
+    if len(containers) > 0:
+        os_utils.run(
+            ["docker", "rm", "--force", *[c["Id"] for c in containers]],
+            print_command=False,
+            capture=True,
+        )
+    return len(containers)
+
+
+def pull_image() -> None:
+    """Pulls the tools image ahead of time, so that opening the first shell
+    doesn't have to wait for it. Failing to pull it only prints a warning, since
+    the image will be pulled again when a shell is opened.
+    """
+    result = os_utils.run(
+        ["docker", "pull", IMAGE_NAME],
+        print_command=False,
+        exit_on_failure=False,
+        label="shell",
+    )
+    if result.returncode != 0:
+        print_utils.warning_translate("shell.pull-failed", image=IMAGE_NAME)
+
+
+def container_name(user: str, directory: str) -> str:
+    """
+    :return: The name of the warm shell container for a user and directory.
+        Container names only allow a few characters, so the directory is
+        represented by a hash.
+    """
+    user = re.sub(r"[^a-zA-Z0-9_.-]", "_", user)
+    digest = hashlib.sha256(directory.encode()).hexdigest()[:12]
+    return f"brainframe-shell-{user}-{digest}"
+
+
+def _start_warm_container(
+    name: str, host_user: str, host_dir: str, ttl: int
+) -> None:
+    _announce_pull()
+
+    command = [
+        "docker",
+        "run",
+        "--detach",
+        "--rm",
+        "--name",
+        name,
+        "--label",
+        f"{_CONTAINER_LABEL}={host_user}",
+        *_container_args(host_user, host_dir),
+        IMAGE_NAME,
+        "sh",
+        "-c",
+        _WATCHDOG_SCRIPT,
+        "watchdog",
+        str(ttl),
+        str(_WATCHDOG_INTERVAL),
+    ]
+
+    result = os_utils.run(
+        command, print_command=False, exit_on_failure=False, capture=True
+    )
+
+    # Another shell in the same directory may have started the container first
+    if result.returncode != 0 and _container_state(name) != "running":
+        print_utils.fail_translate(
+            "shell.start-failed", output="\n".join(result.output)
+        )
+
+
+def _container_args(host_user: str, host_dir: str) -> List[str]:
+    return [
+        "-v",
+        f"{host_dir}:/host",
+        "-w",
+        "/host",
+        "-e",
+        f"HOST_USER={host_user}",
+    ]
+
+
+def _container_state(name: str) -> Optional[str]:
+    """
+    :return: The status of the container, like "running" or "exited", or None
+        if it doesn't exist
+    """
+    try:
+        container = docker_api.client().inspect_container(name)
+    except docker_api.DockerAPIError as exc:
+        if exc.status == 404:
+            return None
+        print_utils.fail_translate("general.docker-api-unavailable", error=exc)
+    return container["State"]["Status"]
+
+
+def _warm_containers(user: str) -> List[dict]:
+    return docker_api.client().containers(labels={_CONTAINER_LABEL: user})
+
 
+def _announce_pull() -> None:
+    """Lets the user know why opening a shell is taking a while when the image
+    is about to be pulled
+    """
     try:
-        subprocess.run(full_command, shell=True, check=True)
-    except Exception as e:  # subprocess.CalledProcessError:
-        print(f"Error: Failed to pull or run the image. Details: {e}")
-        sys.exit(1)
+        docker_api.client().inspect_image(IMAGE_NAME)
+    except docker_api.DockerAPIError as exc:
+        if exc.status == 404:
+            print_utils.translate("shell.pulling-image", image=IMAGE_NAME)
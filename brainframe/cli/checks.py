@@ -0,0 +1,111 @@
+import time
+from threading import Event
+from threading import Lock
+from threading import Thread
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import print_utils
+
+PASSED = "passed"
+WARNING = "warning"
+FAILED = "failed"
+SKIPPED = "skipped"
+"""The check couldn't be run, like when the information isn't available on
+this machine
+"""
+
+
+class CheckResult(NamedTuple):
+    status: str
+    """One of PASSED, WARNING, FAILED or SKIPPED"""
+    value: str
+    """What was found, for display"""
+    recommended: str = ""
+    sysctl: Optional[Dict[str, str]] = None
+    """Kernel parameters that would fix the problem"""
+    daemon_config: Optional[Dict[str, Any]] = None
+    """Docker daemon.json settings that would fix the problem"""
+
+
+class Check(NamedTuple):
+    name: str
+    function: Callable[[], CheckResult]
+    timeout: Optional[float] = None
+    """How long the check may take, in seconds. Defaults to the timeout given
+    to `run`.
+    """
+
+
+def run(
+    checks: List[Check], default_timeout: float = 10
+) -> Dict[str, CheckResult]:
+    """Runs checks at the same time. Checks mostly read small files or wait on
+    the Docker daemon, so running them together takes about as long as the
+    slowest one.
+
+    Each check runs on its own daemon thread. A check that doesn't finish in
+    time fails, and its thread is left behind instead of being waited for, so
+    a hung daemon or filesystem can't hang the caller.
+
+    :param checks: The checks to run
+    :param default_timeout: How long checks without a timeout of their own may
+        take, in seconds
+    :return: The result of each check, by name, in the order they were given.
+        A check that raises an exception is reported as skipped.
+    """
+    results: Dict[str, CheckResult] = {}
+    finished = {check.name: Event() for check in checks}
+    lock = Lock()
+
+    def run_one(check: Check) -> None:
+        try:
+            result = check.function()
+        except Exception as exc:
+            result = CheckResult(SKIPPED, str(exc))
+        with lock:
+            # The check may have already been given up on
+            results.setdefault(check.name, result)
+        finished[check.name].set()
+
+    started_at = time.monotonic()
+    for check in checks:
+        Thread(target=run_one, args=(check,), daemon=True).start()
+
+    for check in checks:
+        timeout = default_timeout if check.timeout is None else check.timeout
+        remaining = started_at + timeout - time.monotonic()
+        if not finished[check.name].wait(max(remaining, 0)):
+            with lock:
+                results.setdefault(
+                    check.name,
+                    CheckResult(FAILED, f"timed out after {timeout:g}s"),
+                )
+
+    with lock:
+        return {check.name: results[check.name] for check in checks}
+
+
+def problems(results: Dict[str, CheckResult]) -> Dict[str, CheckResult]:
+    """
+    :return: The results that didn't pass or get skipped
+    """
+    return {
+        name: result
+        for name, result in results.items()
+        if result.status in [WARNING, FAILED]
+    }
+
+
+def print_results(results: Dict[str, CheckResult]) -> None:
+    print_utils.print_table(
+        ["CHECK", "STATUS", "FOUND", "RECOMMENDED"],
+        [
+            [name, result.status, result.value, result.recommended or "-"]
+            for name, result in results.items()
+        ],
+    )
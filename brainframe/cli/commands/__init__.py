@@ -1,9 +1,19 @@
 from .backup import backup
 from .compose import compose
+from .delete_trash import delete_trash
+from .doctor import doctor
+from .du import du
+from .history import history
 from .info import info
 from .install import install
+from .logs import logs
+from .permissions import permissions
 from .self_update import self_update
 from .shell import shell
+from .stats import stats
+from .status import status
+from .storage import storage
+from .tune import tune
 from .uninstall import uninstall
 from .update import update
 from .utils import by_name
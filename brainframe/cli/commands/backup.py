@@ -1,14 +1,30 @@
+import os
 import sys
+import tempfile
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from threading import Lock
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
 
 import i18n
 from brainframe.cli import brainframe_compose
 from brainframe.cli import config
+from brainframe.cli import deletion
 from brainframe.cli import dependencies
+from brainframe.cli import doctor
+from brainframe.cli import history
+from brainframe.cli import native_copy
 from brainframe.cli import os_utils
 from brainframe.cli import print_utils
+from brainframe.cli import process_utils
+from brainframe.cli import sharding
+from brainframe.cli import tiering
 
 from .utils import command
 from .utils import requires_root
@@ -16,6 +32,10 @@ from .utils import subcommand_parse_args
 
 BACKUP_DIR_FORMAT = "%Y-%m-%d_%H-%M-%S"
 
+RSYNC_ENGINE = "rsync"
+NATIVE_ENGINE = "native"
+ENGINES = [RSYNC_ENGINE, NATIVE_ENGINE]
+
 
 @command("backup")
 @requires_root  # Some BrainFrame services write files as root
@@ -27,7 +47,13 @@ def backup():
 
     brainframe_compose.assert_installed(install_path)
 
-    dependencies.rsync.ensure(args.noninteractive, args.install_rsync)
+    if not args.skip_preflight:
+        doctor.run_preflight(
+            doctor.BACKUP, install_path, data_path, args.destination
+        )
+
+    if args.engine == RSYNC_ENGINE:
+        dependencies.rsync.ensure(args.noninteractive, args.install_rsync)
 
     if not args.noninteractive:
         stop_brainframe = print_utils.ask_yes_no("backup.ask-stop-brainframe")
@@ -36,7 +62,18 @@ def backup():
             # doesn't want that, stop the backup
             sys.exit(1)
 
-    brainframe_compose.run(install_path, ["stop"])
+    with history.record("backup", install_path) as run:
+        _backup(args, install_path, data_path, run)
+
+    print()
+    print_utils.translate("backup.complete", color=print_utils.Color.GREEN)
+
+
+def _backup(
+    args, install_path: Path, data_path: Path, run: history.Run
+) -> None:
+    with run.phase("stop"):
+        brainframe_compose.run(install_path, ["stop"])
 
     if args.destination is None:
         now_str = datetime.now().strftime(BACKUP_DIR_FORMAT)
@@ -49,26 +86,286 @@ def backup():
     except PermissionError:
         print_utils.fail_translate("backup.mkdir-permission-denied")
 
-    os_utils.run(
-        [
+    # Files moved to the cold path by "brainframe storage tier" are copied
+    # from there, instead of as links that would stop working once the files
+    # are recalled
+    cold_files = tiering.cold_links(tiering.index_path(install_path))
+    rsync_args: List[str] = []
+    if len(cold_files) > 0:
+        print_utils.translate(
+            "backup.copying-cold-files", count=len(cold_files)
+        )
+        # The links are absolute, which rsync treats as unsafe
+        rsync_args.append("--copy-unsafe-links")
+
+    shards = args.shards or sharding.auto_count([data_path, backup_path])
+    if args.engine == NATIVE_ENGINE:
+        plan = _plan(data_path, backup_path, shards, run)
+        _native_copy(data_path, backup_path, plan, cold_files, run)
+        _check_scan(plan)
+    elif shards > 1:
+        plan = _plan(data_path, backup_path, shards, run)
+        _sharded_rsync(data_path, backup_path, plan, rsync_args, run)
+        _check_scan(plan)
+    else:
+        with run.phase("rsync"):
+            os_utils.run(
+                [
+                    "rsync",
+                    "--archive",
+                    "--sparse",
+                    "--verbose",
+                    "--progress",
+                    *rsync_args,
+                    # Avoid backing up backups
+                    "--exclude",
+                    "backups",
+                    str(data_path),
+                    str(backup_path),
+                ]
+            )
+
+    # Give the brainframe group access to the resulting backup, to make
+    # managing and restoring it easier. This looks at every file in the
+    # backup anyway, so it's also where the backup's size comes from.
+    with run.phase("permissions"):
+        report = os_utils.give_brainframe_group_rw_access([backup_path])
+    run.bytes = report.bytes
+    run.files = report.files
+
+    if args.keep is not None:
+        with run.phase("prune"):
+            _prune_backups(data_path / "backups", args.keep, args.wait)
+
+
+def _plan(
+    data_path: Path, backup_path: Path, shards: int, run: history.Run
+) -> sharding.ShardPlan:
+    with run.phase("plan"):
+        plan = sharding.plan(
+            data_path.absolute(),
+            shards,
+            # Avoid backing up backups
+            exclude_names=["backups"],
+            exclude=[backup_path.absolute()],
+        )
+    for error in plan.errors:
+        print_utils.warning_translate("backup.scan-error", error=str(error))
+    print_utils.translate(
+        "backup.sharded",
+        files=plan.files,
+        size=print_utils.format_bytes(plan.bytes),
+        shards=len(plan.shards),
+    )
+    return plan
+
+
+def _check_scan(plan: sharding.ShardPlan) -> None:
+    """Fails the backup if parts of the data path couldn't be read, once
+    everything that could be read has been copied, like rsync does
+    """
+    if len(plan.errors) > 0:
+        print_utils.fail_translate(
+            "backup.scan-failed", count=len(plan.errors)
+        )
+
+
+def _sharded_rsync(
+    data_path: Path,
+    backup_path: Path,
+    plan: sharding.ShardPlan,
+    rsync_args: List[str],
+    run: history.Run,
+) -> None:
+    """Copies the data path with several rsync processes at once, each given
+    its own share of the files. This is much faster than a single rsync on
+    fast storage, where one rsync spends most of its time waiting on the
+    filesystem for each file in turn.
+
+    The result is the same as the single rsync: the data path is copied into a
+    directory of the same name in the backup path, without any backups.
+    """
+    data_path = data_path.absolute()
+    backup_path = backup_path.absolute()
+
+    # Paths are given to rsync relative to the data path's parent, so that
+    # the data path's own directory is made in the backup path
+    source = data_path.parent
+
+    def rsync(files_from: Path, *extra_args: str) -> List[str]:
+        return [
             "rsync",
             "--archive",
-            "--verbose",
-            "--progress",
-            # Avoid backing up backups
-            "--exclude",
-            "backups",
-            str(data_path),
+            "--sparse",
+            "--from0",
+            f"--files-from={files_from}",
+            *rsync_args,
+            *extra_args,
+            str(source),
             str(backup_path),
         ]
+
+    with tempfile.TemporaryDirectory(prefix="brainframe-backup-") as lists:
+        progress = sharding.Progress(plan.files, plan.bytes)
+        group = process_utils.ProcessGroup(
+            max_workers=len(plan.shards), print_output=False
+        )
+        for i, shard in enumerate(plan.shards):
+            files_from = Path(lists) / f"shard-{i}"
+            _write_file_list(files_from, data_path.name, shard.paths)
+            group.add(
+                f"shard {i + 1}",
+                rsync(files_from, "--out-format=%l %n"),
+                on_line=progress.rsync_line,
+            )
+
+        progress.start()
+        try:
+            with run.phase("rsync"):
+                group.run(print_commands=False)
+        finally:
+            progress.finish()
+        progress.print()
+
+        # Directories are copied last, so that the files being copied into
+        # them don't change their modification times afterwards
+        files_from = Path(lists) / "directories"
+        _write_file_list(files_from, data_path.name, plan.directories)
+        with run.phase("directories"):
+            os_utils.run(rsync(files_from), print_command=False, capture=True)
+
+
+def _native_copy(
+    data_path: Path,
+    backup_path: Path,
+    plan: sharding.ShardPlan,
+    cold_files: Dict[str, tiering.TierFile],
+    run: history.Run,
+) -> None:
+    """Copies the data path within this process, with a thread for each shard.
+    Files are copied with native_copy, which keeps sparse files sparse and
+    shares data with the original where the filesystem supports it. Links to
+    files in the cold path are replaced with copies of those files.
+
+    The result is the same as with rsync: the data path is copied into a
+    directory of the same name in the backup path, without any backups.
+    """
+    source = data_path.absolute()
+    destination = backup_path.absolute() / source.name
+
+    # Directories are sorted, so each one is made after its parent
+    for directory in plan.directories:
+        (destination / directory).mkdir(exist_ok=True)
+
+    progress = sharding.Progress(plan.files, plan.bytes)
+    errors: List[str] = []
+    written = 0
+    lock = Lock()
+
+    def copy_shard(shard: sharding.Shard) -> None:
+        nonlocal written
+        for relative in shard.paths:
+            try:
+                source_file = str(source / relative)
+                source_stat = os.lstat(source_file)
+                cold_file = cold_files.get(relative)
+                if cold_file is not None and not tiering.is_orphaned(
+                    source, cold_file
+                ):
+                    source_file = str(cold_file.cold_path)
+                    source_stat = os.lstat(source_file)
+                copied = native_copy.copy_file(
+                    source_file, str(destination / relative), source_stat
+                )
+            except OSError as exc:
+                with lock:
+                    errors.append(f"{relative}: {exc}")
+                continue
+            progress.add(1, source_stat.st_size)
+            with lock:
+                written += copied
+
+    progress.start()
+    try:
+        with run.phase("copy"):
+            with ThreadPoolExecutor(max_workers=len(plan.shards)) as executor:
+                # Consume the results so that unexpected errors are raised
+                list(executor.map(copy_shard, plan.shards))
+    finally:
+        progress.finish()
+    progress.print()
+
+    # Directories are given their times last, so that the files being copied
+    # into them don't change their modification times afterwards
+    with run.phase("directories"):
+        for directory in plan.directories:
+            try:
+                native_copy.copy_metadata(
+                    str(destination / directory),
+                    os.lstat(source / directory),
+                )
+            except OSError as exc:
+                errors.append(f"{directory}: {exc}")
+
+    print_utils.translate(
+        "backup.native-written",
+        written=print_utils.format_bytes(written),
+        size=print_utils.format_bytes(plan.bytes),
     )
+    if len(errors) > 0:
+        for error in errors:
+            print_utils.print_color(
+                error, print_utils.Color.RED, file=sys.stderr
+            )
+        print_utils.fail_translate("backup.copy-failed", count=len(errors))
 
-    # Give the brainframe group access to the resulting backup, to make
-    # managing and restoring it easier
-    os_utils.give_brainframe_group_rw_access([backup_path])
 
-    print()
-    print_utils.translate("backup.complete", color=print_utils.Color.GREEN)
+def _write_file_list(path: Path, prefix: str, paths: Iterable[str]) -> None:
+    """Writes a list of paths for rsync's --files-from and --from0 options.
+    Paths are separated by null characters, since file names can contain
+    newlines.
+    """
+    with path.open("wb") as file_list:
+        for relative in paths:
+            file_list.write(
+                os.fsencode(os.path.normpath(os.path.join(prefix, relative)))
+            )
+            file_list.write(b"\0")
+
+
+def _prune_backups(backups_path: Path, keep: int, wait: bool) -> None:
+    """Deletes all but the newest backups made to the default backup directory.
+
+    :param backups_path: The directory that backups are made to by default
+    :param keep: The number of backups to keep
+    :param wait: If True, old backups are deleted before this function returns
+        instead of in the background
+    """
+    if not backups_path.is_dir():
+        # Backups have only ever been made to other destinations
+        return
+
+    backups = []
+    for path in backups_path.iterdir():
+        try:
+            created_at = datetime.strptime(path.name, BACKUP_DIR_FORMAT)
+        except ValueError:
+            # Not a backup, or not one that was made by this command
+            continue
+        if path.is_dir():
+            backups.append((created_at, path))
+
+    backups.sort(reverse=True)
+    to_delete = [path for _, path in backups[keep:]]
+    if len(to_delete) == 0:
+        return
+
+    print_utils.translate(
+        "backup.pruning",
+        count=len(to_delete),
+        backups=", ".join(p.name for p in to_delete),
+    )
+    deletion.delete(to_delete, wait=wait)
 
 
 def _parse_args(data_path: Path):
@@ -96,4 +393,67 @@ def _parse_args(data_path: Path):
         help=i18n.t("backup.install-rsync-help"),
     )
 
+    parser.add_argument(
+        "--keep",
+        type=_keep_count,
+        help=i18n.t("backup.keep-help", backup_dir=data_path / "backups"),
+    )
+
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help=i18n.t("general.wait-for-deletion-help"),
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=RSYNC_ENGINE,
+        help=i18n.t("backup.engine-help"),
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=_shard_count,
+        default=None,
+        metavar="N|auto",
+        help=i18n.t(
+            "backup.shards-help",
+            unknown_shards=sharding.UNKNOWN_DEVICE_SHARDS,
+            max_shards=sharding.MAX_AUTO_SHARDS,
+        ),
+    )
+
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help=i18n.t("general.skip-preflight-help"),
+    )
+
     return subcommand_parse_args(parser)
+
+
+def _keep_count(value: str) -> int:
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise ArgumentTypeError(i18n.t("backup.invalid-keep", value=value))
+    return count
+
+
+def _shard_count(value: str) -> Optional[int]:
+    """
+    :return: The number of shards, or None if it should be picked
+        automatically
+    """
+    if value == "auto":
+        return None
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise ArgumentTypeError(i18n.t("backup.invalid-shards", value=value))
+    return count
@@ -10,4 +10,6 @@ from .utils import command
 def compose():
     install_path = config.install_path.value
     brainframe_compose.assert_installed(install_path)
-    brainframe_compose.run(install_path, sys.argv[2:])
+
+    if not brainframe_compose.run_query(install_path, sys.argv[2:]):
+        brainframe_compose.run(install_path, sys.argv[2:])
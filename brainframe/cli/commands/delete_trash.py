@@ -0,0 +1,63 @@
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+import i18n
+from brainframe.cli import deletion
+from brainframe.cli import os_utils
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("delete-trash")
+def delete_trash():
+    """Deletes trees that were moved to the trash by other commands. This is
+    normally started in the background by those commands, and isn't listed in
+    the help text.
+    """
+    args = _parse_args()
+
+    for path in args.paths:
+        if not deletion.is_trash(path):
+            print_utils.fail_translate("delete-trash.not-trash", path=path)
+
+    os_utils.lower_io_priority()
+
+    # Output is usually appended to a log shared by every deletion that runs
+    # in the background
+    print_utils.translate(
+        "delete-trash.started",
+        time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        paths=", ".join(str(p) for p in args.paths),
+    )
+    failed = []
+    for path in args.paths:
+        try:
+            deletion.delete_tree(path)
+        except OSError as exc:
+            print_utils.print_color(
+                f"{path}: {exc}", print_utils.Color.RED, file=sys.stderr
+            )
+            failed.append(path)
+
+    if len(failed) > 0:
+        print_utils.fail_translate(
+            "delete-trash.failed", paths=", ".join(str(p) for p in failed)
+        )
+    print_utils.translate("delete-trash.complete")
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("delete-trash.description"),
+        usage=i18n.t("delete-trash.usage"),
+    )
+
+    parser.add_argument(
+        "paths", type=Path, nargs="+", help=i18n.t("delete-trash.paths-help")
+    )
+
+    return subcommand_parse_args(parser)
@@ -0,0 +1,46 @@
+from argparse import ArgumentParser
+
+import i18n
+from brainframe.cli import checks
+from brainframe.cli import config
+from brainframe.cli import doctor as preflight
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("doctor")
+def doctor():
+    args = _parse_args()
+
+    results = checks.run(
+        preflight.preflight_checks(
+            args.operation,
+            config.install_path.value,
+            config.data_path.value,
+        )
+    )
+    checks.print_results(results)
+
+    failed = [n for n, r in results.items() if r.status == checks.FAILED]
+    if len(failed) > 0:
+        print()
+        print_utils.fail_translate(
+            "doctor.checks-failed", checks=", ".join(failed)
+        )
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("doctor.description"),
+        usage=i18n.t("doctor.usage"),
+    )
+
+    parser.add_argument(
+        "--operation",
+        choices=preflight.OPERATIONS,
+        help=i18n.t("doctor.operation-help"),
+    )
+
+    return subcommand_parse_args(parser)
@@ -0,0 +1,113 @@
+import json
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import i18n
+from brainframe.cli import config
+from brainframe.cli import disk_usage
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("du")
+def du():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+    data_path = config.data_path.value
+    if not data_path.is_dir():
+        print_utils.fail_translate("du.no-data-path", path=data_path)
+
+    index = None
+    if install_path.is_dir():
+        index = disk_usage.index_path(install_path)
+
+    started_at = time.monotonic()
+    report = disk_usage.scan(
+        data_path, index, workers=args.workers, full=args.full
+    )
+    duration = time.monotonic() - started_at
+
+    if args.json:
+        output = report._asdict()
+        output["groups"] = [g._asdict() for g in report.groups]
+        output["errors"] = [str(e) for e in report.errors]
+        output["duration"] = duration
+        print(json.dumps(output, indent=2))
+        return
+
+    def size(group_bytes: int, group_apparent_bytes: int) -> str:
+        return print_utils.format_bytes(
+            group_apparent_bytes if args.apparent_size else group_bytes
+        )
+
+    groups = sorted(
+        report.groups,
+        key=lambda g: g.apparent_bytes if args.apparent_size else g.bytes,
+        reverse=True,
+    )
+    print_utils.print_table(
+        ["DIRECTORY", "SIZE", "EXCLUSIVE", "FILES"],
+        [
+            [
+                g.name,
+                size(g.bytes, g.apparent_bytes),
+                size(g.exclusive_bytes, g.exclusive_apparent_bytes),
+                g.files,
+            ]
+            for g in groups
+        ]
+        + [
+            [
+                i18n.t("du.total"),
+                size(report.bytes, report.apparent_bytes),
+                "-",
+                report.files,
+            ]
+        ],
+    )
+
+    print()
+    print_utils.translate(
+        "du.scanned",
+        path=data_path,
+        scanned=report.scanned,
+        cached=report.cached,
+        duration=f"{duration:.1f}",
+    )
+    if len(report.errors) > 0:
+        for error in report.errors:
+            print_utils.print_color(
+                str(error), print_utils.Color.RED, file=sys.stderr
+            )
+        print_utils.warning_translate(
+            "du.incomplete", count=len(report.errors)
+        )
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("du.description"), usage=i18n.t("du.usage")
+    )
+
+    parser.add_argument(
+        "--apparent-size",
+        action="store_true",
+        help=i18n.t("du.apparent-size-help"),
+    )
+
+    parser.add_argument(
+        "--full", action="store_true", help=i18n.t("du.full-help")
+    )
+
+    parser.add_argument("--workers", type=int, help=i18n.t("du.workers-help"))
+
+    parser.add_argument(
+        "--json", action="store_true", help=i18n.t("du.json-help")
+    )
+
+    return subcommand_parse_args(parser)
@@ -0,0 +1,134 @@
+import json
+from argparse import ArgumentParser
+from datetime import datetime
+
+import i18n
+from brainframe.cli import config
+from brainframe.cli import history as run_history
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("history")
+def history():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+
+    runs = run_history.load(install_path, args.operation)
+    regressions = run_history.find_regressions(
+        runs, args.window, args.threshold / 100
+    )
+    runs = runs[-args.limit :]
+
+    if args.format == "json":
+        output = []
+        for run in runs:
+            entry = run._asdict()
+            entry["phases"] = [p._asdict() for p in run.phases]
+            entry["throughput"] = run.throughput
+            entry["regression"] = regressions.get(run.id)
+            output.append(entry)
+        print(json.dumps(output, indent=2))
+        return
+
+    if len(runs) == 0:
+        print_utils.translate("history.no-runs")
+        return
+
+    rows = []
+    for run in runs:
+        regression = regressions.get(run.id)
+        rows.append(
+            [
+                run.id,
+                run.operation,
+                datetime.fromtimestamp(run.started_at).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+                print_utils.format_duration(run.busy_time),
+                run.exit_code,
+                "-" if run.files is None else run.files,
+                (
+                    "-"
+                    if run.bytes is None
+                    else print_utils.format_bytes(run.bytes)
+                ),
+                (
+                    "-"
+                    if run.throughput is None
+                    else print_utils.format_bytes(int(run.throughput)) + "/s"
+                ),
+                (
+                    ""
+                    if regression is None
+                    else i18n.t(
+                        "history.regression", percent=f"{regression:.0%}"
+                    )
+                ),
+            ]
+        )
+
+    print_utils.print_table(
+        [
+            "ID",
+            "OPERATION",
+            "STARTED",
+            "DURATION",
+            "EXIT",
+            "FILES",
+            "SIZE",
+            "THROUGHPUT",
+            "",
+        ],
+        rows,
+    )
+
+    flagged = sum(1 for run in runs if run.id in regressions)
+    if flagged > 0:
+        print()
+        print_utils.warning_translate(
+            "history.regressions-found",
+            count=flagged,
+            threshold=args.threshold,
+            window=args.window,
+        )
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("history.description"),
+        usage=i18n.t("history.usage"),
+    )
+
+    parser.add_argument(
+        "--operation",
+        choices=["backup", "install", "update", "self-update"],
+        help=i18n.t("history.operation-help"),
+    )
+
+    parser.add_argument(
+        "--limit", type=int, default=20, help=i18n.t("history.limit-help")
+    )
+
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=25,
+        help=i18n.t("history.threshold-help"),
+    )
+
+    parser.add_argument(
+        "--window", type=int, default=5, help=i18n.t("history.window-help")
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=["table", "json"],
+        default="table",
+        help=i18n.t("history.format-help"),
+    )
+
+    return subcommand_parse_args(parser)
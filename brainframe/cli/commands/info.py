@@ -1,8 +1,12 @@
+import json
 from argparse import ArgumentParser
+from datetime import datetime
+from typing import Optional
 
 import i18n
 from brainframe.cli import brainframe_compose
 from brainframe.cli import config
+from brainframe.cli import install_metadata
 from brainframe.cli import print_utils
 
 from .utils import command
@@ -13,27 +17,58 @@ from .utils import subcommand_parse_args
 def info():
     args = _parse_args()
 
-    brainframe_compose.assert_installed(config.install_path.value)
+    install_path = config.install_path.value
+    brainframe_compose.assert_installed(install_path)
 
-    server_version = brainframe_compose.check_existing_version(
-        config.install_path.value
-    )
+    metadata = install_metadata.load(install_path)
 
     fields = {
-        "install_path": config.install_path.value,
-        "data_path": config.data_path.value,
-        "server_version": server_version,
+        "install_path": str(install_path),
+        "data_path": str(config.data_path.value),
+        "server_version": metadata.server_version,
+        "installed_at": _format_time(metadata.installed_at),
+        "updated_at": _format_time(metadata.updated_at),
+        "compose_sha256": metadata.compose_sha256,
+        "services": {
+            name: service._asdict()
+            for name, service in metadata.services.items()
+        },
     }
 
-    if args.field is None:
-        # Print all fields
-        for name, value in fields.items():
-            print(f"{name}: {value}")
-    elif args.field in fields:
-        # Print just this field's value
-        print(fields[args.field])
-    else:
-        print_utils.fail_translate("info.no-such-field", field=args.field)
+    if args.field is not None:
+        if args.field not in fields:
+            print_utils.fail_translate("info.no-such-field", field=args.field)
+        fields = {args.field: fields[args.field]}
+
+    if args.json:
+        output = fields if args.field is None else fields[args.field]
+        print(json.dumps(output, indent=2))
+        return
+
+    for name, value in fields.items():
+        if name == "services":
+            _print_services(value, with_name=args.field is None)
+        elif args.field is None:
+            print(f"{name}: {value or '-'}")
+        else:
+            # Print just this field's value
+            print(value or "")
+
+
+def _print_services(services: dict, with_name: bool) -> None:
+    indent = ""
+    if with_name:
+        print("services:")
+        indent = "  "
+    for name, service in services.items():
+        digest = service["digest"] or i18n.t("info.not-pulled")
+        print(f"{indent}{name}: {service['image']} ({digest})")
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat()
 
 
 def _parse_args():
@@ -44,5 +79,8 @@ def _parse_args():
     parser.add_argument(
         "field", default=None, nargs="?", help=i18n.t("info.field-help")
     )
+    parser.add_argument(
+        "--json", action="store_true", help=i18n.t("info.json-help")
+    )
 
     return subcommand_parse_args(parser)
@@ -1,14 +1,20 @@
 import shutil
+import time
 from argparse import ArgumentParser
 from pathlib import Path
 
 import i18n
 from brainframe.cli import brainframe_compose
+from brainframe.cli import brainframe_shell
 from brainframe.cli import config
 from brainframe.cli import dependencies
+from brainframe.cli import doctor
 from brainframe.cli import frozen_utils
+from brainframe.cli import history
+from brainframe.cli import install_metadata
 from brainframe.cli import os_utils
 from brainframe.cli import print_utils
+from brainframe.cli import scheduler
 
 from .utils import command
 from .utils import requires_root
@@ -38,20 +44,15 @@ def install():
             dependency="docker-compose",
         )
 
-    download_version = brainframe_compose.get_latest_version()
-    print_utils.translate("install.install-version", version=download_version)
-
+    add_to_docker_group = False
     if not os_utils.added_to_group("docker"):
         if args.noninteractive:
-            add_to_group = args.add_to_docker_group
+            add_to_docker_group = args.add_to_docker_group
         else:
-            add_to_group = print_utils.ask_yes_no(
+            add_to_docker_group = print_utils.ask_yes_no(
                 "install.ask-add-to-docker-group"
             )
 
-        if add_to_group:
-            os_utils.add_to_group("docker")
-
     use_default_paths = False
     if not args.noninteractive:
         # Ask the user if they want to specify special paths for installation
@@ -74,7 +75,6 @@ def install():
             "install.ask-brainframe-install-path",
             config.install_path.default,
         )
-    install_path.mkdir(exist_ok=True, parents=True)
 
     # Set up the data path
     if args.noninteractive:
@@ -85,29 +85,93 @@ def install():
         data_path = print_utils.ask_path(
             "install.ask-data-path", config.data_path.default
         )
-    data_path.mkdir(exist_ok=True, parents=True)
 
-    # Set up permissions with the 'brainframe' group
-    print_utils.translate("install.create-group-justification")
-    os_utils.create_group("brainframe", os_utils.BRAINFRAME_GROUP_ID)
-    os_utils.give_brainframe_group_rw_access([data_path, install_path])
+    # Check everything else the install needs before anything is changed.
+    # Docker itself is taken care of above.
+    if not args.skip_preflight:
+        doctor.run_preflight(doctor.INSTALL, install_path, data_path)
+        print()
 
     # Optionally add the user to the "brainframe" group
+    add_to_brainframe_group = False
     if not os_utils.added_to_group("brainframe"):
         if args.noninteractive:
-            add_to_group = args.add_to_group
+            add_to_brainframe_group = args.add_to_group
         else:
-            add_to_group = print_utils.ask_yes_no("install.ask-add-to-group")
+            add_to_brainframe_group = print_utils.ask_yes_no(
+                "install.ask-add-to-group"
+            )
 
-        if add_to_group:
-            os_utils.add_to_group("brainframe")
+    print_utils.translate("install.create-group-justification")
+
+    # Every question has been answered, so the remaining steps can run
+    # unattended. Steps that don't depend on each other run at the same time,
+    # so the image pull starts as soon as the docker-compose.yml is available.
+    steps = scheduler.StepScheduler()
 
-    brainframe_compose.download(
-        install_path / "docker-compose.yml", version=args.version
+    def resolve_version() -> str:
+        if args.version == "latest":
+            version = brainframe_compose.get_latest_version()
+        else:
+            version = args.version
+        print_utils.translate("install.install-version", version=version)
+        return version
+
+    def make_directories() -> None:
+        install_path.mkdir(exist_ok=True, parents=True)
+        data_path.mkdir(exist_ok=True, parents=True)
+
+    def download_compose() -> None:
+        brainframe_compose.download(
+            install_path / "docker-compose.yml",
+            version=steps.results["version"],
+        )
+
+    def pull_images() -> None:
+        print_utils.translate("install.downloading-images")
+        brainframe_compose.run(install_path, ["pull"])
+
+    steps.add("version", resolve_version)
+    steps.add("directories", make_directories)
+    steps.add(
+        "brainframe-group",
+        lambda: os_utils.create_group(
+            "brainframe", os_utils.BRAINFRAME_GROUP_ID
+        ),
+    )
+    steps.add(
+        "permissions",
+        lambda: os_utils.give_brainframe_group_rw_access(
+            [data_path, install_path]
+        ),
+        depends_on=["directories", "brainframe-group"],
+    )
+    if add_to_docker_group:
+        steps.add("docker-membership", lambda: os_utils.add_to_group("docker"))
+    if add_to_brainframe_group:
+        steps.add(
+            "brainframe-membership",
+            lambda: os_utils.add_to_group("brainframe"),
+            depends_on=["brainframe-group"],
+        )
+    steps.add(
+        "download",
+        download_compose,
+        depends_on=["version", "directories", "brainframe-group"],
+    )
+    steps.add("pull", pull_images, depends_on=["download"])
+    steps.add("pull-shell", brainframe_shell.pull_image)
+    # Image digests are only known once the images are pulled
+    steps.add(
+        "metadata",
+        lambda: install_metadata.write(install_path, installed_at=time.time()),
+        depends_on=["pull"],
     )
 
-    print_utils.translate("install.downloading-images")
-    brainframe_compose.run(install_path, ["pull"])
+    with history.record("install", install_path) as run:
+        run.include_steps(steps)
+        steps.run()
+    steps.print_timing_report()
 
     print()
     print_utils.translate("install.complete", print_utils.Color.GREEN)
@@ -178,5 +242,10 @@ def _parse_args():
         default="latest",
         help=i18n.t("install.version-help"),
     )
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help=i18n.t("general.skip-preflight-help"),
+    )
 
     return subcommand_parse_args(parser)
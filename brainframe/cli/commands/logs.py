@@ -0,0 +1,221 @@
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from pathlib import Path
+from typing import Dict
+from typing import List
+
+import i18n
+from brainframe.cli import brainframe_compose
+from brainframe.cli import config
+from brainframe.cli import container_logs
+from brainframe.cli import docker_api
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+_OUTPUT_BUFFER_SIZE = 1024 * 1024
+"""The size of the buffer that output is written through. Output is flushed
+whenever there's nothing new to write, so a large buffer doesn't delay lines
+while following.
+"""
+
+_HOLDBACK = 0.25
+"""How long new lines are held for while following, so that lines from
+different services can be put in order
+"""
+
+_SAVE_MAX_BYTES = 64 * 1024 * 1024
+"""The number of uncompressed bytes saved to each log file before rotating"""
+
+_SAVE_KEEP = 10
+"""The number of rotated log files to keep for each service"""
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+@command("logs")
+def logs():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+    brainframe_compose.assert_installed(install_path)
+
+    try:
+        sources = _sources(install_path, args.services)
+    except docker_api.DockerAPIError as exc:
+        print_utils.fail_translate(
+            "general.docker-api-unavailable", error=str(exc)
+        )
+
+    level = None
+    if args.level is not None:
+        level = re.compile(args.level.encode())
+
+    width = max((len(s.service) for s in sources), default=0)
+    prefixes = {
+        s.service: f"{s.service:<{width}} | ".encode() for s in sources
+    }
+    saved_logs_path = config.data_path.value / "logs"
+    writers: Dict[str, container_logs.RotatingGzipWriter] = {}
+    output = open(
+        sys.stdout.fileno(), "wb", buffering=_OUTPUT_BUFFER_SIZE, closefd=False
+    )
+
+    def write(line: container_logs.LogLine) -> None:
+        output.write(prefixes[line.service])
+        if args.timestamps:
+            output.write(line.timestamp + b" ")
+        output.write(line.message)
+
+        if args.save:
+            writer = writers.get(line.service)
+            if writer is None:
+                writer = container_logs.RotatingGzipWriter(
+                    saved_logs_path / line.service,
+                    line.service,
+                    max_bytes=_SAVE_MAX_BYTES,
+                    keep=_SAVE_KEEP,
+                )
+                writers[line.service] = writer
+            writer.write(line.timestamp + b" " + line.message)
+
+    # Existing logs are merged first. When following, anything logged after
+    # that is picked up by following each container from where the history
+    # ended.
+    follow = args.follow and args.until is None
+    history_end = args.until
+    if follow:
+        history_end = time.time()
+
+    history_params = {"tail": args.tail}
+    if args.since is not None:
+        history_params["since"] = args.since
+    if history_end is not None:
+        history_params["until"] = history_end
+
+    try:
+        for line in container_logs.merge_history(
+            sources, level, **history_params
+        ):
+            write(line)
+        output.flush()
+
+        if follow:
+            for live_line in container_logs.merge_live(
+                sources, _HOLDBACK, level, since=history_end
+            ):
+                if live_line is None:
+                    output.flush()
+                else:
+                    write(live_line)
+            output.flush()
+    except BrokenPipeError:
+        # The output was closed early, like when piping into head
+        pass
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+def _sources(
+    install_path: Path, services: List[str]
+) -> List[container_logs.LogSource]:
+    """Finds the containers to read logs from"""
+    client = docker_api.client()
+    containers = brainframe_compose.project_containers(
+        install_path, include_stopped=True
+    )
+    by_service = {brainframe_compose.service_name(c): c for c in containers}
+
+    for service in services:
+        if service not in by_service:
+            print_utils.fail_translate(
+                "logs.unknown-service",
+                service=service,
+                services=", ".join(sorted(by_service)),
+            )
+
+    sources = []
+    for service, container in sorted(by_service.items()):
+        if len(services) > 0 and service not in services:
+            continue
+        inspection = client.inspect_container(container["Id"])
+        sources.append(
+            container_logs.LogSource(
+                service=service,
+                container_id=container["Id"],
+                tty=inspection["Config"].get("Tty", False),
+            )
+        )
+
+    return sources
+
+
+def _parse_time(value: str) -> float:
+    """Parses a time for --since and --until. Times may be durations before
+    now, like "10m", Unix timestamps, or RFC 3339 timestamps.
+
+    :return: The time as a Unix timestamp
+    """
+    unit = _DURATION_UNITS.get(value[-1:])
+    if unit is not None:
+        try:
+            return time.time() - float(value[:-1]) * unit
+        except ValueError:
+            pass
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        return docker_api.parse_timestamp(value).timestamp()
+    except ValueError:
+        raise ArgumentTypeError(i18n.t("logs.invalid-time", value=value))
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("logs.description"), usage=i18n.t("logs.usage")
+    )
+
+    parser.add_argument(
+        "services", nargs="*", help=i18n.t("logs.services-help")
+    )
+
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help=i18n.t("logs.follow-help"),
+    )
+
+    parser.add_argument(
+        "--since", type=_parse_time, help=i18n.t("logs.since-help")
+    )
+
+    parser.add_argument(
+        "--until", type=_parse_time, help=i18n.t("logs.until-help")
+    )
+
+    parser.add_argument("--tail", default="all", help=i18n.t("logs.tail-help"))
+
+    parser.add_argument("--level", help=i18n.t("logs.level-help"))
+
+    parser.add_argument(
+        "-t",
+        "--timestamps",
+        action="store_true",
+        help=i18n.t("logs.timestamps-help"),
+    )
+
+    parser.add_argument(
+        "--save", action="store_true", help=i18n.t("logs.save-help")
+    )
+
+    return subcommand_parse_args(parser)
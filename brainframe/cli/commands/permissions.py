@@ -0,0 +1,38 @@
+from argparse import ArgumentParser
+
+import i18n
+from brainframe.cli import config
+from brainframe.cli import os_utils
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("permissions")
+def permissions():
+    args = _parse_args()
+
+    if not args.check and not os_utils.is_root():
+        print_utils.fail_translate("general.user-not-root")
+
+    paths = [config.install_path.value, config.data_path.value]
+    report = os_utils.give_brainframe_group_rw_access(paths, check=args.check)
+
+    if args.check and (report.group_changed > 0 or report.mode_changed > 0):
+        print_utils.fail_translate("permissions.needs-fix")
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("permissions.description"),
+        usage=i18n.t("permissions.usage"),
+    )
+
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help=i18n.t("permissions.check-help"),
+    )
+
+    return subcommand_parse_args(parser)
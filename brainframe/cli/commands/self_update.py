@@ -1,10 +1,12 @@
+import hashlib
+import json
 import os
-import shutil
 import stat
 import sys
 from argparse import ArgumentParser
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from tempfile import TemporaryDirectory
+from typing import Callable
 from typing import Optional
 from typing import Tuple
 from typing import Union
@@ -13,15 +15,22 @@ import i18n
 import requests
 from brainframe.cli import __version__
 from brainframe.cli import config
+from brainframe.cli import delta
+from brainframe.cli import downloads
 from brainframe.cli import frozen_utils
+from brainframe.cli import history
+from brainframe.cli import os_utils
 from brainframe.cli import print_utils
+from brainframe.cli import tracing
 from packaging import version
 
 from .utils import command
 
-_RELEASES_URL_PREFIX = "https://{subdomain}aotu.ai"
 _BINARY_URL = "{prefix}/releases/brainframe-cli/brainframe"
+_CHECKSUM_URL = _BINARY_URL + ".sha256"
 _LATEST_TAG_URL = "{prefix}/releases/brainframe-cli/latest"
+_DELTA_INDEX_URL = "{prefix}/releases/brainframe-cli/deltas/index.json"
+_DELTA_URL = "{prefix}/releases/brainframe-cli/deltas/{file_name}"
 
 
 @command("self-update")
@@ -33,23 +42,21 @@ def self_update():
 
     executable_path = Path(sys.executable)
 
-    # Check if the user has permissions to overwrite the executable in its
-    # current location
-    if not os.access(executable_path, os.W_OK):
-        error_message = i18n.t(
-            "general.file-bad-write-permissions", path=executable_path
-        )
-        error_message += "\n"
-        error_message += i18n.t("general.retry-as-root")
-        print_utils.fail(error_message)
+    # Check if the user has permissions to replace the executable in its
+    # current location. The new version is downloaded next to it, then
+    # renamed over it.
+    for path in [executable_path, executable_path.parent]:
+        if not os.access(path, os.W_OK):
+            error_message = i18n.t(
+                "general.file-bad-write-permissions", path=path
+            )
+            error_message += "\n"
+            error_message += i18n.t("general.retry-as-root")
+            print_utils.fail(error_message)
 
     credentials = config.staging_credentials()
 
-    prefix = _RELEASES_URL_PREFIX.format(
-        subdomain="staging." if config.is_staging.value else ""
-    )
-    binary_url = _BINARY_URL.format(prefix=prefix)
-
+    prefix = config.releases_url_prefix()
     current_version = version.parse(__version__)
     latest_version = _latest_version(prefix, credentials)
 
@@ -60,43 +67,187 @@ def self_update():
             latest_version=latest_version,
         )
 
-    # Get the updated executable
-    print_utils.translate("self-update.downloading")
-    response = requests.get(binary_url, auth=credentials, stream=True)
-    if not response.ok:
+    with history.record("self-update", config.install_path.value) as run:
+        _replace_executable(
+            executable_path, prefix, str(latest_version), credentials, run
+        )
+
+    print()
+    print_utils.translate(
+        "self-update.complete", color=print_utils.Color.GREEN
+    )
+
+
+def _replace_executable(
+    executable_path: Path,
+    url_prefix: str,
+    latest_version: str,
+    credentials: Optional[Tuple[str, str]],
+    run: history.Run,
+) -> None:
+    checksum_url = _CHECKSUM_URL.format(prefix=url_prefix)
+    try:
+        checksum = downloads.get_text(checksum_url, credentials)
+    except downloads.DownloadError as exc:
         print_utils.fail_translate(
-            "self-update.error-downloading",
-            status_code=response.status_code,
-            error_message=response.text,
+            "self-update.error-downloading", error_message=exc
         )
+    sha256 = None
+    if checksum is None:
+        print_utils.warning_translate("self-update.no-checksum")
+    else:
+        # Formatted like the output of sha256sum
+        sha256 = checksum.split()[0]
 
-    with NamedTemporaryFile("wb") as new_executable:
-        for block in response.iter_content(_BLOCK_SIZE):
-            new_executable.write(block)
-        new_executable.flush()
+    run.bytes = 0
 
-        # Set the result as executable
-        current_stat = executable_path.stat()
-        executable_path.chmod(
-            current_stat.st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+    def count_bytes(count: int) -> None:
+        run.bytes = (run.bytes or 0) + count
+
+    # Patch the current executable if patches to the latest version have been
+    # published, and download the whole thing otherwise
+    with run.phase("download"):
+        new_executable = _download_patched(
+            executable_path,
+            url_prefix,
+            latest_version,
+            credentials,
+            sha256,
+            count_bytes,
         )
+        if new_executable is None:
+            print_utils.translate("self-update.downloading")
+            try:
+                result = downloads.download(
+                    _BINARY_URL.format(prefix=url_prefix),
+                    executable_path,
+                    credentials=credentials,
+                    sha256=sha256,
+                    on_bytes=count_bytes,
+                )
+            except downloads.DownloadError as exc:
+                print_utils.fail_translate(
+                    "self-update.error-downloading", error_message=exc
+                )
+            print_utils.translate(
+                "self-update.downloaded",
+                size=print_utils.format_bytes(result.bytes),
+                duration=f"{result.duration:.1f}",
+                throughput=print_utils.format_bytes(result.throughput),
+                connections=result.connections,
+            )
+            new_executable = result.path
 
-        # Overwrite the existing executable with the new one
-        # Really excited for copy3, coming this summer
-        shutil.copy2(new_executable.name, executable_path)
+    # Set the result as executable, with the same permissions as the old one
+    current_stat = executable_path.stat()
+    new_executable.chmod(
+        stat.S_IMODE(current_stat.st_mode)
+        | stat.S_IXUSR
+        | stat.S_IXGRP
+        | stat.S_IXOTH
+    )
+    if os_utils.is_root():
+        os.chown(new_executable, current_stat.st_uid, current_stat.st_gid)
+
+    # The new executable is in the same directory, so it can be renamed over
+    # the old one. The rename is atomic, so the executable is never left half
+    # written, and the running process keeps its copy of the old one.
+    with run.phase("replace"), tracing.span(
+        "replace executable", "file", path=executable_path
+    ):
+        os.replace(new_executable, executable_path)
+
+
+def _download_patched(
+    executable_path: Path,
+    url_prefix: str,
+    latest_version: str,
+    credentials: Optional[Tuple[str, str]],
+    sha256: Optional[str],
+    on_bytes: Callable[[int], None],
+) -> Optional[Path]:
+    """Builds the latest version by applying the chain of patches between
+    the current version and it.
+
+    :return: The new executable, next to the current one, or None if there's
+        no chain of patches or they couldn't be applied
+    """
+    index_url = _DELTA_INDEX_URL.format(prefix=url_prefix)
+    try:
+        index = downloads.get_text(index_url, credentials)
+    except downloads.DownloadError as exc:
+        print_utils.warning_translate("self-update.patch-failed", error=exc)
+        return None
+    if index is None:
+        return None
+
+    try:
+        patches = delta.parse_index(json.loads(index))
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        print_utils.warning_translate(
+            "self-update.patch-failed",
+            error=i18n.t("self-update.patch-index-invalid", error=exc),
+        )
+        return None
+
+    chain = delta.find_chain(patches, __version__, latest_version)
+    if chain is None or len(chain) == 0:
+        return None
 
-    print()
     print_utils.translate(
-        "self-update.complete", color=print_utils.Color.GREEN
+        "self-update.downloading-patches",
+        count=len(chain),
+        size=print_utils.format_bytes(sum(p.size for p in chain)),
     )
 
+    contents = executable_path.read_bytes()
+    try:
+        with TemporaryDirectory() as patch_dir:
+            for patch in chain:
+                result = downloads.download(
+                    _DELTA_URL.format(
+                        prefix=url_prefix, file_name=patch.file_name
+                    ),
+                    Path(patch_dir, patch.file_name),
+                    credentials=credentials,
+                    sha256=patch.sha256,
+                    on_bytes=on_bytes,
+                )
+                with tracing.span(
+                    "apply patch", "file", version=patch.to_version
+                ):
+                    contents = delta.apply_patch(
+                        contents, result.path.read_bytes()
+                    )
+    except (downloads.DownloadError, delta.PatchError) as exc:
+        print_utils.warning_translate("self-update.patch-failed", error=exc)
+        return None
+
+    if sha256 is not None and hashlib.sha256(contents).hexdigest() != sha256:
+        print_utils.warning_translate(
+            "self-update.patch-failed",
+            error=i18n.t("self-update.patch-checksum-mismatch"),
+        )
+        return None
+
+    new_executable = downloads.part_path(executable_path)
+    with new_executable.open("wb") as file_:
+        file_.write(contents)
+        file_.flush()
+        os.fsync(file_.fileno())
+    return new_executable
+
 
 def _latest_version(
     url_prefix: str,
     credentials: Optional[Tuple[str, str]],
 ) -> Union[version.LegacyVersion, version.Version]:
     latest_tag_url = _LATEST_TAG_URL.format(prefix=url_prefix)
-    response = requests.get(latest_tag_url, auth=credentials)
+    with tracing.span(
+        "get latest version", "http", url=latest_tag_url
+    ) as span:
+        response = requests.get(latest_tag_url, auth=credentials)
+        span.set("status", response.status_code)
 
     if not response.ok:
         print_utils.fail_translate(
@@ -115,9 +266,3 @@ def _parse_args():
     )
 
     return parser.parse_args(sys.argv[2:])
-
-
-_BLOCK_SIZE = 1024000
-"""The block size to read files at. Chosen from this answer:
-https://stackoverflow.com/a/3673731
-"""
@@ -2,6 +2,8 @@ from argparse import ArgumentParser
 
 import i18n
 from brainframe.cli import brainframe_shell
+from brainframe.cli import config
+from brainframe.cli import print_utils
 
 from .utils import command
 from .utils import subcommand_parse_args
@@ -10,7 +12,14 @@ from .utils import subcommand_parse_args
 @command("shell")
 def shell():
     args = _parse_args()
-    brainframe_shell.run()
+
+    if args.stop:
+        stopped = brainframe_shell.stop_warm_containers()
+        print_utils.translate("shell.stopped", count=stopped)
+        return
+
+    warm = config.shell_warm.value if args.warm is None else args.warm
+    brainframe_shell.run(warm=bool(warm), ttl=config.shell_ttl.value)
 
 
 def _parse_args():
@@ -18,4 +27,25 @@ def _parse_args():
         description=i18n.t("shell.description"), usage=i18n.t("shell.usage")
     )
 
+    warm = parser.add_mutually_exclusive_group()
+    warm.add_argument(
+        "--warm",
+        action="store_true",
+        default=None,
+        help=i18n.t(
+            "shell.warm-help",
+            ttl_env_var=config.shell_ttl.env_var_name,
+            warm_env_var=config.shell_warm.env_var_name,
+        ),
+    )
+    warm.add_argument(
+        "--no-warm",
+        dest="warm",
+        action="store_false",
+        help=i18n.t("shell.no-warm-help"),
+    )
+    warm.add_argument(
+        "--stop", action="store_true", help=i18n.t("shell.stop-help")
+    )
+
     return subcommand_parse_args(parser)
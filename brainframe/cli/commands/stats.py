@@ -0,0 +1,152 @@
+import http.client
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from threading import Thread
+from typing import Dict
+from typing import List
+
+import i18n
+from brainframe.cli import brainframe_compose
+from brainframe.cli import config
+from brainframe.cli import container_stats
+from brainframe.cli import docker_api
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+
+@command("stats")
+def stats():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+    brainframe_compose.assert_installed(install_path)
+
+    aggregator = container_stats.StatsAggregator()
+    # Threads reading each container's stats stream, by container ID
+    streams: Dict[str, Thread] = {}
+
+    while True:
+        try:
+            containers = brainframe_compose.project_containers(install_path)
+        except docker_api.DockerAPIError as exc:
+            print_utils.fail_translate(
+                "general.docker-api-unavailable", error=str(exc)
+            )
+
+        # Follow containers that were started since the last interval, and
+        # forget the ones that are gone
+        for container in containers:
+            service = brainframe_compose.service_name(container)
+            stream = streams.get(container["Id"])
+            if stream is None or not stream.is_alive():
+                stream = Thread(
+                    target=_follow,
+                    args=(aggregator, service, container),
+                    daemon=True,
+                )
+                stream.start()
+                streams[container["Id"]] = stream
+        container_ids = {c["Id"] for c in containers}
+        for container_id in list(streams):
+            if container_id not in container_ids:
+                del streams[container_id]
+        for container_id in aggregator.container_ids():
+            if container_id not in container_ids:
+                aggregator.remove(container_id)
+
+        time.sleep(args.interval)
+
+        results = [s for s in aggregator.collect() if s.samples > 0]
+        _write(results, args.format, args.output)
+
+        if args.once:
+            break
+
+
+def _follow(
+    aggregator: container_stats.StatsAggregator,
+    service: str,
+    container: dict,
+) -> None:
+    """Adds samples from a container's stats stream to the aggregator until
+    the stream ends, which happens when the container stops.
+    """
+    name = container["Names"][0].lstrip("/")
+    path = f"/containers/{container['Id']}/stats"
+    try:
+        samples = docker_api.client().stream_json(path, stream=True)
+        # The first sample has no previous CPU usage to measure against, so
+        # its CPU usage would always be 0
+        next(samples, None)
+        for sample in samples:
+            aggregator.add(container["Id"], service, name, sample)
+    except (
+        docker_api.DockerAPIError,
+        OSError,
+        http.client.HTTPException,
+        ValueError,
+    ):
+        # The container is gone, or the stream was cut off. It will be
+        # followed again on the next interval if the container is still
+        # running.
+        pass
+
+
+def _write(
+    results: List[container_stats.ServiceStats],
+    output_format: str,
+    output: str,
+) -> None:
+    if output_format == "prometheus":
+        text = container_stats.to_prometheus(results)
+    else:
+        text = container_stats.to_ndjson(results)
+
+    if output == "-":
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    elif output_format == "prometheus":
+        # The textfile collector may read the file at any time, so it's
+        # replaced atomically instead of being written in place
+        path = Path(output)
+        temp_path = path.with_name(f".{path.name}.tmp")
+        temp_path.write_text(text)
+        os.replace(temp_path, path)
+    else:
+        with open(output, "a") as output_file:
+            output_file.write(text)
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("stats.description"), usage=i18n.t("stats.usage")
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=["prometheus", "ndjson"],
+        default="prometheus",
+        help=i18n.t("stats.format-help"),
+    )
+
+    parser.add_argument(
+        "--output", default="-", help=i18n.t("stats.output-help")
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=15,
+        help=i18n.t("stats.interval-help"),
+    )
+
+    parser.add_argument(
+        "--once", action="store_true", help=i18n.t("stats.once-help")
+    )
+
+    return subcommand_parse_args(parser)
@@ -0,0 +1,222 @@
+import json
+import math
+import sys
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import List
+from typing import Optional
+
+import i18n
+from brainframe.cli import brainframe_compose
+from brainframe.cli import config
+from brainframe.cli import docker_api
+from brainframe.cli import print_utils
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+_CLEAR_SCREEN = "\033[H\033[J"
+"""Moves the cursor to the top left of the terminal and clears everything"""
+
+_CHANGED_STATUSES = (404, 409)
+"""HTTP statuses the Docker daemon responds with when a container was removed
+or stopped after it was listed
+"""
+
+_MIN_INTERVAL = 0.5
+"""The shortest time between redraws, in seconds. Any shorter, and watching
+the status keeps the Docker daemon busy.
+"""
+
+
+@command("status")
+def status():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+    brainframe_compose.assert_installed(install_path)
+
+    while True:
+        try:
+            services = _gather(install_path)
+        except docker_api.DockerAPIError as exc:
+            print_utils.fail_translate(
+                "general.docker-api-unavailable", error=str(exc)
+            )
+
+        if args.watch:
+            print(_CLEAR_SCREEN, end="")
+        _print(services, args.format)
+
+        if not args.watch:
+            break
+        sys.stdout.flush()
+        time.sleep(args.interval)
+
+
+def _gather(install_path: Path) -> List[dict]:
+    """Collects the status of every BrainFrame service. Containers are queried
+    at the same time, so this takes about as long as the slowest one.
+    """
+    client = docker_api.client()
+    containers = brainframe_compose.project_containers(
+        install_path, include_stopped=True
+    )
+    if len(containers) == 0:
+        return []
+
+    def gather_one(container: dict) -> dict:
+        try:
+            inspection = client.inspect_container(container["Id"])
+        except docker_api.DockerAPIError as exc:
+            if exc.status not in _CHANGED_STATUSES:
+                raise
+            return _changed_row(container, exc.status)
+        state = inspection["State"]
+        running = state.get("Running", False)
+
+        stats: Optional[dict] = None
+        uptime: Optional[float] = None
+        if running:
+            try:
+                stats = client.container_stats(container["Id"])
+            except docker_api.DockerAPIError as exc:
+                if exc.status not in _CHANGED_STATUSES:
+                    raise
+                return _changed_row(container, exc.status)
+            started_at = docker_api.parse_timestamp(state["StartedAt"])
+            uptime = (datetime.now(timezone.utc) - started_at).total_seconds()
+
+        memory_bytes: Optional[int] = None
+        memory_limit_bytes: Optional[int] = None
+        if stats is not None:
+            memory_bytes, memory_limit_bytes = docker_api.memory_usage(stats)
+
+        return {
+            "service": brainframe_compose.service_name(container),
+            "container": inspection["Name"].lstrip("/"),
+            "state": state.get("Status"),
+            "health": (state.get("Health") or {}).get("Status"),
+            "restarts": inspection.get("RestartCount", 0),
+            "uptime_seconds": uptime,
+            "cpu_percent": (
+                None if stats is None else docker_api.cpu_percent(stats)
+            ),
+            "memory_bytes": memory_bytes,
+            "memory_limit_bytes": memory_limit_bytes,
+        }
+
+    with ThreadPoolExecutor(max_workers=len(containers)) as executor:
+        return list(executor.map(gather_one, containers))
+
+
+def _changed_row(container: dict, status: Optional[int]) -> dict:
+    """Makes the row for a container that stopped or was removed while its
+    status was being collected, like one that's restarting
+
+    :param container: The container, as it was listed
+    :param status: The HTTP status the Docker daemon responded with
+    """
+    return {
+        "service": brainframe_compose.service_name(container),
+        "container": (container.get("Names") or ["/"])[0].lstrip("/"),
+        "state": "gone" if status == 404 else "restarting",
+        "health": None,
+        "restarts": None,
+        "uptime_seconds": None,
+        "cpu_percent": None,
+        "memory_bytes": None,
+        "memory_limit_bytes": None,
+    }
+
+
+def _print(services: List[dict], output_format: str) -> None:
+    if output_format == "json":
+        print(json.dumps(services, indent=2))
+        return
+
+    if len(services) == 0:
+        print_utils.translate("status.no-containers")
+        return
+
+    rows = []
+    for service in services:
+        memory = "-"
+        if service["memory_bytes"] is not None:
+            memory = print_utils.format_bytes(service["memory_bytes"])
+            if service["memory_limit_bytes"]:
+                limit = print_utils.format_bytes(service["memory_limit_bytes"])
+                memory += f" / {limit}"
+
+        rows.append(
+            [
+                service["service"],
+                service["state"],
+                service["health"] or "-",
+                "-" if service["restarts"] is None else service["restarts"],
+                (
+                    "-"
+                    if service["uptime_seconds"] is None
+                    else print_utils.format_duration(service["uptime_seconds"])
+                ),
+                (
+                    "-"
+                    if service["cpu_percent"] is None
+                    else f"{service['cpu_percent']:.1f}%"
+                ),
+                memory,
+            ]
+        )
+
+    print_utils.print_table(
+        ["SERVICE", "STATE", "HEALTH", "RESTARTS", "UPTIME", "CPU", "MEMORY"],
+        rows,
+    )
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("status.description"), usage=i18n.t("status.usage")
+    )
+
+    parser.add_argument(
+        "--watch", action="store_true", help=i18n.t("status.watch-help")
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=_interval,
+        default=2,
+        help=i18n.t("status.interval-help", min_interval=_MIN_INTERVAL),
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=["table", "json"],
+        default="table",
+        help=i18n.t("status.format-help"),
+    )
+
+    return subcommand_parse_args(parser)
+
+
+def _interval(value: str) -> float:
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = math.nan
+    # Written so that NaN is rejected too
+    if not (_MIN_INTERVAL <= seconds < math.inf):
+        raise ArgumentTypeError(
+            i18n.t(
+                "status.invalid-interval",
+                value=value,
+                min_interval=_MIN_INTERVAL,
+            )
+        )
+    return seconds
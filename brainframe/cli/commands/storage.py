@@ -0,0 +1,355 @@
+import re
+import shutil
+import sys
+import time
+from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from pathlib import Path
+from typing import List
+
+import i18n
+from brainframe.cli import brainframe_compose
+from brainframe.cli import compose_override
+from brainframe.cli import config
+from brainframe.cli import docker_api
+from brainframe.cli import history
+from brainframe.cli import os_utils
+from brainframe.cli import print_utils
+from brainframe.cli import tiering
+
+from .utils import command
+from .utils import requires_root
+from .utils import subcommand_parse_args
+
+_DEFAULT_MIN_AGE_DAYS = 30
+_DEFAULT_WORKERS = 4
+
+_SIZE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?$", re.I)
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+@command("storage")
+@requires_root  # Some BrainFrame services write files as root
+def storage():
+    args = _parse_args()
+
+    install_path = config.install_path.value
+    data_path = config.data_path.value
+    brainframe_compose.assert_installed(install_path)
+
+    if args.action == "tier":
+        _tier(args, install_path, data_path)
+
+
+def _tier(args, install_path: Path, data_path: Path) -> None:
+    cold_path = args.cold_path or config.cold_path.value
+    if cold_path is None:
+        print_utils.fail_translate(
+            "storage.no-cold-path", env_var=config.cold_path.env_var_name
+        )
+    cold_path = cold_path.absolute()
+    data_path = data_path.absolute()
+    if not cold_path.is_dir():
+        print_utils.fail_translate("storage.cold-path-missing", path=cold_path)
+    if _overlaps(cold_path, data_path):
+        print_utils.fail_translate(
+            "storage.overlapping-paths",
+            cold_path=cold_path,
+            data_path=data_path,
+        )
+
+    # Moving files shouldn't slow down BrainFrame, which keeps running
+    os_utils.lower_io_priority()
+
+    index = tiering.index_path(install_path)
+    with history.record("tier", install_path) as run:
+        with run.phase("scan"):
+            scan = tiering.scan(data_path, cold_path, index)
+        for error in scan.errors:
+            print_utils.warning_translate(
+                "storage.scan-error", error=str(error)
+            )
+        print_utils.translate(
+            "storage.scanned",
+            files=len(scan.files),
+            directories=scan.scanned,
+        )
+
+        if len(scan.orphans) > 0 and not args.dry_run:
+            with run.phase("orphans"):
+                _delete_orphans(data_path, scan.orphans)
+
+        if args.recall:
+            _recall(args, data_path, index, scan.files, run)
+        else:
+            _move(args, install_path, data_path, cold_path, index, scan, run)
+
+
+def _move(
+    args,
+    install_path: Path,
+    data_path: Path,
+    cold_path: Path,
+    index: Path,
+    scan: tiering.ScanResult,
+    run: history.Run,
+) -> None:
+    policy = tiering.Policy(
+        min_age=args.min_age * 24 * 60 * 60,
+        min_size=args.min_size,
+        include=args.include or [],
+        exclude=tiering.ALWAYS_EXCLUDED + (args.exclude or []),
+    )
+    now = time.time()
+    candidates = [
+        f
+        for f in scan.files
+        if f.cold_path is None
+        and policy.is_cold(f.path, f.size, f.mtime_ns, now)
+    ]
+    if len(candidates) == 0:
+        print_utils.translate("storage.nothing-to-move")
+        return
+
+    total = sum(f.size for f in candidates)
+    mount_changes = tiering.cold_mount_changes(
+        install_path, data_path, cold_path
+    )
+
+    if args.dry_run:
+        _print_files(candidates)
+        print_utils.translate(
+            "storage.would-move",
+            count=len(candidates),
+            size=print_utils.format_bytes(total),
+            cold_path=cold_path,
+        )
+        if len(mount_changes) > 0:
+            compose_override.update(install_path, mount_changes, dry_run=True)
+        return
+
+    free = shutil.disk_usage(str(cold_path)).free
+    if free < total:
+        print_utils.fail_translate(
+            "storage.not-enough-space",
+            path=cold_path,
+            needed=print_utils.format_bytes(total),
+            free=print_utils.format_bytes(free),
+        )
+
+    if len(mount_changes) > 0:
+        compose_override.update(install_path, mount_changes)
+        if _brainframe_running(install_path):
+            # Links to the cold path would be broken inside containers that
+            # were started without it mounted
+            print_utils.fail_translate("storage.restart-to-mount")
+
+    with run.phase("move"):
+        result = tiering.move_to_cold(
+            data_path,
+            cold_path,
+            candidates,
+            policy,
+            now,
+            workers=args.workers,
+        )
+    tiering.record_moves(index, result.moved)
+    run.bytes = result.bytes
+    run.files = len(result.moved)
+
+    print_utils.translate(
+        "storage.moved",
+        color=print_utils.Color.GREEN,
+        count=len(result.moved),
+        size=print_utils.format_bytes(result.bytes),
+        cold_path=cold_path,
+    )
+    _report_problems(result)
+
+
+def _recall(
+    args,
+    data_path: Path,
+    index: Path,
+    files: List[tiering.TierFile],
+    run: history.Run,
+) -> None:
+    policy = tiering.Policy(
+        min_age=0,
+        min_size=0,
+        include=args.include or [],
+        exclude=args.exclude or [],
+    )
+    candidates = [
+        f for f in files if f.cold_path is not None and policy.matches(f.path)
+    ]
+    if len(candidates) == 0:
+        print_utils.translate("storage.nothing-to-recall")
+        return
+
+    total = sum(f.size for f in candidates)
+    if args.dry_run:
+        _print_files(candidates)
+        print_utils.translate(
+            "storage.would-recall",
+            count=len(candidates),
+            size=print_utils.format_bytes(total),
+        )
+        return
+
+    free = shutil.disk_usage(str(data_path)).free
+    if free < total:
+        print_utils.fail_translate(
+            "storage.not-enough-space",
+            path=data_path,
+            needed=print_utils.format_bytes(total),
+            free=print_utils.format_bytes(free),
+        )
+
+    with run.phase("recall"):
+        result = tiering.recall(data_path, candidates, workers=args.workers)
+    tiering.record_moves(index, result.moved)
+    run.bytes = result.bytes
+    run.files = len(result.moved)
+
+    print_utils.translate(
+        "storage.recalled",
+        color=print_utils.Color.GREEN,
+        count=len(result.moved),
+        size=print_utils.format_bytes(result.bytes),
+    )
+    _report_problems(result)
+
+
+def _report_problems(result: tiering.MoveResult) -> None:
+    if result.skipped > 0:
+        print_utils.warning_translate("storage.skipped", count=result.skipped)
+    if len(result.errors) > 0:
+        for error in result.errors:
+            print_utils.print_color(
+                error, print_utils.Color.RED, file=sys.stderr
+            )
+        print_utils.fail_translate(
+            "storage.move-errors", count=len(result.errors)
+        )
+
+
+def _delete_orphans(data_path: Path, orphans: List[tiering.TierFile]) -> None:
+    """Deletes files in the cold path whose links were deleted by BrainFrame,
+    the same way the files would have been if they were never moved. Each
+    link is checked again right before, in case it was made again since the
+    scan.
+    """
+    deleted = 0
+    for orphan in orphans:
+        if orphan.cold_path is None or not tiering.is_orphaned(
+            data_path, orphan
+        ):
+            continue
+        try:
+            Path(orphan.cold_path).unlink()
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    if deleted > 0:
+        print_utils.translate("storage.orphans-deleted", count=deleted)
+
+
+def _print_files(files: List[tiering.TierFile]) -> None:
+    print_utils.print_table(
+        ["PATH", "SIZE", "LAST MODIFIED"],
+        [
+            [
+                f.path,
+                print_utils.format_bytes(f.size),
+                time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(f.mtime_ns / 1e9)
+                ),
+            ]
+            for f in sorted(files, key=lambda f: f.path)
+        ],
+    )
+    print()
+
+
+def _brainframe_running(install_path: Path) -> bool:
+    try:
+        return len(brainframe_compose.project_containers(install_path)) > 0
+    except docker_api.DockerAPIError as exc:
+        print_utils.fail_translate("general.docker-api-unavailable", error=exc)
+
+
+def _overlaps(first: Path, second: Path) -> bool:
+    return (
+        first == second or first in second.parents or second in first.parents
+    )
+
+
+def _parse_size(value: str) -> int:
+    match = _SIZE_PATTERN.match(value.strip())
+    if match is None:
+        raise ArgumentTypeError(i18n.t("storage.invalid-size", value=value))
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.lower()])
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("storage.description"),
+        usage=i18n.t("storage.usage"),
+    )
+
+    actions = parser.add_subparsers(dest="action")
+    actions.required = True
+
+    tier = actions.add_parser("tier", help=i18n.t("storage.tier-help"))
+    tier.add_argument(
+        "--cold-path",
+        type=Path,
+        help=i18n.t(
+            "storage.cold-path-help", env_var=config.cold_path.env_var_name
+        ),
+    )
+    tier.add_argument(
+        "--min-age",
+        type=float,
+        metavar="DAYS",
+        default=_DEFAULT_MIN_AGE_DAYS,
+        help=i18n.t("storage.min-age-help", default=_DEFAULT_MIN_AGE_DAYS),
+    )
+    tier.add_argument(
+        "--min-size",
+        type=_parse_size,
+        metavar="SIZE",
+        default=0,
+        help=i18n.t("storage.min-size-help"),
+    )
+    tier.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help=i18n.t("storage.include-help"),
+    )
+    tier.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help=i18n.t(
+            "storage.exclude-help",
+            always_excluded=", ".join(tiering.ALWAYS_EXCLUDED),
+        ),
+    )
+    tier.add_argument(
+        "--recall", action="store_true", help=i18n.t("storage.recall-help")
+    )
+    tier.add_argument(
+        "--workers",
+        type=int,
+        default=_DEFAULT_WORKERS,
+        help=i18n.t("storage.workers-help", default=_DEFAULT_WORKERS),
+    )
+    tier.add_argument(
+        "--dry-run", action="store_true", help=i18n.t("storage.dry-run-help")
+    )
+
+    return subcommand_parse_args(parser)
@@ -0,0 +1,191 @@
+import json
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+
+import i18n
+import yaml
+from brainframe.cli import brainframe_compose
+from brainframe.cli import checks
+from brainframe.cli import compose_override
+from brainframe.cli import config
+from brainframe.cli import host_checks
+from brainframe.cli import print_utils
+from brainframe.cli import topology
+from brainframe.cli import tuning
+
+from .utils import command
+from .utils import subcommand_parse_args
+
+_DEFAULT_HEAVY_SERVICES = ["core"]
+
+_SYSCTL_FILE_NAME = "99-brainframe.conf"
+_DAEMON_CONFIG_PATH = Path("/etc/docker/daemon.json")
+
+
+@command("tune")
+def tune():
+    args = _parse_args()
+
+    if args.action == "check":
+        # Checking the host doesn't need BrainFrame to be installed, so that
+        # it can be done before installing
+        _check(args)
+        return
+
+    install_path = config.install_path.value
+    brainframe_compose.assert_installed(install_path)
+
+    if args.action == "override":
+        _override(install_path, args)
+
+
+def _check(args) -> None:
+    results = checks.run(host_checks.all_checks())
+    checks.print_results(results)
+
+    if args.write_snippets is not None:
+        _write_snippets(args.write_snippets, list(results.values()))
+
+    failed = [n for n, r in results.items() if r.status == checks.FAILED]
+    if len(failed) > 0:
+        print()
+        print_utils.fail_translate(
+            "tune.checks-failed", checks=", ".join(failed)
+        )
+
+
+def _write_snippets(
+    directory: Path, results: List[checks.CheckResult]
+) -> None:
+    """Writes configuration files that fix the problems that were found. They
+    are written to a separate directory for the user to review and install,
+    since they change how the whole machine behaves.
+    """
+    sysctl: Dict[str, str] = {}
+    daemon_config: Dict[str, Any] = {}
+    for result in results:
+        sysctl.update(result.sysctl or {})
+        daemon_config.update(result.daemon_config or {})
+
+    if len(sysctl) == 0 and len(daemon_config) == 0:
+        print_utils.translate("tune.no-snippets-needed")
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    print()
+
+    if len(sysctl) > 0:
+        sysctl_path = directory / _SYSCTL_FILE_NAME
+        sysctl_path.write_text(
+            "".join(f"{key} = {value}\n" for key, value in sysctl.items())
+        )
+        print_utils.translate("tune.sysctl-written", path=sysctl_path)
+
+    if len(daemon_config) > 0:
+        # Start from the existing configuration, so that the result can
+        # replace it as is
+        existing: Dict[str, Any] = {}
+        if _DAEMON_CONFIG_PATH.is_file():
+            existing = json.loads(_DAEMON_CONFIG_PATH.read_text())
+        daemon_path = directory / _DAEMON_CONFIG_PATH.name
+        daemon_path.write_text(
+            json.dumps({**existing, **daemon_config}, indent=2) + "\n"
+        )
+        print_utils.translate(
+            "tune.daemon-config-written",
+            path=daemon_path,
+            daemon_config_path=_DAEMON_CONFIG_PATH,
+        )
+
+
+def _override(install_path: Path, args) -> None:
+    services = _compose_services(install_path)
+    heavy = args.heavy or _DEFAULT_HEAVY_SERVICES
+    for service in heavy:
+        if service not in services:
+            print_utils.fail_translate(
+                "tune.unknown-service",
+                service=service,
+                services=", ".join(services),
+            )
+    light = [s for s in services if s not in heavy]
+
+    host = topology.read_host()
+    print_utils.translate(
+        "tune.host-topology",
+        cores=len(host.cores),
+        cpus=host.cpu_count,
+        nodes=len(host.nodes),
+        memory=print_utils.format_bytes(host.memory_bytes),
+    )
+
+    settings = tuning.plan_placement(host, heavy, light)
+    print_utils.print_table(
+        [
+            "SERVICE",
+            "CPUSET",
+            "MEMORY LIMIT",
+            "MEMORY RESERVATION",
+            "SHM SIZE",
+        ],
+        [
+            [
+                service,
+                values.get("cpuset") or "-",
+                values.get("mem_limit") or "-",
+                values.get("mem_reservation") or "-",
+                values.get("shm_size") or "-",
+            ]
+            for service, values in settings.items()
+        ],
+    )
+    print()
+
+    changed = compose_override.update(
+        install_path, {"services": settings}, dry_run=args.dry_run
+    )
+    if changed and not args.dry_run:
+        print_utils.translate("tune.restart-to-apply")
+
+
+def _compose_services(install_path: Path) -> List[str]:
+    compose_path = install_path / "docker-compose.yml"
+    compose = yaml.safe_load(compose_path.read_text()) or {}
+    return list(compose.get("services") or {})
+
+
+def _parse_args():
+    parser = ArgumentParser(
+        description=i18n.t("tune.description"), usage=i18n.t("tune.usage")
+    )
+
+    actions = parser.add_subparsers(dest="action")
+    actions.required = True
+
+    override = actions.add_parser(
+        "override", help=i18n.t("tune.override-help")
+    )
+    override.add_argument(
+        "--heavy",
+        action="append",
+        metavar="SERVICE",
+        help=i18n.t(
+            "tune.heavy-help", default=", ".join(_DEFAULT_HEAVY_SERVICES)
+        ),
+    )
+    override.add_argument(
+        "--dry-run", action="store_true", help=i18n.t("tune.dry-run-help")
+    )
+
+    check = actions.add_parser("check", help=i18n.t("tune.check-help"))
+    check.add_argument(
+        "--write-snippets",
+        type=Path,
+        metavar="DIRECTORY",
+        help=i18n.t("tune.write-snippets-help"),
+    )
+
+    return subcommand_parse_args(parser)
@@ -1,10 +1,9 @@
-import shutil
 from argparse import ArgumentParser
 
 import i18n
 from brainframe.cli import brainframe_compose
 from brainframe.cli import config
-from brainframe.cli import os_utils
+from brainframe.cli import deletion
 from brainframe.cli import print_utils
 
 from .utils import command
@@ -46,10 +45,11 @@ def uninstall():
     print_utils.translate("uninstall.deleting-images")
     brainframe_compose.run(install_path, ["down", "--rmi", "all"])
     print_utils.translate("uninstall.deleting-install-path")
-    shutil.rmtree(install_path)
+    paths_to_delete = [install_path]
     if delete_data:
         print_utils.translate("uninstall.deleting-data-path")
-        shutil.rmtree(data_path)
+        paths_to_delete.append(data_path)
+    deletion.delete(paths_to_delete, wait=args.wait)
 
     print()
     print_utils.translate("uninstall.complete", color=print_utils.Color.GREEN)
@@ -73,4 +73,10 @@ def _parse_args():
         help=i18n.t("uninstall.delete-data-help"),
     )
 
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help=i18n.t("general.wait-for-deletion-help"),
+    )
+
     return subcommand_parse_args(parser)
@@ -1,9 +1,16 @@
+import time
 from argparse import ArgumentParser
+from pathlib import Path
 
 import i18n
 from brainframe.cli import brainframe_compose
+from brainframe.cli import brainframe_shell
 from brainframe.cli import config
+from brainframe.cli import doctor
+from brainframe.cli import history
+from brainframe.cli import install_metadata
 from brainframe.cli import print_utils
+from brainframe.cli import scheduler
 from packaging import version
 
 from .utils import command
@@ -18,14 +25,34 @@ def update():
 
     brainframe_compose.assert_installed(install_path)
 
-    if args.version == "latest":
-        requested_version_str = brainframe_compose.get_latest_version()
-    else:
-        requested_version_str = args.version
+    if not args.skip_preflight:
+        doctor.run_preflight(
+            doctor.UPDATE, install_path, config.data_path.value
+        )
+
+    with history.record("update", install_path) as run:
+        _update(args, install_path, run)
+
+    print()
+    print_utils.translate("update.complete", color=print_utils.Color.GREEN)
 
-    existing_version_str = brainframe_compose.check_existing_version(
-        install_path
+
+def _update(args, install_path: Path, run: history.Run) -> None:
+    steps = scheduler.StepScheduler()
+    run.include_steps(steps)
+
+    # Checking the latest version is an HTTP request and checking the existing
+    # version reads from disk, so they can be done at the same time
+    if args.version == "latest":
+        steps.add("latest-version", brainframe_compose.get_latest_version)
+    steps.add(
+        "existing-version",
+        lambda: brainframe_compose.check_existing_version(install_path),
     )
+    steps.run()
+
+    requested_version_str = steps.results.get("latest-version", args.version)
+    existing_version_str = steps.results["existing-version"]
 
     existing_version = version.parse(existing_version_str)
     requested_version = version.parse(requested_version_str)
@@ -62,24 +89,45 @@ def update():
         requested_version=requested_version_str,
     )
 
-    print_utils.translate("general.downloading-docker-compose")
-    docker_compose_path = install_path / "docker-compose.yml"
-    brainframe_compose.download(
-        docker_compose_path, version=requested_version_str
-    )
-
-    brainframe_compose.run(install_path, ["pull"])
-
+    # Ask before anything is downloaded, so that the rest of the update can
+    # run unattended
     if args.noninteractive:
         restart = args.restart
     else:
         restart = print_utils.ask_yes_no("update.ask-restart")
-    if restart:
-        brainframe_compose.run(install_path, ["down"])
-        brainframe_compose.run(install_path, ["up", "-d"])
 
-    print()
-    print_utils.translate("update.complete", color=print_utils.Color.GREEN)
+    def download_compose() -> None:
+        print_utils.translate("general.downloading-docker-compose")
+        brainframe_compose.download(
+            install_path / "docker-compose.yml", version=requested_version_str
+        )
+
+    steps.add("download", download_compose)
+    steps.add(
+        "pull",
+        lambda: brainframe_compose.run(install_path, ["pull"]),
+        depends_on=["download"],
+    )
+    steps.add("pull-shell", brainframe_shell.pull_image)
+    # Image digests are only known once the images are pulled
+    steps.add(
+        "metadata",
+        lambda: install_metadata.write(install_path, updated_at=time.time()),
+        depends_on=["pull"],
+    )
+    if restart:
+        steps.add(
+            "down",
+            lambda: brainframe_compose.run(install_path, ["down"]),
+            depends_on=["pull"],
+        )
+        steps.add(
+            "up",
+            lambda: brainframe_compose.run(install_path, ["up", "-d"]),
+            depends_on=["down"],
+        )
+    steps.run()
+    steps.print_timing_report()
 
 
 def _parse_args():
@@ -110,4 +158,10 @@ def _parse_args():
         help=i18n.t("update.force-help"),
     )
 
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help=i18n.t("general.skip-preflight-help"),
+    )
+
     return subcommand_parse_args(parser)
@@ -0,0 +1,123 @@
+import difflib
+import os
+from pathlib import Path
+from typing import Any
+from typing import Dict
+
+import yaml
+
+from . import os_utils
+from . import print_utils
+
+OVERRIDE_FILE_NAME = "docker-compose.override.yml"
+"""The name of the override file, which Docker Compose merges on top of the
+docker-compose.yml. Updates replace the docker-compose.yml but leave this file
+alone, so it's where changes to BrainFrame's services are kept.
+"""
+
+
+def override_path(install_path: Path) -> Path:
+    return install_path / OVERRIDE_FILE_NAME
+
+
+def merge(base: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Recursively merges changes into a copy of a Compose configuration.
+    Mappings are merged key by key, and anything else in the changes replaces
+    the value in the base. A value of None removes the key.
+    """
+    merged = dict(base)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict):
+            existing = merged.get(key)
+            if not isinstance(existing, dict):
+                existing = {}
+            merged[key] = merge(existing, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def update(
+    install_path: Path, changes: Dict[str, Any], dry_run: bool = False
+) -> bool:
+    """Merges changes into the override file, keeping anything else that's
+    already in it.
+
+    :param install_path: The install path that the override file is in
+    :param changes: The changes to make, in the same structure as a Compose
+        file
+    :param dry_run: If True, the file isn't changed, and a diff of the changes
+        that would be made is printed instead
+    :return: True if the file was, or would have been, changed
+    """
+    path = override_path(install_path)
+    old_text = path.read_text() if path.is_file() else ""
+    existing = yaml.safe_load(old_text) or {}
+
+    if old_text.strip() != "" and old_text != _dump(existing):
+        # The file was edited by hand. Writing it again would lose its
+        # comments and ordering, so the changes are shown to be made by hand
+        # instead.
+        snippet = _dump(_without_removals(changes))
+        if dry_run:
+            print_utils.warning_translate(
+                "general.override-hand-edited", path=path, snippet=snippet
+            )
+            return True
+        print_utils.fail_translate(
+            "general.override-hand-edited", path=path, snippet=snippet
+        )
+
+    if "version" not in existing:
+        # Compose requires every file to use the same format version, if the
+        # docker-compose.yml declares one
+        compose_path = install_path / "docker-compose.yml"
+        compose = yaml.safe_load(compose_path.read_text()) or {}
+        if "version" in compose:
+            existing["version"] = compose["version"]
+
+    new_text = _dump(merge(existing, changes))
+    if new_text == old_text:
+        print_utils.translate("general.override-unchanged", path=path)
+        return False
+
+    if dry_run:
+        diff = difflib.unified_diff(
+            old_text.splitlines(keepends=True),
+            new_text.splitlines(keepends=True),
+            fromfile=str(path),
+            tofile=f"{path} (new)",
+        )
+        print("".join(diff), end="")
+        return True
+
+    # Write the new file next to the old one, then replace it, so that a
+    # Compose command running at the same time never sees a partial file
+    temp_path = path.with_name(f".{path.name}.tmp")
+    temp_path.write_text(new_text)
+    os.replace(temp_path, path)
+
+    if os_utils.is_root():
+        os_utils.give_brainframe_group_rw_access([path])
+
+    print_utils.translate("general.override-updated", path=path)
+    return True
+
+
+def _dump(config: Dict[str, Any]) -> str:
+    return yaml.safe_dump(config, default_flow_style=False)
+
+
+def _without_removals(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    :return: The changes, without the keys that they would remove
+    """
+    result = {}
+    for key, value in changes.items():
+        if isinstance(value, dict):
+            result[key] = _without_removals(value)
+        elif value is not None:
+            result[key] = value
+    return result
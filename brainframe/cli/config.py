@@ -55,6 +55,17 @@ data_path = Option[Path]("data_path")
 is_staging = Option[bool]("staging")
 staging_username = Option[str]("staging_username")
 staging_password = Option[str]("staging_password")
+releases_url = Option[str]("releases_url")
+"""Where releases are downloaded from, in place of aotu.ai. Mostly useful for
+mirrors and for testing against a local server.
+"""
+
+instances_file = Option[Path]("instances_file")
+
+cold_path = Option[Path]("cold_path")
+
+shell_warm = Option[bool]("shell_warm")
+shell_ttl = Option[int]("shell_ttl")
 
 
 def load() -> None:
@@ -68,6 +79,24 @@ def load() -> None:
     is_staging.load(_bool_converter, defaults)
     staging_username.load(str, defaults)
     staging_password.load(str, defaults)
+    releases_url.load(str, defaults)
+
+    instances_file.load(Path, defaults)
+
+    cold_path.load(Path, defaults)
+
+    shell_warm.load(_bool_converter, defaults)
+    shell_ttl.load(int, defaults)
+
+
+def releases_url_prefix() -> str:
+    """
+    :return: The URL that release files are found under, like
+        "https://aotu.ai"
+    """
+    if releases_url.value:
+        return releases_url.value.rstrip("/")
+    return "https://staging.aotu.ai" if is_staging.value else "https://aotu.ai"
 
 
 def staging_credentials() -> Optional[Tuple[str, str]]:
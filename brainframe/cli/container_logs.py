@@ -0,0 +1,285 @@
+import gzip
+import heapq
+import queue
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+from threading import Thread
+from typing import IO
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Pattern
+from typing import Tuple
+
+from . import docker_api
+
+_FRAME_HEADER = struct.Struct(">BxxxL")
+"""The header of each frame in a multiplexed log stream: the stream the frame
+belongs to, three bytes of padding, and the size of the frame
+"""
+
+_QUEUE_SIZE = 1024
+"""The number of lines that are read ahead of the output for each container"""
+
+
+class LogLine(NamedTuple):
+    key: Tuple[bytes, int]
+    """A sort key for the line's timestamp. Docker timestamps are always in UTC
+    but trim trailing zeros from the fraction, so they can't be compared as
+    strings.
+    """
+    service: str
+    timestamp: bytes
+    message: bytes
+    """The line, without its timestamp but with its trailing newline"""
+
+
+class LogSource(NamedTuple):
+    service: str
+    container_id: str
+    tty: bool
+    """If True, the container's output isn't multiplexed"""
+
+
+def stream_lines(
+    source: LogSource,
+    level: Optional[Pattern[bytes]] = None,
+    **params: object,
+) -> Iterator[LogLine]:
+    """Reads a container's log, with timestamps.
+
+    :param source: The container to read from
+    :param level: If provided, only lines matching this pattern are returned.
+        Lines are filtered as they are read, before they are decoded.
+    :param params: Additional query parameters for the logs endpoint, like
+        "follow", "since" and "until"
+    :return: The container's log lines, in order
+    """
+    path = f"/containers/{source.container_id}/logs"
+    with docker_api.client().stream(
+        path, stdout=True, stderr=True, timestamps=True, **params
+    ) as response:
+        if source.tty:
+            raw_lines: Iterator[bytes] = iter(response.readline, b"")
+        else:
+            raw_lines = _demultiplex(response)
+
+        for raw_line in raw_lines:
+            timestamp, _, message = raw_line.partition(b" ")
+            # The timestamp Docker adds is left out, so that patterns can
+            # match the start of the line the container wrote
+            if level is not None and level.search(message) is None:
+                continue
+            if not message.endswith(b"\n"):
+                message += b"\n"
+            yield LogLine(
+                _sort_key(timestamp), source.service, timestamp, message
+            )
+
+
+def merge_history(
+    sources: List[LogSource],
+    level: Optional[Pattern[bytes]] = None,
+    **params: object,
+) -> Iterator[LogLine]:
+    """Reads the logs of multiple containers at the same time and merges them
+    by timestamp. Only a bounded number of lines are held in memory for each
+    container.
+
+    :param sources: The containers to read from
+    :param level: If provided, only lines matching this pattern are returned
+    :param params: Additional query parameters for the logs endpoint. "follow"
+        must not be set, since merging waits for every container's next line.
+    :return: Log lines from every container, in timestamp order
+    """
+    queues = [_start_reader(source, level, params) for source in sources]
+    return heapq.merge(*(_drain(q) for q in queues))
+
+
+def merge_live(
+    sources: List[LogSource],
+    holdback: float,
+    level: Optional[Pattern[bytes]] = None,
+    **params: object,
+) -> Iterator[Optional[LogLine]]:
+    """Follows the logs of multiple containers at the same time. Lines are held
+    for a short time after they arrive so that lines from different containers
+    can be put in timestamp order.
+
+    :param sources: The containers to follow
+    :param holdback: How long to hold each line for, in seconds
+    :param level: If provided, only lines matching this pattern are returned
+    :param params: Additional query parameters for the logs endpoint
+    :return: Log lines in timestamp order. None is returned whenever no lines
+        are waiting to be returned, so callers know when to flush their output.
+        The iterator ends when every container's log ends.
+    """
+    lines: "queue.Queue[Optional[LogLine]]" = queue.Queue(
+        maxsize=_QUEUE_SIZE * max(len(sources), 1)
+    )
+    for source in sources:
+        Thread(
+            target=_read_into,
+            args=(lines, source, level, dict(params, follow=True)),
+            daemon=True,
+        ).start()
+
+    # Lines waiting to be returned, with the time they arrived
+    waiting: List[Tuple[LogLine, float]] = []
+    running = len(sources)
+    last_flush = time.monotonic()
+    while running > 0 or len(waiting) > 0:
+        timeout = holdback
+        if len(waiting) > 0:
+            timeout = max(waiting[0][1] + holdback - time.monotonic(), 0)
+
+        try:
+            line = lines.get(timeout=timeout if running > 0 else 0)
+        except queue.Empty:
+            pass
+        else:
+            if line is None:
+                running -= 1
+            else:
+                heapq.heappush(waiting, (line, time.monotonic()))
+
+        # Lines are returned as soon as they've been held long enough, even
+        # while more keep arriving, so that output doesn't stall under a
+        # constant stream of lines
+        now = time.monotonic()
+        while len(waiting) > 0 and (
+            waiting[0][1] + holdback <= now or running == 0
+        ):
+            yield heapq.heappop(waiting)[0]
+
+        if lines.empty() or now - last_flush >= holdback:
+            last_flush = now
+            yield None
+
+
+class RotatingGzipWriter:
+    """Saves log lines to compressed files, starting a new file when the current
+    one gets too large and deleting the oldest files beyond a limit.
+    """
+
+    def __init__(self, directory: Path, name: str, max_bytes: int, keep: int):
+        """
+        :param directory: The directory to write files to
+        :param name: The name of the log, used to name the files
+        :param max_bytes: The number of uncompressed bytes written to a file
+            before a new one is started
+        :param keep: The number of old files to keep
+        """
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.keep = keep
+
+        self._file: Optional[gzip.GzipFile] = None
+        self._written = 0
+
+    @property
+    def current_path(self) -> Path:
+        return self.directory / f"{self.name}.log.gz"
+
+    def write(self, data: bytes) -> None:
+        file_ = self._file
+        if file_ is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Appending adds a new gzip member, which readers handle
+            # transparently
+            file_ = gzip.GzipFile(self.current_path, "ab")
+            self._file = file_
+        file_.write(data)
+        self._written += len(data)
+
+        if self._written >= self.max_bytes:
+            self._rotate()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        self._written = 0
+
+        suffix = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.current_path.rename(
+            self.directory / f"{self.name}.{suffix}.log.gz"
+        )
+
+        rotated = sorted(self.directory.glob(f"{self.name}.*.log.gz"))
+        for old_path in rotated[: max(len(rotated) - self.keep, 0)]:
+            old_path.unlink()
+
+
+def _demultiplex(response: IO[bytes]) -> Iterator[bytes]:
+    """Splits a multiplexed stdout and stderr stream into lines"""
+    partial: Dict[int, bytes] = {}
+    while True:
+        header = response.read(_FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            break
+        stream, size = _FRAME_HEADER.unpack(header)
+        payload = partial.pop(stream, b"") + response.read(size)
+
+        lines = payload.split(b"\n")
+        for line in lines[:-1]:
+            yield line + b"\n"
+        if len(lines[-1]) > 0:
+            partial[stream] = lines[-1]
+
+    for remaining in partial.values():
+        yield remaining
+
+
+def _sort_key(timestamp: bytes) -> Tuple[bytes, int]:
+    """Turns a timestamp like "2021-03-04T05:06:07.123Z" into something that
+    can be compared with other timestamps, without parsing the date
+    """
+    seconds, _, fraction = timestamp.rstrip(b"Z").partition(b".")
+    nanoseconds = int(fraction.ljust(9, b"0")[:9] or b"0")
+    return seconds, nanoseconds
+
+
+def _start_reader(
+    source: LogSource,
+    level: Optional[Pattern[bytes]],
+    params: Dict[str, object],
+) -> "queue.Queue[Optional[LogLine]]":
+    lines: "queue.Queue[Optional[LogLine]]" = queue.Queue(maxsize=_QUEUE_SIZE)
+    Thread(
+        target=_read_into, args=(lines, source, level, params), daemon=True
+    ).start()
+    return lines
+
+
+def _read_into(
+    lines: "queue.Queue[Optional[LogLine]]",
+    source: LogSource,
+    level: Optional[Pattern[bytes]],
+    params: Dict[str, object],
+) -> None:
+    """Reads a container's log into a queue, followed by None once it ends"""
+    try:
+        for line in stream_lines(source, level, **params):
+            lines.put(line)
+    except docker_api.DockerAPIError:
+        # The container was removed while its log was being read
+        pass
+    finally:
+        lines.put(None)
+
+
+def _drain(lines: "queue.Queue[Optional[LogLine]]") -> Iterator[LogLine]:
+    while True:
+        line = lines.get()
+        if line is None:
+            return
+        yield line
@@ -0,0 +1,216 @@
+import json
+import time
+from threading import Lock
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import docker_api
+
+
+class ServiceStats(NamedTuple):
+    """Resource usage of one service's container over an interval"""
+
+    service: str
+    container: str
+    timestamp: float
+    """The Unix time that the interval ended at"""
+    samples: int
+    """The number of samples that were received during the interval"""
+    cpu_percent: float
+    """The average CPU usage over the interval, where 100% is one core"""
+    cpu_percent_max: float
+    memory_bytes: int
+    memory_limit_bytes: int
+    network_receive_bytes: int
+    network_transmit_bytes: int
+    block_read_bytes: int
+    block_write_bytes: int
+
+
+class _ContainerAccumulator:
+    """Keeps the latest values and interval statistics for one container. Its
+    size doesn't grow with the number of samples.
+    """
+
+    def __init__(self, service: str, container: str):
+        self.service = service
+        self.container = container
+        self.samples = 0
+        self.cpu_total = 0.0
+        self.cpu_max = 0.0
+        self.memory_bytes = 0
+        self.memory_limit_bytes = 0
+        self.network_bytes = (0, 0)
+        self.block_io_bytes = (0, 0)
+
+    def add(self, stats: dict) -> None:
+        cpu = docker_api.cpu_percent(stats)
+        self.samples += 1
+        self.cpu_total += cpu
+        self.cpu_max = max(self.cpu_max, cpu)
+        self.memory_bytes, self.memory_limit_bytes = docker_api.memory_usage(
+            stats
+        )
+        self.network_bytes = docker_api.network_bytes(stats)
+        self.block_io_bytes = docker_api.block_io_bytes(stats)
+
+    def collect(self, timestamp: float) -> ServiceStats:
+        """Summarizes the interval and starts a new one"""
+        result = ServiceStats(
+            service=self.service,
+            container=self.container,
+            timestamp=timestamp,
+            samples=self.samples,
+            cpu_percent=(
+                self.cpu_total / self.samples if self.samples > 0 else 0.0
+            ),
+            cpu_percent_max=self.cpu_max,
+            memory_bytes=self.memory_bytes,
+            memory_limit_bytes=self.memory_limit_bytes,
+            network_receive_bytes=self.network_bytes[0],
+            network_transmit_bytes=self.network_bytes[1],
+            block_read_bytes=self.block_io_bytes[0],
+            block_write_bytes=self.block_io_bytes[1],
+        )
+        self.samples = 0
+        self.cpu_total = 0.0
+        self.cpu_max = 0.0
+        return result
+
+
+class StatsAggregator:
+    """Aggregates samples from the Docker stats streams of multiple containers.
+    Samples may be added from multiple threads at once.
+    """
+
+    def __init__(self) -> None:
+        self._containers: Dict[str, _ContainerAccumulator] = {}
+        """Accumulators by container ID. Services that are scaled up have
+        more than one container, each with its own counters.
+        """
+        self._lock = Lock()
+
+    def add(
+        self, container_id: str, service: str, container: str, stats: dict
+    ) -> None:
+        """Adds a sample from a container's stats stream"""
+        with self._lock:
+            accumulator = self._containers.get(container_id)
+            if accumulator is None:
+                accumulator = _ContainerAccumulator(service, container)
+                self._containers[container_id] = accumulator
+            accumulator.add(stats)
+
+    def container_ids(self) -> List[str]:
+        """
+        :return: The ID of every container that is being reported
+        """
+        with self._lock:
+            return list(self._containers)
+
+    def remove(self, container_id: str) -> None:
+        """Stops reporting a container, like when it's removed"""
+        with self._lock:
+            self._containers.pop(container_id, None)
+
+    def collect(self, timestamp: Optional[float] = None) -> List[ServiceStats]:
+        """Summarizes every service's usage since the last call, and starts a
+        new interval.
+
+        :param timestamp: The time that the interval ended at. Defaults to now.
+        :return: The usage of each container, sorted by service and container
+            name
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            accumulators = sorted(
+                self._containers.values(),
+                key=lambda a: (a.service, a.container),
+            )
+            return [a.collect(timestamp) for a in accumulators]
+
+
+def to_prometheus(stats: Iterable[ServiceStats]) -> str:
+    """Formats usage in the Prometheus text exposition format, as expected by
+    the node exporter's textfile collector.
+    """
+    stats = list(stats)
+    lines: List[str] = []
+    for name, metric_type, help_text, field in _PROMETHEUS_METRICS:
+        metric = f"brainframe_container_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for service_stats in stats:
+            labels = (
+                f'service="{_escape_label(service_stats.service)}",'
+                f'container="{_escape_label(service_stats.container)}"'
+            )
+            value = getattr(service_stats, field)
+            lines.append(f"{metric}{{{labels}}} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def to_ndjson(stats: Iterable[ServiceStats]) -> str:
+    """Formats usage as newline-delimited JSON, with one object per service"""
+    return "".join(json.dumps(s._asdict()) + "\n" for s in stats)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_PROMETHEUS_METRICS = [
+    (
+        "cpu_percent",
+        "gauge",
+        "Average CPU usage over the last interval, where 100 is one core",
+        "cpu_percent",
+    ),
+    (
+        "cpu_percent_max",
+        "gauge",
+        "Highest CPU usage sampled during the last interval",
+        "cpu_percent_max",
+    ),
+    (
+        "memory_usage_bytes",
+        "gauge",
+        "Memory used, not counting the page cache",
+        "memory_bytes",
+    ),
+    (
+        "memory_limit_bytes",
+        "gauge",
+        "The container's memory limit",
+        "memory_limit_bytes",
+    ),
+    (
+        "network_receive_bytes_total",
+        "counter",
+        "Bytes received over every network interface",
+        "network_receive_bytes",
+    ),
+    (
+        "network_transmit_bytes_total",
+        "counter",
+        "Bytes transmitted over every network interface",
+        "network_transmit_bytes",
+    ),
+    (
+        "block_read_bytes_total",
+        "counter",
+        "Bytes read from block devices",
+        "block_read_bytes",
+    ),
+    (
+        "block_write_bytes_total",
+        "counter",
+        "Bytes written to block devices",
+        "block_write_bytes",
+    ),
+]
+"""The name, type, help text and ServiceStats field of each exported metric"""
@@ -0,0 +1,213 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from pathlib import Path
+from threading import Event
+from threading import Lock
+from threading import Thread
+from typing import List
+from typing import Optional
+
+from . import frozen_utils
+from . import parallel_walk
+from . import print_utils
+
+TRASH_MARKER = ".brainframe-trash-"
+"""Part of the name given to trees that have been moved to the trash"""
+
+_PROGRESS_INTERVAL = 1
+"""How often, in seconds, deletion progress is printed"""
+
+_LOG_FILE_NAME = "brainframe-delete-trash-{uid}.log"
+"""The file that deletions running in the background write their output to,
+kept in the temporary directory
+"""
+
+
+def delete(paths: List[Path], wait: bool = False) -> None:
+    """Deletes directory trees. Each tree is first renamed to a trash location
+    next to it, so it disappears immediately. The trash is then deleted by a
+    background process at a low I/O priority, unless `wait` is True.
+
+    Trees that can't be renamed, like mount points, are deleted in place in
+    the foreground.
+
+    Trash left next to the trees by earlier deletions that didn't finish,
+    like ones stopped by a reboot, is deleted along with them.
+
+    :param paths: The directory trees to delete
+    :param wait: If True, the trees are deleted before this function returns
+    """
+    trash_paths = _leftover_trash(paths)
+    for path in paths:
+        trash_path = move_to_trash(path)
+        if trash_path is None:
+            delete_tree(path, show_progress=True)
+        else:
+            trash_paths.append(trash_path)
+
+    if len(trash_paths) == 0:
+        return
+
+    if wait:
+        for trash_path in trash_paths:
+            delete_tree(trash_path, show_progress=True)
+    else:
+        log_path = _delete_in_background(trash_paths)
+        print_utils.translate(
+            "general.deleting-in-background",
+            paths=", ".join(str(p) for p in trash_paths),
+            log_path=log_path,
+        )
+
+
+def move_to_trash(path: Path) -> Optional[Path]:
+    """Atomically renames a tree to a trash location in the same directory.
+
+    :param path: The tree to move
+    :return: The new location of the tree, or None if it could not be renamed
+    """
+    trash_path = path.with_name(
+        f".{path.name}{TRASH_MARKER}{uuid.uuid4().hex[:8]}"
+    )
+    try:
+        path.rename(trash_path)
+    except OSError:
+        # Renaming doesn't work for mount points and some filesystems
+        return None
+
+    return trash_path
+
+
+def delete_tree(
+    path: Path, workers: Optional[int] = None, show_progress: bool = False
+) -> None:
+    """Deletes a directory tree, unlinking files on multiple threads.
+
+    :param path: The tree to delete
+    :param workers: The number of threads to delete files with
+    :param show_progress: If True, the number of deleted files is periodically
+        printed
+    """
+    if not path.is_symlink() and not path.exists():
+        # Already deleted, like by another deletion of leftover trash
+        return
+    if path.is_symlink() or not path.is_dir():
+        path.unlink()
+        return
+
+    directories: List[str] = []
+    deleted = 0
+    lock = Lock()
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        nonlocal deleted
+
+        subdirectories: List[str] = []
+        deleted_here = 0
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+                continue
+            try:
+                os.unlink(entry.path)
+                deleted_here += 1
+            except FileNotFoundError:
+                pass
+
+        with lock:
+            directories.append(directory)
+            deleted += deleted_here
+        return subdirectories
+
+    finished = Event()
+
+    def print_progress() -> None:
+        while not finished.wait(_PROGRESS_INTERVAL):
+            print_utils.translate(
+                "general.deletion-progress", path=path, deleted=deleted
+            )
+
+    if show_progress:
+        Thread(target=print_progress, daemon=True).start()
+
+    try:
+        parallel_walk.walk([str(path)], visit, workers=workers)
+
+        # Directories can only be removed once they're empty, so the deepest
+        # ones go first
+        directories.sort(key=lambda d: d.count(os.sep), reverse=True)
+        for directory in directories:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # This will be dealt with below
+                pass
+    finally:
+        finished.set()
+
+    if path.exists():
+        # Something couldn't be deleted in parallel, like a file without
+        # permissions. Fall back to deleting it normally, which will raise an
+        # error explaining what went wrong.
+        shutil.rmtree(path)
+
+    if show_progress:
+        print_utils.translate(
+            "general.deletion-complete", path=path, deleted=deleted
+        )
+
+
+def background_log_path() -> Path:
+    """
+    :return: The file that deletions running in the background write their
+        output and errors to
+    """
+    return Path(tempfile.gettempdir()) / _LOG_FILE_NAME.format(uid=os.getuid())
+
+
+def _delete_in_background(trash_paths: List[Path]) -> Path:
+    """Starts a detached copy of the CLI that deletes the given trash paths. It
+    keeps running if this process exits.
+
+    :return: The file the deletion's output and errors are written to
+    """
+    log_path = background_log_path()
+    with log_path.open("a") as log_file:
+        subprocess.Popen(
+            frozen_utils.self_command()
+            + ["delete-trash"]
+            + [str(p) for p in trash_paths],
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            # Keep escape codes out of the log
+            env={**os.environ, "NO_COLOR": "1"},
+            start_new_session=True,
+            close_fds=True,
+        )
+    return log_path
+
+
+def _leftover_trash(paths: List[Path]) -> List[Path]:
+    """
+    :return: Trash in the directories that the given paths are in
+    """
+    trash_paths: List[Path] = []
+    for parent in sorted({p.absolute().parent for p in paths}):
+        try:
+            siblings = list(parent.iterdir())
+        except OSError:
+            continue
+        trash_paths += sorted(s for s in siblings if is_trash(s))
+    return trash_paths
+
+
+def is_trash(path: Path) -> bool:
+    """
+    :return: True if the given path is a tree that was moved to the trash by
+        `move_to_trash`
+    """
+    return TRASH_MARKER in path.name and path.name.startswith(".")
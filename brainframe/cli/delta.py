@@ -0,0 +1,235 @@
+import hashlib
+import lzma
+import struct
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from packaging import version
+
+_MAGIC = b"BFDELTA1"
+_HEADER = struct.Struct(">8sQ32s32s")
+"""The magic bytes, the new file's size, and the SHA-256 of the old and new
+files
+"""
+
+_COPY = 0
+_DATA = 1
+_COPY_OP = struct.Struct(">BQQ")
+"""The operation, then the offset and length of the range of the old file"""
+_DATA_OP = struct.Struct(">BQ")
+"""The operation, then the number of bytes that follow"""
+
+_INDEX_STRIDE = 64
+"""The distance between the positions of the old file that are indexed. A run
+of matching bytes has to be longer than this to be sure to be found.
+"""
+_KEY_LENGTH = 32
+"""The number of bytes at each indexed position that are used to find it"""
+_MIN_MATCH = 64
+"""Matches shorter than this cost more as a COPY operation than as data"""
+_COMPARE_CHUNK = 4096
+
+
+class PatchError(Exception):
+    """Raised when a patch is malformed or doesn't apply to the given file"""
+
+
+class PatchInfo(NamedTuple):
+    from_version: str
+    to_version: str
+    file_name: str
+    size: int
+    sha256: str
+    """The SHA-256 of the patch file itself"""
+
+
+def make_patch(old: bytes, new: bytes) -> bytes:
+    """Makes a binary patch between two releases, so that self-updates only
+    download what changed.
+
+    A patch is a header followed by an LZMA compressed list of operations
+    that build the new file. COPY operations copy a range of the old file, and
+    DATA operations carry bytes that aren't in the old file. Most of a
+    PyInstaller binary is the same from one release to the next, just moved
+    around, so most of a patch is COPY operations.
+
+    :param old: The contents of the file the patch will be applied to
+    :param new: The contents the patched file should have
+    :return: A patch that turns old into new
+    """
+    index: Dict[bytes, int] = {}
+    for offset in range(0, len(old) - _KEY_LENGTH + 1, _INDEX_STRIDE):
+        index.setdefault(old[offset : offset + _KEY_LENGTH], offset)
+
+    ops: List[bytes] = []
+    literal_start = 0
+    position = 0
+    while position <= len(new) - _KEY_LENGTH:
+        found = index.get(new[position : position + _KEY_LENGTH])
+        if found is None:
+            position += 1
+            continue
+        offset = found
+        length = _match_length(old, offset, new, position)
+
+        # The match may have started before the indexed position
+        back = 0
+        while (
+            back < position - literal_start
+            and back < offset
+            and old[offset - back - 1] == new[position - back - 1]
+        ):
+            back += 1
+        if length + back < _MIN_MATCH:
+            position += 1
+            continue
+
+        _add_data(ops, new[literal_start : position - back])
+        ops.append(
+            _COPY_OP.pack(_COPY, offset - back, length + back),
+        )
+        position += length
+        literal_start = position
+    _add_data(ops, new[literal_start:])
+
+    header = _HEADER.pack(
+        _MAGIC,
+        len(new),
+        hashlib.sha256(old).digest(),
+        hashlib.sha256(new).digest(),
+    )
+    return header + lzma.compress(b"".join(ops))
+
+
+def apply_patch(old: bytes, patch: bytes) -> bytes:
+    """
+    :param old: The contents of the file to patch
+    :param patch: A patch made by make_patch
+    :return: The patched contents
+    :raises PatchError: If the patch is malformed, was made for a different
+        file, or doesn't produce the file it was made for
+    """
+    if len(patch) < _HEADER.size:
+        raise PatchError("The patch is truncated")
+    magic, size, old_digest, new_digest = _HEADER.unpack_from(patch)
+    if magic != _MAGIC:
+        raise PatchError("The file is not a patch")
+    if hashlib.sha256(old).digest() != old_digest:
+        raise PatchError("The patch was made for a different file")
+
+    try:
+        ops = lzma.decompress(patch[_HEADER.size :])
+    except lzma.LZMAError as exc:
+        raise PatchError(f"The patch is corrupted: {exc}")
+
+    new = bytearray()
+    position = 0
+    while position < len(ops):
+        if ops[position] == _COPY:
+            _, offset, length = _COPY_OP.unpack_from(ops, position)
+            position += _COPY_OP.size
+            new += old[offset : offset + length]
+        elif ops[position] == _DATA:
+            _, length = _DATA_OP.unpack_from(ops, position)
+            position += _DATA_OP.size
+            new += ops[position : position + length]
+            position += length
+        else:
+            raise PatchError(f"Unknown patch operation {ops[position]}")
+
+    if len(new) != size or hashlib.sha256(new).digest() != new_digest:
+        raise PatchError("The patched file doesn't match the expected result")
+    return bytes(new)
+
+
+def parse_index(index: dict) -> List[PatchInfo]:
+    """
+    :param index: The decoded index.json published next to the patches
+    :return: Every patch in the index
+    """
+    return [
+        PatchInfo(
+            from_version=entry["from"],
+            to_version=entry["to"],
+            file_name=entry["file"],
+            size=entry["size"],
+            sha256=entry["sha256"],
+        )
+        for entry in index.get("patches", [])
+    ]
+
+
+def add_to_index(index: dict, patch: PatchInfo) -> dict:
+    """
+    :return: A copy of the index with the patch added, replacing any patch
+        from the same version
+    """
+    patches = [
+        entry
+        for entry in index.get("patches", [])
+        if entry["from"] != patch.from_version
+    ]
+    patches.append(
+        {
+            "from": patch.from_version,
+            "to": patch.to_version,
+            "file": patch.file_name,
+            "size": patch.size,
+            "sha256": patch.sha256,
+        }
+    )
+    return {**index, "patches": patches}
+
+
+def find_chain(
+    patches: List[PatchInfo], from_version: str, to_version: str
+) -> Optional[List[PatchInfo]]:
+    """Versions are compared by what they mean rather than how they're
+    written, so "1.2" and "1.2.0" are the same version.
+
+    :return: The patches that, applied in order, update from_version to
+        to_version, or None if there's a gap
+    """
+    by_source = {version.parse(p.from_version): p for p in patches}
+    chain: List[PatchInfo] = []
+    current = version.parse(from_version)
+    target = version.parse(to_version)
+    while current != target:
+        patch = by_source.get(current)
+        if patch is None or len(chain) > len(patches):
+            return None
+        chain.append(patch)
+        current = version.parse(patch.to_version)
+    return chain
+
+
+def _match_length(
+    old: bytes, old_offset: int, new: bytes, new_offset: int
+) -> int:
+    """
+    :return: The number of bytes that are the same in both files, starting
+        at the given offsets
+    """
+    length = 0
+    limit = min(len(old) - old_offset, len(new) - new_offset)
+    while length < limit:
+        chunk = min(_COMPARE_CHUNK, limit - length)
+        old_chunk = old[old_offset + length : old_offset + length + chunk]
+        new_chunk = new[new_offset + length : new_offset + length + chunk]
+        if old_chunk == new_chunk:
+            length += chunk
+            continue
+        for old_byte, new_byte in zip(old_chunk, new_chunk):
+            if old_byte != new_byte:
+                break
+            length += 1
+        break
+    return length
+
+
+def _add_data(ops: List[bytes], data: bytes) -> None:
+    if len(data) > 0:
+        ops.append(_DATA_OP.pack(_DATA, len(data)))
+        ops.append(data)
@@ -0,0 +1,326 @@
+import json
+import os
+import sqlite3
+import stat
+from pathlib import Path
+from threading import Lock
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from . import parallel_walk
+from . import walk_index
+
+INDEX_FILE_NAME = "disk-usage.sqlite3"
+"""The name of the index of directory sizes, which is kept in the install
+path
+"""
+
+BACKUPS_DIRECTORY = "backups"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirectories TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    apparent_bytes INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    linked TEXT NOT NULL
+);
+"""
+
+Inode = Tuple[int, int]
+"""A file's device and inode number, which identify it across hard links"""
+
+
+class DirectoryUsage(NamedTuple):
+    mtime_ns: int
+    subdirectories: List[str]
+    bytes: int
+    """The space taken up on disk by the directory itself and the files in it
+    that have only one link
+    """
+    apparent_bytes: int
+    """The size of the files in the directory that have only one link"""
+    files: int
+    """The number of files in the directory, including linked files"""
+    linked: List[Tuple[int, int, int, int]]
+    """The device, inode number, size on disk and apparent size of each file
+    in the directory that has more than one link
+    """
+
+
+class GroupUsage(NamedTuple):
+    name: str
+    """The service directory, or "backups/" followed by a backup's name"""
+    bytes: int
+    """The space taken up by the group, counting each file once"""
+    exclusive_bytes: int
+    """The space that would be freed by deleting the group. Files that are
+    hard linked from other groups, like unchanged files in a backup, aren't
+    included.
+    """
+    apparent_bytes: int
+    exclusive_apparent_bytes: int
+    files: int
+
+
+class UsageReport(NamedTuple):
+    groups: List[GroupUsage]
+    bytes: int
+    """The space taken up by the whole tree, counting each file once"""
+    apparent_bytes: int
+    files: int
+    scanned: int
+    """The number of directories that were read"""
+    cached: int
+    """The number of directories that were taken from the index"""
+    errors: List[OSError]
+
+
+def index_path(install_path: Path) -> Path:
+    return install_path / INDEX_FILE_NAME
+
+
+def scan(
+    path: Path,
+    index: Optional[Path],
+    workers: Optional[int] = None,
+    full: bool = False,
+) -> UsageReport:
+    """Measures the space a directory tree takes up, broken down by the
+    directories at its top level, and by each backup in its backups
+    directory.
+
+    Directories are read on multiple threads. With an index, directories
+    whose modification time hasn't changed since the last scan aren't read at
+    all. Their sizes are taken from the index instead. A file that grows
+    without being replaced doesn't change its directory's modification time,
+    so a full scan now and then picks up those changes.
+
+    :param path: The directory tree to measure
+    :param index: The path of the index database, or None to read every
+        directory
+    :param workers: The number of threads to read directories with
+    :param full: If True, every directory is read, and the index is rebuilt
+    :return: How much space the tree takes up
+    """
+    known = {} if index is None else _load_index(index)
+    cache = walk_index.DirectoryCache(
+        path, {d: (u.mtime_ns, u.subdirectories) for d, u in known.items()}
+    )
+
+    lock = Lock()
+    usage: Dict[str, DirectoryUsage] = {}
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        relative_dir = cache.relative(directory)
+        own = os.lstat(directory)
+        subdirectories = []
+        size_on_disk = own.st_blocks * 512
+        apparent_size = 0
+        files = 0
+        linked = []
+        for entry in entries:
+            try:
+                entry_stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                # Deleted since the directory was read
+                continue
+            if stat.S_ISDIR(entry_stat.st_mode):
+                subdirectories.append(entry.name)
+                continue
+            files += 1
+            if entry_stat.st_nlink > 1:
+                linked.append(
+                    (
+                        entry_stat.st_dev,
+                        entry_stat.st_ino,
+                        entry_stat.st_blocks * 512,
+                        entry_stat.st_size,
+                    )
+                )
+            else:
+                size_on_disk += entry_stat.st_blocks * 512
+                apparent_size += entry_stat.st_size
+
+        with lock:
+            usage[relative_dir] = DirectoryUsage(
+                mtime_ns=cache.mtimes.get(relative_dir, own.st_mtime_ns),
+                subdirectories=subdirectories,
+                bytes=size_on_disk,
+                apparent_bytes=apparent_size,
+                files=files,
+                linked=linked,
+            )
+        return [os.path.join(directory, name) for name in subdirectories]
+
+    errors = parallel_walk.walk(
+        [str(path)],
+        visit,
+        workers=workers,
+        cached=None if index is None or full else cache,
+    )
+
+    if index is not None:
+        _save_index(index, list(set(cache.seen) | set(usage)), usage)
+
+    # Directories that weren't read, either because they didn't change or
+    # because they couldn't be, count what the index already knew about them
+    all_usage = {
+        d: known[d] for d in cache.seen if d in known and d not in usage
+    }
+    all_usage.update(usage)
+
+    groups, totals = _summarize(all_usage)
+    return UsageReport(
+        groups=groups,
+        bytes=totals[0],
+        apparent_bytes=totals[1],
+        files=totals[2],
+        scanned=len(usage),
+        cached=len(all_usage) - len(usage),
+        errors=errors,
+    )
+
+
+def group_name(relative_dir: str) -> str:
+    """
+    :return: The group that a directory's usage is counted towards
+    """
+    parts = Path(relative_dir).parts
+    if len(parts) == 0:
+        return "."
+    if parts[0] == BACKUPS_DIRECTORY and len(parts) > 1:
+        return f"{parts[0]}/{parts[1]}"
+    return parts[0]
+
+
+def _summarize(
+    usage: Dict[str, DirectoryUsage],
+) -> Tuple[List[GroupUsage], Tuple[int, int, int]]:
+    """Adds up the usage of each group. Each linked file is counted once per
+    group, and once in the total.
+    """
+    own: Dict[str, List[int]] = {}
+    linked_by_group: Dict[str, Dict[Inode, Tuple[int, int]]] = {}
+    groups_by_inode: Dict[Inode, Set[str]] = {}
+    for relative_dir, directory_usage in usage.items():
+        group = group_name(relative_dir)
+        totals = own.setdefault(group, [0, 0, 0])
+        totals[0] += directory_usage.bytes
+        totals[1] += directory_usage.apparent_bytes
+        totals[2] += directory_usage.files
+
+        group_linked = linked_by_group.setdefault(group, {})
+        for (
+            device,
+            inode,
+            size_on_disk,
+            apparent_size,
+        ) in directory_usage.linked:
+            group_linked[(device, inode)] = (size_on_disk, apparent_size)
+            groups_by_inode.setdefault((device, inode), set()).add(group)
+
+    groups = []
+    for group, (size_on_disk, apparent_size, files) in sorted(own.items()):
+        group_linked = linked_by_group[group]
+        exclusive = [
+            sizes
+            for inode, sizes in group_linked.items()
+            if len(groups_by_inode[inode]) == 1
+        ]
+        groups.append(
+            GroupUsage(
+                name=group,
+                bytes=size_on_disk + sum(s[0] for s in group_linked.values()),
+                exclusive_bytes=size_on_disk + sum(s[0] for s in exclusive),
+                apparent_bytes=(
+                    apparent_size + sum(s[1] for s in group_linked.values())
+                ),
+                exclusive_apparent_bytes=(
+                    apparent_size + sum(s[1] for s in exclusive)
+                ),
+                files=files,
+            )
+        )
+
+    all_linked: Dict[Inode, Tuple[int, int]] = {}
+    for group_linked in linked_by_group.values():
+        all_linked.update(group_linked)
+    overall = (
+        sum(t[0] for t in own.values())
+        + sum(s[0] for s in all_linked.values()),
+        sum(t[1] for t in own.values())
+        + sum(s[1] for s in all_linked.values()),
+        sum(t[2] for t in own.values()),
+    )
+    return groups, overall
+
+
+def _load_index(index: Path) -> Dict[str, DirectoryUsage]:
+    if not index.is_file():
+        return {}
+    try:
+        with walk_index.connect(index, _SCHEMA) as connection:
+            return {
+                row[0]: DirectoryUsage(
+                    mtime_ns=row[1],
+                    subdirectories=json.loads(row[2]),
+                    bytes=row[3],
+                    apparent_bytes=row[4],
+                    files=row[5],
+                    linked=[tuple(f) for f in json.loads(row[6])],
+                )
+                for row in connection.execute(
+                    "SELECT path, mtime_ns, subdirectories, bytes, "
+                    "apparent_bytes, files, linked FROM directories"
+                )
+            }
+    except (sqlite3.Error, ValueError):
+        # A damaged index only makes this scan slower
+        return {}
+
+
+def _save_index(
+    index: Path, seen: List[str], changed: Dict[str, DirectoryUsage]
+) -> None:
+    """Saves the directories that were read, and forgets directories that no
+    longer exist. Users without write access to the index still get correct
+    results, they just aren't saved for next time.
+    """
+    if not os.access(index.parent, os.W_OK) or (
+        index.exists() and not os.access(index, os.W_OK)
+    ):
+        return
+
+    is_new = not index.exists()
+    try:
+        with walk_index.connect(index, _SCHEMA) as connection:
+            walk_index.forget_unseen(connection, seen, "directories")
+            connection.executemany(
+                "INSERT OR REPLACE INTO directories "
+                "(path, mtime_ns, subdirectories, bytes, apparent_bytes, "
+                "files, linked) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        directory,
+                        u.mtime_ns,
+                        json.dumps(u.subdirectories),
+                        u.bytes,
+                        u.apparent_bytes,
+                        u.files,
+                        json.dumps(u.linked),
+                    )
+                    for directory, u in changed.items()
+                ],
+            )
+    except sqlite3.Error:
+        return
+
+    if is_new:
+        walk_index.share_with_group(index)
@@ -0,0 +1,445 @@
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import urlencode
+
+from . import tracing
+
+DEFAULT_SOCKET_PATH = "/var/run/docker.sock"
+
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+
+
+class DockerAPIError(Exception):
+    """Raised when the Docker daemon can't be reached or responds with an
+    error
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket"""
+
+    def __init__(self, socket_path: str, timeout: Optional[float]):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerClient:
+    """A small client for the Docker Engine API that talks to the daemon over
+    its Unix socket. Connections are kept open and reused between requests, and
+    the client may be used from multiple threads at once.
+
+    This only covers the read-only parts of the API that the CLI needs. Anything
+    that changes state still goes through the docker and Docker Compose
+    commands.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        timeout: Optional[float] = 10,
+        max_idle_connections: int = 8,
+    ):
+        """
+        :param socket_path: The path to the Docker daemon's socket. Defaults to
+            the path in $DOCKER_HOST if it's a Unix socket, or the standard
+            socket location if $DOCKER_HOST isn't set. Other kinds of
+            $DOCKER_HOST are not supported, and requests will fail.
+        :param timeout: The timeout for connecting and for each read, in
+            seconds
+        :param max_idle_connections: The number of unused connections to keep
+            open for later requests
+        """
+        self.socket_path = socket_path or _default_socket_path()
+        """The path to the daemon's socket, or None if it isn't available over
+        a Unix socket
+        """
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[_UnixHTTPConnection]" = queue.LifoQueue(
+            maxsize=max_idle_connections
+        )
+
+    def available(self) -> bool:
+        """
+        :return: True if the Docker daemon can be reached
+        """
+        try:
+            self.ping()
+        except DockerAPIError:
+            return False
+        return True
+
+    def ping(self) -> None:
+        """Checks that the Docker daemon is up and that we have permission to
+        talk to it.
+
+        :raises DockerAPIError: If the daemon can't be reached
+        """
+        self._request("GET", "/_ping")
+
+    def get_json(self, path: str, **params: Any) -> Any:
+        """Makes a GET request and decodes the JSON response.
+
+        :param path: The API path, like "/containers/json"
+        :param params: Query parameters. Dicts and lists are sent as JSON.
+        :return: The decoded response
+        """
+        return json.loads(self._request("GET", path, params))
+
+    def containers(
+        self,
+        labels: Optional[Dict[str, str]] = None,
+        include_stopped: bool = True,
+    ) -> List[dict]:
+        """Lists containers.
+
+        :param labels: If provided, only containers with all of these label
+            values are listed
+        :param include_stopped: If True, stopped containers are listed as well
+        :return: A summary of each container, as returned by the API
+        """
+        filters = {}
+        if labels is not None:
+            filters["label"] = [f"{k}={v}" for k, v in labels.items()]
+
+        return self.get_json(
+            "/containers/json", all=include_stopped, filters=filters
+        )
+
+    def inspect_container(self, container_id: str) -> dict:
+        return self.get_json(f"/containers/{container_id}/json")
+
+    def images(self) -> List[dict]:
+        return self.get_json("/images/json")
+
+    def inspect_image(self, name: str) -> dict:
+        return self.get_json(f"/images/{name}/json")
+
+    def info(self) -> dict:
+        return self.get_json("/info")
+
+    def container_stats(self, container_id: str) -> dict:
+        """Gets a single resource usage sample for a container. The daemon takes
+        about a second to respond, so that CPU usage can be measured over an
+        interval.
+        """
+        return self.get_json(f"/containers/{container_id}/stats", stream=False)
+
+    @contextmanager
+    def stream(
+        self, path: str, **params: Any
+    ) -> Iterator[http.client.HTTPResponse]:
+        """Makes a GET request whose response is read as it arrives, like
+        those for log and stats streams. A dedicated connection is used, and
+        closed when the context exits.
+
+        :param path: The API path
+        :param params: Query parameters. Dicts and lists are sent as JSON.
+        :return: The response, with its status already checked
+        :raises DockerAPIError: If the daemon can't be reached, or the
+            connection fails while the response is being read
+        """
+        connection = _UnixHTTPConnection(self._socket_path(), timeout=None)
+        try:
+            try:
+                response = self._send(connection, "GET", path, params)
+            except (http.client.RemoteDisconnected, BrokenPipeError):
+                # Unlike in _request, the connection is never reused, so
+                # there's nothing to retry
+                raise DockerAPIError("The Docker daemon closed the connection")
+            if response.status >= 400:
+                raise _error_from_response(response)
+            try:
+                yield response
+            except (OSError, http.client.HTTPException) as exc:
+                # The stream was cut off while it was being read
+                raise DockerAPIError(
+                    f"Error reading from the Docker daemon: {exc}"
+                )
+        finally:
+            connection.close()
+
+    def stream_json(self, path: str, **params: Any) -> Iterator[Any]:
+        """Makes a GET request to an endpoint that streams JSON objects, one per
+        line, and decodes each object as it arrives.
+
+        :param path: The API path
+        :param params: Query parameters. Dicts and lists are sent as JSON.
+        :return: An iterator of decoded objects, which ends when the daemon
+            closes the stream
+        """
+        with self.stream(path, **params) as response:
+            for line in response:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    value = json.loads(line)
+                except ValueError as exc:
+                    raise DockerAPIError(
+                        f"Invalid response from the Docker daemon: {exc}"
+                    )
+                yield value
+
+    def _request(
+        self, method: str, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> bytes:
+        try:
+            connection = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            connection = _UnixHTTPConnection(self._socket_path(), self.timeout)
+            reused = False
+
+        try:
+            with tracing.span(f"{method} {_span_path(path)}", "docker-api"):
+                response = self._send(connection, method, path, params)
+                body = response.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise DockerAPIError("The Docker daemon closed the connection")
+            # The daemon closed an idle connection. Try again with a new one.
+            return self._request(method, path, params)
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            raise DockerAPIError(
+                f"Error reading from the Docker daemon: {exc}"
+            )
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+        if response.status >= 400:
+            raise _error_from_response(response, body)
+
+        return body
+
+    def _socket_path(self) -> str:
+        if self.socket_path is None:
+            raise DockerAPIError(
+                "Only Docker daemons listening on a Unix socket are supported"
+            )
+        return self.socket_path
+
+    @staticmethod
+    def _send(
+        connection: _UnixHTTPConnection,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+    ) -> http.client.HTTPResponse:
+        if params:
+            path += "?" + urlencode(
+                {k: _encode_param(v) for k, v in params.items()}
+            )
+
+        try:
+            connection.request(method, path)
+            return connection.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError):
+            raise
+        except (OSError, http.client.HTTPException) as exc:
+            raise DockerAPIError(
+                f"Could not reach the Docker daemon at "
+                f"{connection.socket_path}: {exc}"
+            )
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parses a timestamp from the Docker API, like
+    "2021-03-04T05:06:07.123456789Z". Docker uses nanosecond precision, which
+    is truncated to microseconds.
+
+    :param value: The timestamp
+    :return: The parsed time, in UTC
+    """
+    match = _TIMESTAMP_PATTERN.match(value)
+    if match is None:
+        raise ValueError(f"Invalid Docker timestamp: {value}")
+
+    seconds, fraction, zone = match.groups()
+    parsed = datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S")
+    if fraction:
+        parsed = parsed.replace(microsecond=int(fraction[1:7].ljust(6, "0")))
+
+    if zone and zone != "Z":
+        sign = 1 if zone[0] == "+" else -1
+        hours, minutes = zone[1:].split(":")
+        offset = timedelta(hours=int(hours), minutes=int(minutes))
+        parsed -= sign * offset
+
+    return parsed.replace(tzinfo=timezone.utc)
+
+
+def cpu_percent(stats: dict) -> float:
+    """Calculates the CPU usage of a container the same way `docker stats`
+    does, where 100% is one fully used core.
+
+    :param stats: A sample from the container stats endpoint
+    :return: The CPU usage since the previous sample
+    """
+    cpu = stats.get("cpu_stats") or {}
+    previous = stats.get("precpu_stats") or {}
+
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - previous.get(
+        "cpu_usage", {}
+    ).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - previous.get(
+        "system_cpu_usage", 0
+    )
+    online_cpus = cpu.get("online_cpus") or len(
+        cpu.get("cpu_usage", {}).get("percpu_usage") or [None]
+    )
+
+    if cpu_delta <= 0 or system_delta <= 0:
+        return 0.0
+    return cpu_delta / system_delta * online_cpus * 100
+
+
+def memory_usage(stats: dict) -> Tuple[int, int]:
+    """Calculates the memory usage of a container the same way `docker stats`
+    does, which doesn't count the page cache.
+
+    :param stats: A sample from the container stats endpoint
+    :return: The memory used and the memory limit, in bytes
+    """
+    memory = stats.get("memory_stats") or {}
+    usage = memory.get("usage", 0)
+    details = memory.get("stats") or {}
+    # cgroup v1 reports "total_inactive_file", cgroup v2 "inactive_file"
+    cache = details.get("total_inactive_file", details.get("inactive_file", 0))
+    return max(usage - cache, 0), memory.get("limit", 0)
+
+
+def network_bytes(stats: dict) -> Tuple[int, int]:
+    """
+    :param stats: A sample from the container stats endpoint
+    :return: The total bytes received and transmitted over every network
+        interface since the container started
+    """
+    received = 0
+    transmitted = 0
+    for interface in (stats.get("networks") or {}).values():
+        received += interface.get("rx_bytes", 0)
+        transmitted += interface.get("tx_bytes", 0)
+    return received, transmitted
+
+
+def block_io_bytes(stats: dict) -> Tuple[int, int]:
+    """
+    :param stats: A sample from the container stats endpoint
+    :return: The total bytes read from and written to block devices since the
+        container started
+    """
+    read = 0
+    written = 0
+    entries = (stats.get("blkio_stats") or {}).get(
+        "io_service_bytes_recursive"
+    )
+    for entry in entries or []:
+        operation = entry.get("op", "").lower()
+        if operation == "read":
+            read += entry.get("value", 0)
+        elif operation == "write":
+            written += entry.get("value", 0)
+    return read, written
+
+
+def _span_path(path: str) -> str:
+    """Replaces container IDs in an API path, so that requests for different
+    containers are grouped together
+    """
+    parts = path.split("/")
+    if len(parts) > 3 and parts[1] == "containers":
+        parts[2] = "{id}"
+    return "/".join(parts)
+
+
+def _encode_param(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _error_from_response(
+    response: http.client.HTTPResponse, body: Optional[bytes] = None
+) -> DockerAPIError:
+    if body is None:
+        body = response.read()
+
+    try:
+        message = json.loads(body)["message"]
+    except (ValueError, KeyError, TypeError):
+        message = body.decode("utf-8", errors="replace")
+
+    return DockerAPIError(
+        f"Docker API error (HTTP {response.status}): {message}",
+        status=response.status,
+    )
+
+
+_TIMESTAMP_PATTERN = re.compile(
+    r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:\d{2})?$"
+)
+
+
+def _default_socket_path() -> Optional[str]:
+    docker_host = os.environ.get("DOCKER_HOST")
+    if docker_host is None:
+        return DEFAULT_SOCKET_PATH
+    if docker_host.startswith("unix://"):
+        return docker_host[len("unix://") :]
+    return None
+
+
+_client: Optional[DockerClient] = None
+
+
+def client() -> DockerClient:
+    """
+    :return: A client shared by the whole application, so that its connections
+        are reused
+    """
+    global _client
+    if _client is None:
+        _client = DockerClient()
+    return _client
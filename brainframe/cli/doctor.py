@@ -0,0 +1,276 @@
+import grp
+import os
+import shutil
+import stat
+import time
+from pathlib import Path
+from threading import Lock
+from typing import List
+from typing import Optional
+
+from . import brainframe_compose
+from . import checks
+from . import docker_api
+from . import history
+from . import os_utils
+from . import parallel_walk
+from . import print_utils
+
+INSTALL = "install"
+UPDATE = "update"
+BACKUP = "backup"
+OPERATIONS = [INSTALL, UPDATE, BACKUP]
+
+EXPECTED_INSTALL_IMAGE_BYTES = 8 * 1024 * 1024 * 1024
+"""Roughly how much disk space BrainFrame's images take up, for when no
+images have been pulled yet
+"""
+
+_DISK_CHECK_TIMEOUT = 30
+"""Measuring the data to back up may mean walking the whole data directory,
+so disk space checks get longer than the other checks
+"""
+
+
+def preflight_checks(
+    operation: Optional[str],
+    install_path: Path,
+    data_path: Path,
+    backup_path: Optional[Path] = None,
+) -> List[checks.Check]:
+    """
+    :param operation: One of OPERATIONS, or None to check what every
+        operation needs
+    :param install_path: The install path the operation will use
+    :param data_path: The data path the operation will use
+    :param backup_path: Where a backup will be written to, if not the default
+    :return: Checks for everything the operation needs
+    """
+    backup_path = backup_path or data_path / "backups"
+    # Install offers to install Docker and creates the BrainFrame group
+    # itself, and runs as root, so those can't stop it
+    installing = operation == INSTALL
+
+    result = [
+        checks.Check("Docker", lambda: _check_docker(installing), timeout=5),
+        checks.Check(
+            "Write access to install path",
+            lambda: _check_writable(install_path),
+        ),
+        checks.Check(
+            "Write access to data path", lambda: _check_writable(data_path)
+        ),
+    ]
+    if not installing:
+        result += [
+            checks.Check("Docker permissions", _check_docker_permissions),
+            checks.Check('"brainframe" group', _check_brainframe_group),
+        ]
+    if operation in [None, INSTALL, UPDATE]:
+        result.append(
+            checks.Check(
+                "Free space for images",
+                lambda: _check_image_space(install_path, installing),
+                timeout=_DISK_CHECK_TIMEOUT,
+            )
+        )
+    if operation in [None, BACKUP]:
+        result += [
+            checks.Check("rsync", _check_rsync),
+            checks.Check(
+                "Free space for backup",
+                lambda: _check_backup_space(
+                    install_path, data_path, backup_path
+                ),
+                timeout=_DISK_CHECK_TIMEOUT,
+            ),
+        ]
+
+    return result
+
+
+def run_preflight(
+    operation: str,
+    install_path: Path,
+    data_path: Path,
+    backup_path: Optional[Path] = None,
+) -> None:
+    """Checks everything an operation needs before it starts, so that it fails
+    in seconds instead of partway through. Problems are printed, and the
+    command exits if any check failed.
+    """
+    started_at = time.monotonic()
+    results = checks.run(
+        preflight_checks(operation, install_path, data_path, backup_path)
+    )
+    problems = checks.problems(results)
+
+    if len(problems) == 0:
+        print_utils.translate(
+            "general.preflight-passed",
+            count=len(results),
+            duration=f"{time.monotonic() - started_at:.1f}",
+        )
+        return
+
+    checks.print_results(problems)
+    print()
+    failed = [n for n, r in problems.items() if r.status == checks.FAILED]
+    if len(failed) > 0:
+        print_utils.fail_translate(
+            "general.preflight-failed", checks=", ".join(failed)
+        )
+
+
+def _check_docker(installing: bool) -> checks.CheckResult:
+    try:
+        docker_api.client().ping()
+    except docker_api.DockerAPIError as exc:
+        if shutil.which("docker") is None:
+            return checks.CheckResult(
+                checks.WARNING if installing else checks.FAILED,
+                "not installed",
+                "running",
+            )
+        return checks.CheckResult(checks.FAILED, str(exc), "running")
+    return checks.CheckResult(checks.PASSED, "running", "running")
+
+
+def _check_docker_permissions() -> checks.CheckResult:
+    if os_utils.is_root() or os_utils.currently_in_group("docker"):
+        return checks.CheckResult(checks.PASSED, "allowed")
+    return checks.CheckResult(
+        checks.FAILED, "not root or in the docker group", "allowed"
+    )
+
+
+def _check_brainframe_group() -> checks.CheckResult:
+    try:
+        grp.getgrnam("brainframe")
+    except KeyError:
+        return checks.CheckResult(checks.WARNING, "missing", "exists")
+    return checks.CheckResult(checks.PASSED, "exists", "exists")
+
+
+def _check_rsync() -> checks.CheckResult:
+    if shutil.which("rsync") is None:
+        # The backup command offers to install it
+        return checks.CheckResult(checks.WARNING, "not installed", "installed")
+    return checks.CheckResult(checks.PASSED, "installed", "installed")
+
+
+def _check_writable(path: Path) -> checks.CheckResult:
+    # Directories that don't exist yet will be created in the nearest one that
+    # does
+    existing = _nearest_existing(path)
+    if os.access(existing, os.W_OK):
+        return checks.CheckResult(checks.PASSED, f"{existing} is writable")
+    return checks.CheckResult(
+        checks.FAILED, f"{existing} is not writable", "writable"
+    )
+
+
+def _check_image_space(
+    install_path: Path, installing: bool
+) -> checks.CheckResult:
+    """Images are stored in Docker's root directory, not the data path, so
+    that's where space is needed for a pull
+    """
+    try:
+        info = docker_api.client().info()
+    except docker_api.DockerAPIError as exc:
+        return checks.CheckResult(checks.SKIPPED, str(exc))
+    if "DockerRootDir" not in info:
+        return checks.CheckResult(checks.SKIPPED, "not reported by Docker")
+    docker_root = Path(info["DockerRootDir"])
+
+    expected = EXPECTED_INSTALL_IMAGE_BYTES
+    if not installing:
+        # A new version's images are about as large as the current ones
+        images = {
+            c["ImageID"]
+            for c in brainframe_compose.project_containers(
+                install_path, include_stopped=True
+            )
+        }
+        sizes = [
+            image.get("Size", 0)
+            for image in docker_api.client().images()
+            if image["Id"] in images
+        ]
+        if len(sizes) > 0:
+            expected = sum(sizes)
+
+    # Images share layers, so the sum of their sizes, like the estimate for a
+    # first install, can be much more than a pull really needs. Running short
+    # is only worth a warning.
+    return _compare_space(docker_root, expected, shortfall=checks.WARNING)
+
+
+def _check_backup_space(
+    install_path: Path, data_path: Path, backup_path: Path
+) -> checks.CheckResult:
+    # The last backup is a good estimate, and is much faster than measuring
+    # the data directory
+    expected = None
+    for run in reversed(history.load(install_path, BACKUP)):
+        if run.exit_code == 0 and run.bytes is not None:
+            expected = run.bytes
+            break
+    if expected is None:
+        expected = _directory_size(data_path, exclude=[data_path / "backups"])
+
+    return _compare_space(backup_path, expected)
+
+
+def _compare_space(
+    path: Path, expected: int, shortfall: str = checks.FAILED
+) -> checks.CheckResult:
+    """
+    :param path: Where the space is needed
+    :param expected: How much space is needed, in bytes
+    :param shortfall: The status to give the check when there isn't enough
+        space
+    """
+    stats = os.statvfs(_nearest_existing(path))
+    free = stats.f_bavail * stats.f_frsize
+    return checks.CheckResult(
+        status=checks.PASSED if free >= expected else shortfall,
+        value=f"{print_utils.format_bytes(free)} free",
+        recommended=f">= {print_utils.format_bytes(expected)}",
+    )
+
+
+def _directory_size(path: Path, exclude: List[Path]) -> int:
+    """
+    :return: The total size of the regular files in a directory tree
+    """
+    excluded = {str(p) for p in exclude}
+    total = 0
+    lock = Lock()
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        nonlocal total
+        size = 0
+        subdirectories = []
+        for entry in entries:
+            if entry.path in excluded:
+                continue
+            stat_result = entry.stat(follow_symlinks=False)
+            if stat.S_ISREG(stat_result.st_mode):
+                size += stat_result.st_size
+            elif stat.S_ISDIR(stat_result.st_mode):
+                subdirectories.append(entry.path)
+        with lock:
+            total += size
+        return subdirectories
+
+    parallel_walk.walk([str(path)], visit)
+    return total
+
+
+def _nearest_existing(path: Path) -> Path:
+    path = path.absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return path
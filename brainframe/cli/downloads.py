@@ -0,0 +1,520 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from pathlib import Path
+from threading import Event
+from threading import Lock
+from typing import Callable
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import tracing
+
+BLOCK_SIZE = 1024000
+"""The block size to read and write downloads at. Chosen from this answer:
+https://stackoverflow.com/a/3673731
+"""
+
+DEFAULT_CONNECTIONS = 4
+"""The number of connections large files are downloaded over at once. One
+connection is limited by the round trip time on high latency links, long
+before it uses all of the bandwidth.
+"""
+
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+"""Files smaller than this are downloaded over a single connection, since
+opening more connections would take longer than it saves
+"""
+
+CHUNK_SIZE = 4 * 1024 * 1024
+"""The size of the ranges that large files are split into. Each range is
+retried on its own, and resuming a download only repeats the ranges that
+weren't finished.
+"""
+
+_RETRIES = 5
+_RETRY_DELAY = 1
+"""The delay before the first retry, in seconds. Each retry after that waits
+twice as long as the one before it.
+"""
+
+_TIMEOUT = (10, 60)
+"""The connect and read timeouts for each request, in seconds"""
+
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+T = TypeVar("T")
+
+
+class DownloadError(Exception):
+    """Raised when a file can't be downloaded or doesn't match its checksum"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class DownloadResult(NamedTuple):
+    path: Path
+    """The complete partial file, which the caller should move into place
+    with os.replace
+    """
+    bytes: int
+    """The number of bytes received, not counting any resumed from an earlier
+    attempt
+    """
+    duration: float
+    """How long the download took, in seconds"""
+    connections: int
+    """The number of connections the file was downloaded over"""
+
+    @property
+    def throughput(self) -> float:
+        """The average download speed, in bytes per second"""
+        return self.bytes / self.duration if self.duration > 0 else 0
+
+
+class _Stopped(Exception):
+    """Raised in a range's thread when the rest of the download was stopped"""
+
+
+class _RemoteFile(NamedTuple):
+    size: int
+    etag: Optional[str]
+    accepts_ranges: bool
+
+
+def part_path(destination: Path) -> Path:
+    """
+    :return: Where a download is written to until it's complete. It's kept
+        next to the destination, so that it can be renamed into place.
+    """
+    return destination.with_name(f".{destination.name}.part")
+
+
+def download(
+    url: str,
+    destination: Path,
+    credentials: Optional[Tuple[str, str]] = None,
+    sha256: Optional[str] = None,
+    on_bytes: Optional[Callable[[int], None]] = None,
+    connections: int = DEFAULT_CONNECTIONS,
+) -> DownloadResult:
+    """Downloads a file to a partial file next to the destination, without
+    touching the destination itself.
+
+    Large files are split into ranges that are downloaded over several pooled
+    connections at once, and written in place into a preallocated file. The
+    ranges that are finished are saved beside the partial file, so an
+    interrupted download only repeats the rest. Each range is retried on its
+    own if its connection drops.
+
+    Small files, and files from servers that don't support ranges, are
+    downloaded over one connection. A partial file left behind by an earlier
+    attempt is resumed with a Range request instead of being downloaded again.
+
+    Either way, the file's ETag is sent with If-Range when resuming, so a file
+    that changed on the server is never stitched together from two versions.
+
+    :param url: The URL to download
+    :param destination: Where the file will eventually go
+    :param credentials: Basic auth credentials, if needed
+    :param sha256: If provided, the hex digest the complete file must have
+    :param on_bytes: Called with the number of bytes received for each block.
+        May be called from multiple threads, but never at the same time.
+    :param connections: The most connections to download the file over
+    :return: The result of the download
+    :raises DownloadError: If the download fails after retrying, or the file
+        doesn't match the checksum. A file that doesn't match is deleted.
+    """
+    path = part_path(destination)
+    etag_path = path.with_name(path.name + ".etag")
+    state_path = path.with_name(path.name + ".state")
+
+    received = 0
+    lock = Lock()
+
+    def count_bytes(count: int) -> None:
+        nonlocal received
+        with lock:
+            received += count
+            if on_bytes is not None:
+                on_bytes(count)
+
+    started_at = time.monotonic()
+    with tracing.span("download", "http", url=url) as span, _session(
+        credentials, connections
+    ) as session:
+        remote = _retrying(lambda: _probe(session, url), url)
+        if (
+            remote is not None
+            and remote.accepts_ranges
+            and remote.size >= PARALLEL_THRESHOLD
+            and connections > 1
+        ):
+            # A partial file left by a download over one connection can't be
+            # resumed in ranges, and the other way around
+            _remove(etag_path)
+            _download_ranges(
+                session,
+                url,
+                path,
+                state_path,
+                remote,
+                connections,
+                count_bytes,
+            )
+        else:
+            connections = 1
+            _remove(state_path)
+            _retrying(
+                lambda: _download_rest(
+                    session, url, path, etag_path, count_bytes
+                ),
+                url,
+            )
+        span.set("bytes", received)
+        span.set("connections", connections)
+    duration = time.monotonic() - started_at
+
+    if sha256 is not None:
+        digest = file_sha256(path)
+        if digest != sha256.lower():
+            for leftover in [path, etag_path, state_path]:
+                _remove(leftover)
+            raise DownloadError(
+                f"The file downloaded from {url} has a SHA-256 of {digest}, "
+                f"but {sha256} was expected"
+            )
+
+    _remove(etag_path)
+    _remove(state_path)
+    return DownloadResult(path, received, duration, connections)
+
+
+def get_text(
+    url: str, credentials: Optional[Tuple[str, str]] = None
+) -> Optional[str]:
+    """
+    :return: The body of a small file, or None if it doesn't exist
+    :raises DownloadError: If the request fails for any other reason
+    """
+    with tracing.span("get", "http", url=url) as span:
+        try:
+            response = requests.get(url, auth=credentials, timeout=_TIMEOUT)
+        except requests.RequestException as exc:
+            raise DownloadError(f"Error downloading {url}: {exc}")
+        span.set("status", response.status_code)
+
+    # S3 responds to missing files with 403 when listing isn't allowed
+    if response.status_code in [403, 404]:
+        return None
+    if not response.ok:
+        raise DownloadError(
+            f"HTTP {response.status_code} - {response.text}",
+            response.status_code,
+        )
+    return response.text
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file_:
+        for block in iter(lambda: file_.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _session(
+    credentials: Optional[Tuple[str, str]], connections: int
+) -> requests.Session:
+    """
+    :return: A session that keeps up to the given number of connections open,
+        so that ranges reuse them instead of connecting again
+    """
+    session = requests.Session()
+    session.auth = credentials
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _probe(session: requests.Session, url: str) -> Optional[_RemoteFile]:
+    """
+    :return: The file's size and whether it can be downloaded in ranges, or
+        None if the server doesn't say
+    """
+    response = session.head(url, allow_redirects=True, timeout=_TIMEOUT)
+    length = response.headers.get("Content-Length")
+    if (
+        not response.ok
+        or length is None
+        or "Content-Encoding" in response.headers
+    ):
+        # Errors are reported by the download itself
+        return None
+    return _RemoteFile(
+        size=int(length),
+        etag=response.headers.get("ETag"),
+        accepts_ranges=response.headers.get("Accept-Ranges") == "bytes",
+    )
+
+
+def _download_ranges(
+    session: requests.Session,
+    url: str,
+    path: Path,
+    state_path: Path,
+    remote: _RemoteFile,
+    connections: int,
+    on_bytes: Callable[[int], None],
+) -> None:
+    """Downloads the ranges of a large file that haven't been downloaded yet,
+    several at a time
+    """
+    finished = _load_finished_chunks(path, state_path, remote)
+    chunks = [
+        (index, start, min(start + CHUNK_SIZE, remote.size) - 1)
+        for index, start in enumerate(range(0, remote.size, CHUNK_SIZE))
+    ]
+    lock = Lock()
+    stop = Event()
+
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if len(finished) == 0:
+            _preallocate(fd, remote.size)
+
+        def fetch(index: int, start: int, end: int) -> None:
+            position = start
+
+            def fetch_rest() -> None:
+                nonlocal position
+                if stop.is_set():
+                    raise _Stopped()
+                headers = {"Range": f"bytes={position}-{end}"}
+                if remote.etag is not None:
+                    headers["If-Range"] = remote.etag
+                with session.get(
+                    url, headers=headers, stream=True, timeout=_TIMEOUT
+                ) as response:
+                    if response.status_code == 200:
+                        # The whole file was sent instead, because it changed
+                        # since the download started
+                        raise DownloadError(
+                            f"{url} changed while it was being downloaded",
+                            response.status_code,
+                        )
+                    if response.status_code != 206:
+                        raise DownloadError(
+                            f"HTTP {response.status_code} - {response.text}",
+                            response.status_code,
+                        )
+                    for block in response.iter_content(BLOCK_SIZE):
+                        if stop.is_set():
+                            raise _Stopped()
+                        os.pwrite(fd, block, position)
+                        position += len(block)
+                        on_bytes(len(block))
+                if position <= end:
+                    raise requests.ConnectionError(
+                        f"The connection closed {end + 1 - position} bytes "
+                        f"before the end of the range"
+                    )
+
+            _retrying(fetch_rest, url)
+            with lock:
+                finished.add(index)
+                _save_finished_chunks(state_path, remote, finished)
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            futures = [
+                executor.submit(fetch, *chunk)
+                for chunk in chunks
+                if chunk[0] not in finished
+            ]
+            try:
+                done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            except BaseException:
+                # Interrupted, like with Ctrl-C. Ranges that are still being
+                # downloaded stop at their next block, instead of the
+                # executor waiting for all of them to finish.
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+            stop.set()
+            for future in not_done:
+                future.cancel()
+            for future in done:
+                exc = future.exception()
+                if exc is None:
+                    continue
+                if isinstance(exc, DownloadError) and exc.status == 200:
+                    # Resuming would mix two versions of the file, so the
+                    # next attempt starts over
+                    _remove(state_path)
+                raise exc
+
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _load_finished_chunks(
+    path: Path, state_path: Path, remote: _RemoteFile
+) -> Set[int]:
+    """
+    :return: The chunks an earlier attempt finished, if it was downloading
+        the same version of the file
+    """
+    if not path.is_file() or not state_path.is_file():
+        return set()
+    try:
+        state = json.loads(state_path.read_text())
+    except ValueError:
+        return set()
+
+    same_file = (
+        remote.etag is not None
+        and state.get("etag") == remote.etag
+        and state.get("size") == remote.size
+        and state.get("chunk_size") == CHUNK_SIZE
+        and path.stat().st_size == remote.size
+    )
+    return set(state.get("finished", [])) if same_file else set()
+
+
+def _save_finished_chunks(
+    state_path: Path, remote: _RemoteFile, finished: Set[int]
+) -> None:
+    state = {
+        "etag": remote.etag,
+        "size": remote.size,
+        "chunk_size": CHUNK_SIZE,
+        "finished": sorted(finished),
+    }
+    temp_path = state_path.with_name(state_path.name + ".tmp")
+    temp_path.write_text(json.dumps(state))
+    os.replace(temp_path, state_path)
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserves space for the whole file up front, so that writing ranges out
+    of order doesn't fragment it, and a full disk is noticed right away
+    """
+    os.ftruncate(fd, size)
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            # Not every filesystem supports this, and the file already has
+            # the right size either way
+            pass
+
+
+def _download_rest(
+    session: requests.Session,
+    url: str,
+    path: Path,
+    etag_path: Path,
+    on_bytes: Callable[[int], None],
+) -> None:
+    """Downloads whatever part of the file hasn't been downloaded yet, over
+    one connection
+    """
+    offset = path.stat().st_size if path.is_file() else 0
+    etag = etag_path.read_text() if etag_path.is_file() else None
+
+    headers = {}
+    if offset > 0 and etag is not None:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = etag
+    else:
+        # Without an ETag, there's no way to tell if the partial file is
+        # still part of the same file
+        offset = 0
+
+    with session.get(
+        url, headers=headers, stream=True, timeout=_TIMEOUT
+    ) as response:
+        if response.status_code == 416:
+            # The partial file is already complete
+            return
+        if not response.ok:
+            raise DownloadError(
+                f"HTTP {response.status_code} - {response.text}",
+                response.status_code,
+            )
+
+        if response.status_code != 206:
+            # The server sent the whole file, either because it doesn't
+            # support ranges or because the file changed
+            offset = 0
+        new_etag = response.headers.get("ETag")
+        if new_etag is None:
+            _remove(etag_path)
+        else:
+            etag_path.write_text(new_etag)
+
+        expected = None
+        if "Content-Encoding" not in response.headers:
+            # Otherwise, the length is of the encoded body
+            expected = response.headers.get("Content-Length")
+        received = 0
+        with path.open("r+b" if offset > 0 else "wb") as file_:
+            file_.seek(offset)
+            file_.truncate()
+            for block in response.iter_content(BLOCK_SIZE):
+                file_.write(block)
+                received += len(block)
+                on_bytes(len(block))
+            file_.flush()
+            os.fsync(file_.fileno())
+
+        if expected is not None and received < int(expected):
+            # Some versions of urllib3 end the stream quietly when the
+            # connection drops
+            raise requests.ConnectionError(
+                f"The connection closed after {received} of {expected} bytes"
+            )
+
+
+def _retrying(function: Callable[[], T], url: str) -> T:
+    """Calls the function, retrying with a growing delay if the connection
+    fails or the server responds with a 5xx error
+    """
+    attempt = 0
+    while True:
+        try:
+            return function()
+        except DownloadError as exc:
+            if exc.status is None or exc.status < 500 or attempt == _RETRIES:
+                raise
+        except _TRANSIENT_ERRORS as exc:
+            if attempt == _RETRIES:
+                raise DownloadError(f"Error downloading {url}: {exc}")
+        time.sleep(_RETRY_DELAY * 2**attempt)
+        attempt += 1
+
+
+def _remove(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
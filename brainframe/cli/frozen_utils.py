@@ -1,5 +1,6 @@
 import sys
 from pathlib import Path
+from typing import List
 from typing import Union
 
 
@@ -10,6 +11,16 @@ def is_frozen() -> bool:
     return getattr(sys, "frozen", False)
 
 
+def self_command() -> List[str]:
+    """
+    :return: The command that runs this CLI, for starting another copy of it
+    """
+    if is_frozen():
+        return [sys.executable]
+    else:
+        return [sys.executable, "-m", "brainframe.cli.main"]
+
+
 def _get_absolute_path(*args: Union[str, Path]) -> Path:
     """Gets the absolute path of a resource.
 
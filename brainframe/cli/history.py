@@ -0,0 +1,315 @@
+import grp
+import os
+import sqlite3
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import print_utils
+from . import scheduler
+
+HISTORY_FILE_NAME = "history.sqlite3"
+"""The name of the history database, which is kept in the install path"""
+
+TRANSFER_PHASES = {"rsync", "copy", "download", "move", "recall"}
+"""The names of phases that move the data counted in a run's bytes"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    exit_code INTEGER NOT NULL,
+    bytes INTEGER,
+    files INTEGER
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    start REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_operation ON runs (operation, started_at);
+"""
+
+
+class Phase(NamedTuple):
+    name: str
+    start: float
+    """Seconds since the run started that the phase started at"""
+    duration: float
+
+
+class RunRecord(NamedTuple):
+    id: int
+    operation: str
+    started_at: float
+    """The Unix time that the run started at"""
+    ended_at: float
+    exit_code: int
+    bytes: Optional[int]
+    """The number of bytes the run moved, if it moves data"""
+    files: Optional[int]
+    phases: List[Phase]
+
+    @property
+    def busy_time(self) -> float:
+        """The time that at least one phase was running for, which leaves out
+        time spent waiting for the user to answer questions. If no phases were
+        recorded, this is the run's whole duration.
+        """
+        if len(self.phases) == 0:
+            return self.ended_at - self.started_at
+        return scheduler.busy_time(
+            scheduler.StepTiming(p.start, p.duration) for p in self.phases
+        )
+
+    @property
+    def transfer_time(self) -> float:
+        """The time spent in phases that move data, like copying files for a
+        backup. Other phases, like stopping BrainFrame first, aren't affected
+        by how fast data moves. If no such phases were recorded, this is the
+        busy time.
+        """
+        transfers = [p for p in self.phases if p.name in TRANSFER_PHASES]
+        if len(transfers) == 0:
+            return self.busy_time
+        return scheduler.busy_time(
+            scheduler.StepTiming(p.start, p.duration) for p in transfers
+        )
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes moved per second of transfer time"""
+        if self.bytes is None or self.transfer_time <= 0:
+            return None
+        return self.bytes / self.transfer_time
+
+
+class Run:
+    """Collects the details of a run while it happens"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started_at = time.time()
+        self.bytes: Optional[int] = None
+        self.files: Optional[int] = None
+        self.phases: List[Phase] = []
+        self._schedulers: List[scheduler.StepScheduler] = []
+        self._created_at = time.monotonic()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Records how long the code in a with block takes as a phase"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                Phase(
+                    name=name,
+                    start=start - self._created_at,
+                    duration=time.monotonic() - start,
+                )
+            )
+
+    def include_steps(self, steps: scheduler.StepScheduler) -> None:
+        """Records each step that the scheduler runs as a phase, including
+        steps that finish after this is called
+        """
+        self._schedulers.append(steps)
+
+    def all_phases(self) -> List[Phase]:
+        phases = list(self.phases)
+        for steps in self._schedulers:
+            # Step timings are relative to when the scheduler was created
+            offset = steps.created_at - self._created_at
+            for name, timing in steps.timings.items():
+                phases.append(
+                    Phase(
+                        name=name,
+                        start=timing.start + offset,
+                        duration=timing.duration,
+                    )
+                )
+        return sorted(phases, key=lambda p: p.start)
+
+
+@contextmanager
+def record(operation: str, install_path: Optional[Path]) -> Iterator[Run]:
+    """Records a run of an operation in the history once the with block exits,
+    whether or not it succeeded. Failing to save the run never fails the
+    operation.
+
+    :param operation: The name of the operation, like "backup"
+    :param install_path: The install path that the history is kept in. If it
+        doesn't exist, nothing is recorded.
+    :return: The run, whose details can be filled in as it happens
+    """
+    run = Run(operation)
+    exit_code = 0
+    try:
+        yield run
+    except SystemExit as exc:
+        if exc.code is None:
+            exit_code = 0
+        elif isinstance(exc.code, int):
+            exit_code = exc.code
+        else:
+            exit_code = 1
+        raise
+    except BaseException:
+        exit_code = 1
+        raise
+    finally:
+        if install_path is not None and install_path.is_dir():
+            try:
+                _save(install_path / HISTORY_FILE_NAME, run, exit_code)
+            except (sqlite3.Error, OSError) as exc:
+                print_utils.warning_translate(
+                    "general.history-not-saved", error=str(exc)
+                )
+
+
+def load(
+    install_path: Path, operation: Optional[str] = None
+) -> List[RunRecord]:
+    """
+    :param install_path: The install path that the history is kept in
+    :param operation: If provided, only runs of this operation are loaded
+    :return: Recorded runs, oldest first
+    """
+    path = install_path / HISTORY_FILE_NAME
+    if not path.is_file():
+        return []
+
+    phases: Dict[int, List[Phase]] = {}
+    try:
+        with _connect(path) as connection:
+            query = "SELECT * FROM runs"
+            params: tuple = ()
+            if operation is not None:
+                query += " WHERE operation = ?"
+                params = (operation,)
+            query += " ORDER BY started_at, id"
+            rows = connection.execute(query, params).fetchall()
+
+            for run_id, name, start, duration in connection.execute(
+                "SELECT run_id, name, start, duration FROM phases "
+                "ORDER BY start"
+            ):
+                phases.setdefault(run_id, []).append(
+                    Phase(name, start, duration)
+                )
+    except sqlite3.Error as exc:
+        # The database is corrupt, or locked by a run that's being saved
+        print_utils.warning_translate(
+            "general.history-unreadable", path=path, error=str(exc)
+        )
+        return []
+
+    return [
+        RunRecord(
+            id=row["id"],
+            operation=row["operation"],
+            started_at=row["started_at"],
+            ended_at=row["ended_at"],
+            exit_code=row["exit_code"],
+            bytes=row["bytes"],
+            files=row["files"],
+            phases=phases.get(row["id"], []),
+        )
+        for row in rows
+    ]
+
+
+def find_regressions(
+    runs: List[RunRecord], window: int, threshold: float
+) -> Dict[int, float]:
+    """Compares each successful run to the rolling median of the successful
+    runs of the same operation before it. Runs that move data are compared by
+    throughput, and other runs by busy time.
+
+    :param runs: Runs, oldest first
+    :param window: The number of earlier runs to take the median of
+    :param threshold: How much worse than the median a run has to be to count
+        as a regression, as a fraction
+    :return: How much worse than the median each regressed run was, as a
+        fraction, by run ID
+    """
+    earlier: Dict[str, List[RunRecord]] = {}
+    regressions = {}
+    for run in runs:
+        if run.exit_code != 0:
+            continue
+        previous = earlier.setdefault(run.operation, [])
+        baseline = previous[-window:]
+
+        if run.throughput is not None:
+            throughputs = [r.throughput for r in baseline if r.throughput]
+            if len(throughputs) > 0:
+                median = statistics.median(throughputs)
+                change = 1 - run.throughput / median
+                if change > threshold:
+                    regressions[run.id] = change
+        elif len(baseline) > 0:
+            median = statistics.median(r.busy_time for r in baseline)
+            if median > 0:
+                change = run.busy_time / median - 1
+                if change > threshold:
+                    regressions[run.id] = change
+
+        previous.append(run)
+
+    return regressions
+
+
+def _save(path: Path, run: Run, exit_code: int) -> None:
+    is_new = not path.exists()
+    with _connect(path) as connection:
+        cursor = connection.execute(
+            "INSERT INTO runs "
+            "(operation, started_at, ended_at, exit_code, bytes, files) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                run.operation,
+                run.started_at,
+                time.time(),
+                exit_code,
+                run.bytes,
+                run.files,
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO phases (run_id, name, start, duration) "
+            "VALUES (?, ?, ?, ?)",
+            [(cursor.lastrowid, *phase) for phase in run.all_phases()],
+        )
+
+    if is_new and os.geteuid() == 0:
+        # Commands that run as root create the database, but commands run by
+        # members of the BrainFrame group need to write to it too
+        try:
+            os.chown(path, -1, grp.getgrnam("brainframe").gr_gid)
+            os.chmod(path, 0o664)
+        except (KeyError, OSError):
+            pass
+
+
+@contextmanager
+def _connect(path: Path) -> Iterator[sqlite3.Connection]:
+    connection = sqlite3.connect(str(path), timeout=10)
+    connection.row_factory = sqlite3.Row
+    try:
+        with connection:
+            connection.executescript(_SCHEMA)
+            yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,116 @@
+import os
+from pathlib import Path
+from typing import List
+
+from . import checks
+from . import docker_api
+from . import print_utils
+
+MIN_SHM_BYTES = 2 * 1024 * 1024 * 1024
+"""Decoded video frames are passed between processes through /dev/shm, which
+fills up quickly with many high resolution streams
+"""
+
+MIN_MAX_MAP_COUNT = 262144
+"""Inference runtimes map many small regions of memory"""
+
+MIN_RMEM_MAX = 26214400
+"""RTSP streams are received over UDP, and bursts of packets from many streams
+are dropped if socket buffers can't grow this large
+"""
+
+RECOMMENDED_GOVERNOR = "performance"
+
+SLOW_STORAGE_DRIVERS = ["vfs"]
+"""Storage drivers that copy every layer in full, which makes starting
+containers slow and wastes disk space
+"""
+
+RECOMMENDED_STORAGE_DRIVER = "overlay2"
+
+_CPU_PATH = Path("/sys/devices/system/cpu")
+
+
+def all_checks() -> List[checks.Check]:
+    """
+    :return: Checks of how well this machine is set up for BrainFrame
+    """
+    return [
+        checks.Check("/dev/shm size", check_shm),
+        checks.Check("vm.max_map_count", check_max_map_count),
+        checks.Check("net.core.rmem_max", check_rmem_max),
+        checks.Check("CPU frequency governor", check_cpu_governor),
+        checks.Check("Docker storage driver", check_storage_driver),
+    ]
+
+
+def check_shm() -> checks.CheckResult:
+    stats = os.statvfs("/dev/shm")
+    size = stats.f_blocks * stats.f_frsize
+    return checks.CheckResult(
+        status=checks.PASSED if size >= MIN_SHM_BYTES else checks.WARNING,
+        value=print_utils.format_bytes(size),
+        recommended=f">= {print_utils.format_bytes(MIN_SHM_BYTES)}",
+    )
+
+
+def check_max_map_count() -> checks.CheckResult:
+    return _check_sysctl("vm.max_map_count", MIN_MAX_MAP_COUNT)
+
+
+def check_rmem_max() -> checks.CheckResult:
+    return _check_sysctl("net.core.rmem_max", MIN_RMEM_MAX)
+
+
+def check_cpu_governor() -> checks.CheckResult:
+    governors = set()
+    for path in _CPU_PATH.glob("cpu[0-9]*/cpufreq/scaling_governor"):
+        governors.add(path.read_text().strip())
+
+    if len(governors) == 0:
+        # Virtual machines and containers usually don't expose frequency
+        # scaling
+        return checks.CheckResult(
+            checks.SKIPPED, "not available", RECOMMENDED_GOVERNOR
+        )
+
+    return checks.CheckResult(
+        status=(
+            checks.PASSED
+            if governors == {RECOMMENDED_GOVERNOR}
+            else checks.WARNING
+        ),
+        value=", ".join(sorted(governors)),
+        recommended=RECOMMENDED_GOVERNOR,
+    )
+
+
+def check_storage_driver() -> checks.CheckResult:
+    try:
+        driver = docker_api.client().info().get("Driver", "")
+    except docker_api.DockerAPIError as exc:
+        return checks.CheckResult(checks.SKIPPED, str(exc))
+
+    if driver in SLOW_STORAGE_DRIVERS:
+        return checks.CheckResult(
+            status=checks.FAILED,
+            value=driver,
+            recommended=RECOMMENDED_STORAGE_DRIVER,
+            daemon_config={"storage-driver": RECOMMENDED_STORAGE_DRIVER},
+        )
+    return checks.CheckResult(
+        checks.PASSED, driver, f"not {', '.join(SLOW_STORAGE_DRIVERS)}"
+    )
+
+
+def _check_sysctl(name: str, minimum: int) -> checks.CheckResult:
+    path = Path("/proc/sys") / name.replace(".", "/")
+    value = int(path.read_text().strip())
+    if value >= minimum:
+        return checks.CheckResult(checks.PASSED, str(value), f">= {minimum}")
+    return checks.CheckResult(
+        status=checks.WARNING,
+        value=str(value),
+        recommended=f">= {minimum}",
+        sysctl={name: str(minimum)},
+    )
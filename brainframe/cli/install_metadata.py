@@ -0,0 +1,211 @@
+import grp
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+
+import i18n
+import yaml
+
+from . import docker_api
+from . import os_utils
+from . import print_utils
+
+FILE_NAME = "install-metadata.json"
+
+_SCHEMA_VERSION = 1
+
+# The C loader is much faster, but isn't available in every build of PyYAML
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class ServiceImage(NamedTuple):
+    image: str
+    """The image as it's named in the docker-compose.yml"""
+    digest: Optional[str]
+    """The repository digest of the pulled image, or None if it hasn't been
+    pulled or Docker couldn't be reached
+    """
+
+
+class InstallMetadata(NamedTuple):
+    server_version: str
+    """The version of the BrainFrame server, like "v0.29.0" """
+    services: Dict[str, ServiceImage]
+    compose_sha256: str
+    compose_mtime_ns: int
+    compose_size: int
+    installed_at: Optional[float]
+    """When BrainFrame was installed, as a Unix timestamp, or None for
+    installations from before this was recorded
+    """
+    updated_at: Optional[float]
+    """When BrainFrame was last updated, as a Unix timestamp"""
+
+
+def metadata_path(install_path: Path) -> Path:
+    return install_path / FILE_NAME
+
+
+def load(install_path: Path) -> InstallMetadata:
+    """Reads the metadata saved next to the docker-compose.yml, so that the
+    compose file doesn't need to be parsed.
+
+    The metadata is checked against the compose file first. If the compose
+    file's modification time and size are the same, the metadata is used as
+    is. Otherwise, the file's hash is compared, and the metadata is rebuilt
+    if the file really did change.
+
+    :param install_path: The path BrainFrame is installed to
+    :return: Metadata describing the installation
+    """
+    compose_path = install_path / "docker-compose.yml"
+    compose_stat = compose_path.stat()
+    saved = _read(install_path)
+
+    if saved is not None:
+        if (
+            saved.compose_mtime_ns == compose_stat.st_mtime_ns
+            and saved.compose_size == compose_stat.st_size
+        ):
+            return saved
+
+        if _file_sha256(compose_path) == saved.compose_sha256:
+            # The file was touched or copied, but not changed
+            refreshed = saved._replace(
+                compose_mtime_ns=compose_stat.st_mtime_ns,
+                compose_size=compose_stat.st_size,
+            )
+            _write_if_possible(install_path, refreshed)
+            return refreshed
+
+    return write(
+        install_path,
+        installed_at=None if saved is None else saved.installed_at,
+        updated_at=None if saved is None else saved.updated_at,
+    )
+
+
+def write(
+    install_path: Path,
+    installed_at: Optional[float] = None,
+    updated_at: Optional[float] = None,
+) -> InstallMetadata:
+    """Builds metadata from the docker-compose.yml and saves it, if the user
+    has permission to. Image digests are looked up from Docker, so this
+    should be done after the images are pulled.
+
+    :param install_path: The path BrainFrame is installed to
+    :param installed_at: When BrainFrame was installed. Defaults to the time
+        in the existing metadata.
+    :param updated_at: When BrainFrame was last updated. Defaults to the time
+        in the existing metadata.
+    :return: The new metadata
+    """
+    saved = _read(install_path)
+    if saved is not None:
+        installed_at = installed_at or saved.installed_at
+        updated_at = updated_at or saved.updated_at
+
+    compose_path = install_path / "docker-compose.yml"
+    compose_stat = compose_path.stat()
+    compose_bytes = compose_path.read_bytes()
+    compose = yaml.load(compose_bytes, Loader=_YAML_LOADER)
+
+    services = {
+        name: ServiceImage(service["image"], _image_digest(service["image"]))
+        for name, service in (compose.get("services") or {}).items()
+        if "image" in service
+    }
+
+    metadata = InstallMetadata(
+        server_version="v" + services["core"].image.split(":")[-1],
+        services=services,
+        compose_sha256=hashlib.sha256(compose_bytes).hexdigest(),
+        compose_mtime_ns=compose_stat.st_mtime_ns,
+        compose_size=compose_stat.st_size,
+        installed_at=installed_at,
+        updated_at=updated_at,
+    )
+    _write_if_possible(install_path, metadata)
+    return metadata
+
+
+def to_json(metadata: InstallMetadata) -> dict:
+    """
+    :return: The metadata in a form that can be encoded as JSON
+    """
+    result = metadata._asdict()
+    result["services"] = {
+        name: service._asdict() for name, service in metadata.services.items()
+    }
+    return result
+
+
+def _read(install_path: Path) -> Optional[InstallMetadata]:
+    """
+    :return: The saved metadata, or None if there isn't any or it can't be
+        used
+    """
+    try:
+        saved = json.loads(metadata_path(install_path).read_text())
+        if saved.pop("schema_version", None) != _SCHEMA_VERSION:
+            return None
+        saved["services"] = {
+            name: ServiceImage(**service)
+            for name, service in saved["services"].items()
+        }
+        return InstallMetadata(**saved)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def _write_if_possible(install_path: Path, metadata: InstallMetadata) -> None:
+    """Saves the metadata. Users without write access to the install path
+    still get up-to-date metadata, it just isn't saved for next time. Other
+    errors, like a full disk, are warned about without failing the command.
+    """
+    path = metadata_path(install_path)
+    if not os.access(install_path, os.W_OK):
+        return
+
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}")
+    content = {"schema_version": _SCHEMA_VERSION, **to_json(metadata)}
+    try:
+        temp_path.write_text(json.dumps(content, indent=2) + "\n")
+        if os_utils.is_root():
+            # Members of the BrainFrame group refresh it later
+            try:
+                os.chown(temp_path, -1, grp.getgrnam("brainframe").gr_gid)
+                os.chmod(temp_path, 0o664)
+            except (KeyError, OSError):
+                pass
+        os.replace(temp_path, path)
+    except OSError as exc:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+        # Kept out of standard output, which may be JSON
+        print_utils.print_color(
+            i18n.t("general.metadata-not-saved", path=path, error=exc),
+            print_utils.Color.YELLOW,
+            file=sys.stderr,
+        )
+
+
+def _image_digest(image: str) -> Optional[str]:
+    try:
+        details = docker_api.client().inspect_image(image)
+    except docker_api.DockerAPIError:
+        return None
+    digests = details.get("RepoDigests") or []
+    return digests[0].split("@")[-1] if len(digests) > 0 else None
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
@@ -0,0 +1,197 @@
+import os
+import re
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+
+import i18n
+import yaml
+
+from . import config
+from . import frozen_utils
+from . import print_utils
+from . import process_utils
+
+FLEET_COMMANDS = ["backup", "compose", "status", "update"]
+"""Commands that can be run across every instance at once"""
+
+_PROMPTING_FLEET_COMMANDS = ["backup", "update"]
+"""Fleet commands that ask questions unless run with --noninteractive"""
+
+DEFAULT_MAX_PARALLEL = 4
+
+
+class Instance(NamedTuple):
+    name: str
+    install_path: Path
+    data_path: Path
+    project_name: str
+    """The Compose project name, which keeps the containers of different
+    instances apart
+    """
+
+
+def load() -> Dict[str, Instance]:
+    """Reads the instances file, which looks like this:
+
+        instances:
+          north:
+            install_path: /srv/brainframe/north
+            data_path: /srv/brainframe/north-data
+            project_name: brainframe-north
+
+    The project name is optional, and defaults to "brainframe-" followed by
+    the instance name. Relative paths are relative to the instances file.
+
+    :return: Every configured instance, by name
+    """
+    instances_path = config.instances_file.value
+    if instances_path is None or not instances_path.is_file():
+        print_utils.fail_translate(
+            "general.no-instances-file",
+            path=instances_path,
+            env_var=config.instances_file.env_var_name,
+        )
+
+    content = yaml.safe_load(instances_path.read_text()) or {}
+    instances = {}
+    for name, settings in (content.get("instances") or {}).items():
+        name = str(name)
+        try:
+            install_path = instances_path.parent / settings["install_path"]
+            data_path = instances_path.parent / settings["data_path"]
+        except (KeyError, TypeError):
+            print_utils.fail_translate(
+                "general.invalid-instance", name=name, path=instances_path
+            )
+        project_name = settings.get("project_name") or f"brainframe-{name}"
+        instances[name] = Instance(
+            name=name,
+            install_path=install_path,
+            data_path=data_path,
+            project_name=re.sub(r"[^a-z0-9_-]", "", project_name.lower()),
+        )
+    return instances
+
+
+def select(name: str) -> Instance:
+    """Makes the rest of this process, and every command it starts, work on
+    the given instance. Its paths become the values and defaults of the path
+    options, and its project name is given to Docker Compose.
+
+    :param name: The name of the instance
+    :return: The selected instance
+    """
+    instances = load()
+    if name not in instances:
+        print_utils.fail_translate(
+            "general.unknown-instance",
+            name=name,
+            instances=", ".join(instances) or "-",
+        )
+    instance = instances[name]
+
+    os.environ[config.install_path.env_var_name] = str(instance.install_path)
+    os.environ[config.data_path.env_var_name] = str(instance.data_path)
+    os.environ["COMPOSE_PROJECT_NAME"] = instance.project_name
+    config.load()
+    config.install_path.default = instance.install_path
+    config.data_path.default = instance.data_path
+
+    return instance
+
+
+def run_everywhere(
+    command_args: List[str], global_args: List[str], max_parallel: int
+) -> None:
+    """Runs a command on every instance at once, each in its own copy of the
+    CLI, then prints how it went on each. Output from each instance is
+    prefixed with its name.
+
+    Images are shared between instances, since Docker keeps one copy of each
+    image for every project that uses it. When several instances pull the
+    same image at once, Docker only downloads it once.
+
+    :param command_args: The command to run and its arguments
+    :param global_args: Global flags to give each copy of the CLI
+    :param max_parallel: The most instances to run the command on at once
+    """
+    if command_args[0] not in FLEET_COMMANDS:
+        print_utils.fail_translate(
+            "general.not-a-fleet-command",
+            command=command_args[0],
+            commands=", ".join(FLEET_COMMANDS),
+        )
+    if (
+        command_args[0] in _PROMPTING_FLEET_COMMANDS
+        and "--noninteractive" not in command_args
+    ):
+        # Questions from several instances at once can't be answered, and
+        # with no terminal to read from, they'd fail
+        command_args = command_args + ["--noninteractive"]
+
+    instances = load()
+    if len(instances) == 0:
+        print_utils.fail_translate(
+            "general.no-instances", path=config.instances_file.value
+        )
+
+    group = process_utils.ProcessGroup(max_workers=max_parallel)
+    for name in instances:
+        group.add(
+            name,
+            frozen_utils.self_command()
+            + ["--instance", name]
+            + global_args
+            + command_args,
+            # Only one command can read from the terminal at a time
+            stdin=subprocess.DEVNULL,
+        )
+
+    started_at = time.monotonic()
+    results = group.run(print_commands=False, exit_on_failure=False)
+
+    print()
+    print_utils.print_table(
+        ["INSTANCE", "RESULT", "EXIT CODE", "DURATION"],
+        [
+            [
+                name,
+                _describe(result),
+                "-" if result.returncode is None else result.returncode,
+                (
+                    "-"
+                    if result.duration is None
+                    else f"{result.duration:.1f}s"
+                ),
+            ]
+            for name, result in results.items()
+        ],
+    )
+
+    failed = [n for n, r in results.items() if r.returncode != 0]
+    if len(failed) > 0:
+        print()
+        print_utils.fail_translate(
+            "general.fleet-failed",
+            command=command_args[0],
+            instances=", ".join(failed),
+        )
+    print()
+    print_utils.translate(
+        "general.fleet-succeeded",
+        command=command_args[0],
+        count=len(results),
+        duration=f"{time.monotonic() - started_at:.1f}",
+    )
+
+
+def _describe(result: process_utils.TaskResult) -> str:
+    if result.returncode is None:
+        return i18n.t("general.fleet-not-run")
+    if result.returncode == 0:
+        return i18n.t("general.fleet-ok")
+    return i18n.t("general.fleet-error")
@@ -4,13 +4,17 @@ import os
 import signal
 import sys
 from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
 
 import i18n
 from brainframe.cli import commands
 from brainframe.cli import config
 from brainframe.cli import frozen_utils
-from brainframe.cli import os_utils
+from brainframe.cli import instances
 from brainframe.cli import print_utils
+from brainframe.cli import process_utils
+from brainframe.cli import tracing
 
 
 def main():
@@ -24,8 +28,42 @@ def main():
         "command", default=None, nargs="?", help=i18n.t("portal.command-help")
     )
 
+    parser.add_argument(
+        "--timings", action="store_true", help=i18n.t("portal.timings-help")
+    )
+
+    parser.add_argument("--trace", type=Path, help=i18n.t("portal.trace-help"))
+
+    instance_group = parser.add_mutually_exclusive_group()
+    instance_group.add_argument(
+        "--instance", metavar="NAME", help=i18n.t("portal.instance-help")
+    )
+    instance_group.add_argument(
+        "--all-instances",
+        action="store_true",
+        help=i18n.t("portal.all-instances-help"),
+    )
+
+    parser.add_argument(
+        "--max-parallel",
+        metavar="N",
+        type=int,
+        default=instances.DEFAULT_MAX_PARALLEL,
+        help=i18n.t("portal.max-parallel-help"),
+    )
+
     config.load()
 
+    # Global flags come before the command name. They're removed from
+    # sys.argv so that commands only see their own arguments.
+    global_args = _pop_global_args()
+    args = parser.parse_args(global_args + sys.argv[1:2])
+    if args.timings or args.trace is not None:
+        tracing.enable()
+
+    if args.instance is not None:
+        instances.select(args.instance)
+
     # This environment variable must be set as it is used by the
     # docker-compose.yml to find the data path to volume mount
     os.environ.setdefault(
@@ -33,25 +71,36 @@ def main():
         str(config.data_path.default),
     )
 
-    args = parser.parse_args(sys.argv[1:2])
-
     # Exit with a clean error when interrupted
     def on_sigint(sig, _frame):
         print()
-        if os_utils.current_command.process is None:
+        if process_utils.running_processes.empty:
             print_utils.fail_translate("general.interrupted")
         else:
-            # Let os_utils.run take care of bringing the process down when the current
-            # command is finished
-            os_utils.current_command.send_signal(sig)
+            # Let the code that started the processes take care of bringing the
+            # application down once every process has finished
+            process_utils.running_processes.send_signal(sig)
 
     signal.signal(signal.SIGINT, on_sigint)
 
     if args.command is None:
         print_utils.translate("portal.no-command-provided")
+    elif args.all_instances:
+        instances.run_everywhere(
+            [args.command] + sys.argv[2:],
+            ["--timings"] if args.timings else [],
+            args.max_parallel,
+        )
     elif args.command in commands.by_name:
         command = commands.by_name[args.command]
-        command()
+        try:
+            with tracing.span(args.command, "command"):
+                command()
+        finally:
+            if args.trace is not None:
+                tracing.write_chrome_trace(args.trace)
+            if args.timings:
+                tracing.print_summary()
     else:
         error_message = i18n.t("portal.unknown-command")
         error_message = error_message.format(command=args.command)
@@ -61,5 +110,30 @@ def main():
         parser.print_help()
 
 
+_VALUE_FLAGS = ("--trace", "--instance", "--max-parallel")
+"""Global flags that take a value"""
+
+
+def _pop_global_args() -> List[str]:
+    """Removes the global flags that come before the command name from
+    sys.argv.
+
+    :return: The removed flags and their values
+    """
+    global_args = []
+    while len(sys.argv) > 1:
+        argument = sys.argv[1]
+        if argument in ("--timings", "--all-instances") or any(
+            argument.startswith(f"{flag}=") for flag in _VALUE_FLAGS
+        ):
+            global_args.append(sys.argv.pop(1))
+        elif argument in _VALUE_FLAGS:
+            global_args += sys.argv[1:3]
+            del sys.argv[1:3]
+        else:
+            break
+    return global_args
+
+
 if __name__ == "__main__":
     main()
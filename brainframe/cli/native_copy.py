@@ -0,0 +1,260 @@
+import errno
+import fcntl
+import os
+import stat
+from typing import Iterator
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from . import os_utils
+
+FICLONE = 0x40049409
+"""The ioctl that makes a file share another file's data, on filesystems that
+support reflinks, like Btrfs and XFS
+"""
+
+_CHUNK_SIZE = 8 * 1024 * 1024
+"""The most bytes copied by a single system call"""
+
+_UNSUPPORTED_ERRORS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.EINVAL,
+}
+"""Errors that mean a way of copying doesn't work between two filesystems"""
+
+_DevicePair = Tuple[int, int]
+
+
+class SourceChangedError(OSError):
+    """Raised when a file is made shorter while it's being copied"""
+
+
+_no_reflinks: Set[_DevicePair] = set()
+"""Pairs of source and destination devices that reflinks don't work between"""
+
+_no_copy_file_range: Set[_DevicePair] = set()
+"""Pairs of source and destination devices that copy_file_range doesn't work
+between
+"""
+
+_no_sendfile: Set[_DevicePair] = set()
+"""Pairs of source and destination devices that sendfile doesn't work
+between
+"""
+
+
+def copy_file(
+    source: str, destination: str, source_stat: Optional[os.stat_result] = None
+) -> int:
+    """Copies a file with its permissions and times, and with its owner when
+    run as root. Symbolic links are copied as links, and special files like
+    FIFOs are made again instead of read. Anything already at the destination
+    is replaced.
+
+    The fastest way the filesystems support is used. The copy shares the
+    original's data if they're on a filesystem with reflinks. Otherwise, the
+    data is copied within the kernel with copy_file_range, or with sendfile
+    where that's not supported, and then with plain reads and writes. Holes in
+    sparse files are kept as holes instead of being written out as zeros.
+
+    :param source: The file to copy
+    :param destination: Where to copy it to. The directory it's in must exist.
+    :param source_stat: The result of lstat on the source, if it's already
+        known
+    :return: The number of bytes of data that were written, which doesn't
+        include holes or data that's shared with the original
+    """
+    source_stat = source_stat or os.lstat(source)
+    try:
+        os.unlink(destination)
+    except FileNotFoundError:
+        pass
+
+    written = 0
+    if stat.S_ISREG(source_stat.st_mode):
+        written = _copy_data(source, destination, source_stat)
+    elif stat.S_ISLNK(source_stat.st_mode):
+        os.symlink(os.readlink(source), destination)
+    else:
+        os.mknod(destination, source_stat.st_mode, source_stat.st_rdev)
+
+    copy_metadata(destination, source_stat)
+    return written
+
+
+def copy_metadata(destination: str, source_stat: os.stat_result) -> None:
+    """Gives a path the permissions and times of another, and its owner when
+    run as root. Symbolic links themselves are changed, not what they point to.
+    """
+    if os_utils.is_root():
+        os.lchown(destination, source_stat.st_uid, source_stat.st_gid)
+    if not stat.S_ISLNK(source_stat.st_mode):
+        # Changing the owner clears the setuid and setgid bits, so this comes
+        # after
+        os.chmod(destination, stat.S_IMODE(source_stat.st_mode))
+    os.utime(
+        destination,
+        ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns),
+        follow_symlinks=False,
+    )
+
+
+def _copy_data(
+    source: str, destination: str, source_stat: os.stat_result
+) -> int:
+    source_fd = os.open(source, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        destination_fd = os.open(
+            destination,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW,
+            0o600,
+        )
+        try:
+            devices = (source_stat.st_dev, os.fstat(destination_fd).st_dev)
+            if _clone(source_fd, destination_fd, devices):
+                return 0
+
+            written = 0
+            for start, end in _data_extents(source_fd, source_stat.st_size):
+                written += _copy_range(
+                    source_fd, destination_fd, start, end, devices
+                )
+            if os.fstat(source_fd).st_size < source_stat.st_size:
+                # Its end would be mistaken for a hole and left as zeros
+                raise SourceChangedError(
+                    "The file was made shorter while it was being copied"
+                )
+            # Makes the hole at the end of the file, if there is one
+            os.ftruncate(destination_fd, source_stat.st_size)
+            return written
+        except BaseException:
+            # Don't leave an incomplete copy behind
+            os.unlink(destination)
+            raise
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+
+
+def _clone(source_fd: int, destination_fd: int, devices: _DevicePair) -> bool:
+    """
+    :return: True if the destination now shares the source's data
+    """
+    if devices in _no_reflinks:
+        return False
+    try:
+        fcntl.ioctl(destination_fd, FICLONE, source_fd)
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED_ERRORS:
+            raise
+        _no_reflinks.add(devices)
+        return False
+    return True
+
+
+def _data_extents(fd: int, size: int) -> Iterator[Tuple[int, int]]:
+    """Finds the parts of a file that aren't holes.
+
+    :return: The start and end of each part
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        yield 0, size
+        return
+
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as exc:
+            if exc.errno == errno.ENXIO:
+                # There's no more data, only a hole at the end
+                return
+            if offset == 0 and exc.errno in _UNSUPPORTED_ERRORS:
+                # The filesystem can't tell where the holes are
+                yield 0, size
+                return
+            raise
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        if start >= end:
+            return
+        yield start, end
+        offset = end
+
+
+def _copy_range(
+    source_fd: int,
+    destination_fd: int,
+    start: int,
+    end: int,
+    devices: _DevicePair,
+) -> int:
+    offset = start
+    while offset < end:
+        count = min(end - offset, _CHUNK_SIZE)
+        offset += _copy_chunk(
+            source_fd, destination_fd, offset, count, devices
+        )
+    return offset - start
+
+
+def _copy_chunk(
+    source_fd: int,
+    destination_fd: int,
+    offset: int,
+    count: int,
+    devices: _DevicePair,
+) -> int:
+    """Copies part of a file, with the fastest system call that works between
+    the two devices.
+
+    Some filesystems make copy_file_range or sendfile copy nothing instead of
+    failing, which looks the same as the end of the file. Whether the file
+    really ends early is checked with a plain read.
+
+    :return: The number of bytes that were copied, which is more than 0
+    :raises SourceChangedError: If the file ends before the offset
+    """
+    no_progress: Optional[Set[_DevicePair]] = None
+    if hasattr(os, "copy_file_range") and devices not in _no_copy_file_range:
+        try:
+            copied = os.copy_file_range(
+                source_fd, destination_fd, count, offset, offset
+            )
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            _no_copy_file_range.add(devices)
+        else:
+            if copied > 0:
+                return copied
+            no_progress = _no_copy_file_range
+
+    if no_progress is None and devices not in _no_sendfile:
+        # sendfile writes where the destination's position is
+        os.lseek(destination_fd, offset, os.SEEK_SET)
+        try:
+            copied = os.sendfile(destination_fd, source_fd, offset, count)
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            _no_sendfile.add(devices)
+        else:
+            if copied > 0:
+                return copied
+            no_progress = _no_sendfile
+
+    data = os.pread(source_fd, count, offset)
+    if len(data) == 0:
+        # Otherwise, the rest of the copy would be left as zeros
+        raise SourceChangedError(
+            "The file was made shorter while it was being copied"
+        )
+    if no_progress is not None:
+        # There was more to copy, so the faster way doesn't work here
+        no_progress.add(devices)
+    return os.pwrite(destination_fd, data, offset)
@@ -1,15 +1,16 @@
+import grp
 import os
-import subprocess
+import shutil
 import sys
 from pathlib import Path
-from threading import RLock
 from typing import List
-from typing import Optional
 
 import distro
 import i18n
 
+from . import permissions
 from . import print_utils
+from . import process_utils
 
 BRAINFRAME_GROUP_ID = 1337
 """An arbitrary group ID value for the 'brainframe' group. We have to specify
@@ -18,57 +19,6 @@ containers agree on it.
 """
 
 
-class _CurrentCommand:
-    """Contains information on the current command being run as a subprocess, if one
-    exists.
-    """
-
-    _process: Optional[subprocess.Popen] = None
-    _lock = RLock()
-    _interrupted = False
-
-    @property
-    def process(self) -> Optional[subprocess.Popen]:
-        """
-        :return: The currently running subprocess, or None if no subprocess is running
-        """
-        with self._lock:
-            return self._process
-
-    @process.setter
-    def process(self, value: subprocess.Popen) -> None:
-        with self._lock:
-            if self._process is not None and self._process.poll() is None:
-                # This is never expected to happen, as subprocesses are run in serial
-                # and in a blocking fashion
-                raise RuntimeError("Only one process may be run at once")
-
-            self._process = value
-
-    @property
-    def interrupted(self) -> bool:
-        """
-        :return: If true, the subprocess was interrupted by a signal
-        """
-        return self._interrupted
-
-    def send_signal(self, sig: int):
-        """
-        :param sig: The signal to send to the subprocess
-        """
-        with self._lock:
-            if self._process is None:
-                message = (
-                    "Attempted to send a signal when no process was running"
-                )
-                raise RuntimeError(message)
-            self._interrupted = True
-            self._process.send_signal(sig)
-
-
-current_command = _CurrentCommand()
-
-
 def create_group(group_name: str, group_id: int):
     # Check if the group exists
     result = run(["getent", "group", group_name], exit_on_failure=False)
@@ -77,10 +27,14 @@ def create_group(group_name: str, group_id: int):
         return
 
     # Create the group
-    result = run(["groupadd", group_name, "--gid", str(group_id)])
+    result = run(
+        ["groupadd", group_name, "--gid", str(group_id)],
+        exit_on_failure=False,
+        capture=True,
+    )
     if result.returncode != 0:
         print_utils.fail_translate(
-            "install.create-group-failure", error=str(result.stderr)
+            "install.create-group-failure", error="\n".join(result.output)
         )
 
 
@@ -90,12 +44,9 @@ def added_to_group(group_name):
     `currently_in_group`.
     """
     result = run(
-        ["id", "-Gn", _current_user()],
-        stdout=subprocess.PIPE,
-        encoding="utf-8",
-        print_command=False,
+        ["id", "-Gn", _current_user()], print_command=False, capture=True
     )
-    return group_name in result.stdout.readline().split()
+    return group_name in _first_line(result).split()
 
 
 def currently_in_group(group_name):
@@ -103,13 +54,8 @@ def currently_in_group(group_name):
     user was added to the group but the change hasn't been applied yet. Compare
     to `added_to_group`.
     """
-    result = run(
-        ["id", "-Gn"],
-        stdout=subprocess.PIPE,
-        encoding="utf-8",
-        print_command=False,
-    )
-    return group_name in result.stdout.readline().split()
+    result = run(["id", "-Gn"], print_command=False, capture=True)
+    return group_name in _first_line(result).split()
 
 
 def add_to_group(group_name):
@@ -121,11 +67,66 @@ def is_root():
     return os.geteuid() == 0
 
 
-def give_brainframe_group_rw_access(paths: List[Path]):
-    paths_str = [str(p) for p in paths]
+def give_brainframe_group_rw_access(
+    paths: List[Path], check=False
+) -> permissions.PermissionReport:
+    """Recursively gives the 'brainframe' group ownership of, and read and write
+    access to, the given paths. Only files that don't already have the right
+    group and mode are changed.
+
+    :param paths: The files and directories to give access to
+    :param check: If True, nothing is changed and only a report is printed
+    :return: A summary of what was, or would have been, changed
+    """
+    try:
+        gid = grp.getgrnam("brainframe").gr_gid
+    except KeyError:
+        print_utils.fail_translate("general.missing-brainframe-group")
+    report = permissions.give_group_rw_access(paths, gid, check=check)
+
+    print_utils.translate(
+        (
+            "general.permissions-checked"
+            if check
+            else "general.permissions-fixed"
+        ),
+        paths=", ".join(str(p) for p in paths),
+        scanned=report.scanned,
+        group_changed=report.group_changed,
+        mode_changed=report.mode_changed,
+    )
+    if len(report.errors) > 0:
+        for error in report.errors:
+            print_utils.print_color(
+                str(error), print_utils.Color.RED, file=sys.stderr
+            )
+        if not check:
+            print_utils.fail_translate(
+                "general.permissions-errors", count=len(report.errors)
+            )
+
+    return report
+
+
+def lower_io_priority() -> None:
+    """Lowers the CPU and I/O priority of the current process, so that long
+    running background work doesn't slow down BrainFrame. Threads started after
+    this is called inherit the lowered priority.
+    """
+    os.nice(10)
+    if shutil.which("ionice") is not None:
+        # Use the idle I/O scheduling class, which only gets disk time when no
+        # other process needs it
+        run(
+            ["ionice", "-c", "3", "-p", str(os.getpid())],
+            print_command=False,
+            exit_on_failure=False,
+            capture=True,
+        )
 
-    run(["chgrp", "-R", "brainframe"] + paths_str)
-    run(["chmod", "-R", "g+rw"] + paths_str)
+
+def _first_line(result: process_utils.CommandResult) -> str:
+    return result.output[0] if len(result.output) > 0 else ""
 
 
 def _current_user():
@@ -142,30 +143,38 @@ def run(
     command: List[str],
     print_command=True,
     exit_on_failure=True,
-    *args,
     **kwargs,
-) -> subprocess.Popen:
-    """A small wrapper around subprocess.run.
+) -> process_utils.CommandResult:
+    """A small wrapper around process_utils.execute that runs a single command
+    in the foreground.
 
     :param command: The command to run
     :param print_command: If True, the command will be printed before being run
     :param exit_on_failure: If True, the application will exit if the command
-        results in a non-zero exit code
+        results in a non-zero exit code or times out
+    :param kwargs: Passed to process_utils.execute, see its documentation for
+        output capture and timeout options
     """
     if print_command:
         print_utils.print_color(" ".join(command), print_utils.Color.MAGENTA)
 
-    current_command.process = subprocess.Popen(command, *args, **kwargs)
-    current_command.process.wait()
+    result = process_utils.execute(command, **kwargs)
 
-    if current_command.interrupted:
+    if process_utils.running_processes.interrupted:
         # A signal was sent to the command before it finished
         print_utils.fail_translate("general.interrupted")
-    elif current_command.process.returncode != 0 and exit_on_failure:
-        # The command failed during normal execution
-        sys.exit(current_command.process.returncode)
-
-    return current_command.process
+    elif result.timed_out and exit_on_failure:
+        print_utils.fail_translate(
+            "general.command-timed-out", command=" ".join(command)
+        )
+    elif result.returncode != 0 and exit_on_failure:
+        # The command failed during normal execution. If its output was
+        # captured, the user hasn't seen it yet
+        if len(result.output) > 0 and kwargs.get("label") is None:
+            print("\n".join(result.output), file=sys.stderr)
+        sys.exit(result.returncode)
+
+    return result
 
 
 _SUPPORTED_DISTROS = {
@@ -0,0 +1,120 @@
+import os
+import queue
+from threading import Lock
+from threading import Thread
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+DirectoryVisitor = Callable[[str, List[os.DirEntry]], Iterable[str]]
+"""Called with a directory's path and its entries. Returns the paths of the
+subdirectories that should be walked next.
+"""
+
+CachedListing = Callable[[str], Optional[Iterable[str]]]
+"""Called with a directory's path before it's read. Returns the paths of its
+subdirectories if they're already known and the directory doesn't need to be
+read, or None if it does.
+"""
+
+
+def default_worker_count() -> int:
+    """
+    :return: The number of threads to walk with by default. Walking is mostly
+        spent waiting on the filesystem, so this is more than the CPU count.
+    """
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+def subdirectories(entries: List[os.DirEntry]) -> List[str]:
+    """A helper for visitors that want to walk into every subdirectory.
+    Symbolic links are not followed.
+    """
+    return [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+
+
+def walk(
+    roots: Iterable[str],
+    visit: DirectoryVisitor,
+    workers: Optional[int] = None,
+    cached: Optional[CachedListing] = None,
+) -> List[OSError]:
+    """Walks one or more directory trees, reading directories on multiple
+    threads at once. The order that directories are visited in is not defined,
+    and `visit` is called from multiple threads at once.
+
+    :param roots: The directories to start walking from
+    :param visit: Called for every directory that is walked
+    :param workers: The number of threads to walk with
+    :param cached: If provided, called before each directory is read. When it
+        returns a list of subdirectories, the directory isn't read or visited,
+        and the walk moves on to the listed subdirectories.
+    :return: Errors encountered while reading directories, like those caused by
+        permissions or by files being deleted mid-walk. These do not stop the
+        walk.
+    """
+    worker_count = workers or default_worker_count()
+    root_list = list(roots)
+    if len(root_list) == 0:
+        return []
+
+    directories: "queue.Queue[Optional[str]]" = queue.Queue()
+    errors: List[OSError] = []
+    failures: List[BaseException] = []
+    lock = Lock()
+    # The number of directories that have been queued but not fully visited
+    outstanding = len(root_list)
+
+    def stop_workers() -> None:
+        for _ in range(worker_count):
+            directories.put(None)
+
+    def work() -> None:
+        nonlocal outstanding
+
+        while True:
+            directory = directories.get()
+            if directory is None:
+                return
+
+            next_directories: List[str] = []
+            try:
+                if len(failures) == 0:
+                    known = None if cached is None else cached(directory)
+                    if known is not None:
+                        next_directories = list(known)
+                    else:
+                        with os.scandir(directory) as scan:
+                            entries = list(scan)
+                        next_directories = list(visit(directory, entries))
+            except OSError as exc:
+                with lock:
+                    errors.append(exc)
+            except BaseException as exc:
+                # Unexpected errors stop the walk and are re-raised once every
+                # worker has stopped
+                with lock:
+                    failures.append(exc)
+
+            with lock:
+                outstanding += len(next_directories) - 1
+                finished = outstanding == 0
+            for next_directory in next_directories:
+                directories.put(next_directory)
+            if finished:
+                stop_workers()
+
+    for root in root_list:
+        directories.put(root)
+
+    threads = [Thread(target=work, daemon=True) for _ in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if len(failures) > 0:
+        raise failures[0]
+
+    return errors
@@ -0,0 +1,150 @@
+import os
+import stat
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import parallel_walk
+
+GROUP_RW = stat.S_IRGRP | stat.S_IWGRP
+"""The mode bits that give a file's group read and write access"""
+
+
+class PermissionReport(NamedTuple):
+    scanned: int
+    """The number of files and directories that were looked at"""
+    group_changed: int
+    """The number of files and directories whose group was (or would be)
+    changed
+    """
+    mode_changed: int
+    """The number of files and directories whose mode was (or would be)
+    changed
+    """
+    files: int
+    """The number of regular files that were looked at"""
+    bytes: int
+    """The total size of those regular files"""
+    errors: List[OSError]
+
+
+class _Counter:
+    """Counts the results of a permission fix across multiple threads"""
+
+    def __init__(self) -> None:
+        self.scanned = 0
+        self.group_changed = 0
+        self.mode_changed = 0
+        self.files = 0
+        self.bytes = 0
+        self.errors: List[OSError] = []
+        self._lock = Lock()
+
+    def add(
+        self,
+        scanned: int,
+        group_changed: int,
+        mode_changed: int,
+        errors: List[OSError],
+        files: int = 0,
+        bytes_: int = 0,
+    ) -> None:
+        with self._lock:
+            self.scanned += scanned
+            self.group_changed += group_changed
+            self.mode_changed += mode_changed
+            self.files += files
+            self.bytes += bytes_
+            self.errors += errors
+
+
+def give_group_rw_access(
+    paths: Iterable[Path],
+    gid: int,
+    check: bool = False,
+    workers: Optional[int] = None,
+) -> PermissionReport:
+    """Recursively gives the group with the given ID ownership of, and read and
+    write access to, the given paths. This is equivalent to running
+    `chgrp -R` followed by `chmod -R g+rw`, but only files that need to be
+    changed are written to, and directories are read on multiple threads.
+
+    Symbolic links are neither changed nor followed.
+
+    :param paths: The files and directories to give access to
+    :param gid: The ID of the group to give access to
+    :param check: If True, nothing is changed and the report only says what
+        would have been changed
+    :param workers: The number of threads to walk directories with
+    :return: A summary of what was changed
+    """
+    counter = _Counter()
+
+    def fix(path: str, stat_result: os.stat_result) -> None:
+        group_changed = 0
+        mode_changed = 0
+        errors: List[OSError] = []
+
+        if not stat.S_ISLNK(stat_result.st_mode):
+            try:
+                if stat_result.st_gid != gid:
+                    group_changed = 1
+                    if not check:
+                        os.chown(path, -1, gid, follow_symlinks=False)
+                if stat_result.st_mode & GROUP_RW != GROUP_RW:
+                    mode_changed = 1
+                    if not check:
+                        os.chmod(
+                            path, stat.S_IMODE(stat_result.st_mode) | GROUP_RW
+                        )
+            except OSError as exc:
+                errors.append(exc)
+
+        is_file = stat.S_ISREG(stat_result.st_mode)
+        counter.add(
+            1,
+            group_changed,
+            mode_changed,
+            errors,
+            files=1 if is_file else 0,
+            bytes_=stat_result.st_size if is_file else 0,
+        )
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        for entry in entries:
+            try:
+                stat_result = entry.stat(follow_symlinks=False)
+            except OSError as exc:
+                counter.add(0, 0, 0, [exc])
+                continue
+            fix(entry.path, stat_result)
+
+        return parallel_walk.subdirectories(entries)
+
+    roots: List[str] = []
+    for path in paths:
+        try:
+            stat_result = os.lstat(path)
+        except OSError as exc:
+            counter.add(0, 0, 0, [exc])
+            continue
+
+        # The paths themselves aren't entries in any directory that is walked,
+        # so they're fixed here
+        fix(str(path), stat_result)
+        if stat.S_ISDIR(stat_result.st_mode):
+            roots.append(str(path))
+
+    walk_errors = parallel_walk.walk(roots, visit, workers=workers)
+
+    return PermissionReport(
+        scanned=counter.scanned,
+        group_changed=counter.group_changed,
+        mode_changed=counter.mode_changed,
+        files=counter.files,
+        bytes=counter.bytes,
+        errors=counter.errors + walk_errors,
+    )
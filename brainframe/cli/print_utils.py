@@ -3,6 +3,8 @@ import readline
 import sys
 from enum import Enum
 from pathlib import Path
+from typing import Any
+from typing import List
 from typing import NoReturn
 
 import i18n
@@ -87,6 +89,53 @@ def print_color(message, color: Color, **kwargs) -> None:
     print(f"{color.value}{message}{Color.END.value}", **kwargs)
 
 
+def print_table(headers: List[str], rows: List[List[Any]]) -> None:
+    """Prints rows of values in aligned columns.
+
+    :param headers: The name of each column
+    :param rows: The values in each row, in the same order as the headers
+    """
+    cells = [headers] + [[str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+
+    for i, row in enumerate(cells):
+        line = "   ".join(
+            value.ljust(width) for value, width in zip(row, widths)
+        ).rstrip()
+        if i == 0:
+            print_color(line, Color.BOLD)
+        else:
+            print(line)
+
+
+def format_bytes(count: float) -> str:
+    """
+    :return: A human readable version of the byte count, like "1.5GiB"
+    """
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if abs(count) < 1024 or unit == "TiB":
+            break
+        count /= 1024
+    return f"{count:.1f}{unit}"
+
+
+def format_duration(seconds: float) -> str:
+    """
+    :return: A short, human readable version of the duration, like "3d 4h"
+    """
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days > 0:
+        return f"{days}d {hours}h"
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    if minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+
 def input_color(message, color: Color) -> str:
     color = _check_no_color(color)
     # See https://superuser.com/a/301355 for why these non-visible delimiters
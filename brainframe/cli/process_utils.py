@@ -0,0 +1,326 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from threading import RLock
+from threading import Thread
+from typing import IO
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+
+from . import print_utils
+from . import tracing
+
+
+class _RunningProcesses:
+    """Contains every subprocess that is currently being run, so that signals can
+    be forwarded to all of them at once.
+    """
+
+    def __init__(self) -> None:
+        self._processes: Set[subprocess.Popen] = set()
+        self._lock = RLock()
+        self._interrupted = False
+
+    def add(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.add(process)
+
+    def remove(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    @property
+    def empty(self) -> bool:
+        """
+        :return: True if no subprocess is currently running
+        """
+        with self._lock:
+            return len(self._processes) == 0
+
+    @property
+    def interrupted(self) -> bool:
+        """
+        :return: If true, the running subprocesses were interrupted by a signal
+        """
+        return self._interrupted
+
+    def send_signal(self, sig: int) -> None:
+        """
+        :param sig: The signal to send to every running subprocess
+        """
+        with self._lock:
+            if len(self._processes) == 0:
+                message = (
+                    "Attempted to send a signal when no process was running"
+                )
+                raise RuntimeError(message)
+            self._interrupted = True
+            for process in self._processes:
+                if process.poll() is None:
+                    process.send_signal(sig)
+
+
+running_processes = _RunningProcesses()
+
+DEFAULT_TAIL_LINES = 100
+"""The number of lines of captured output kept for error reports"""
+
+_TERMINATE_GRACE_PERIOD = 10
+"""The number of seconds a timed out process has to stop before it is killed"""
+
+_output_lock = RLock()
+"""Prevents lines of labelled output from different tasks from being mixed"""
+
+
+class CommandResult(NamedTuple):
+    command: List[str]
+    returncode: int
+    output: List[str]
+    """The last lines of output from the command, if its output was captured"""
+    timed_out: bool
+
+
+def execute(
+    command: List[str],
+    label: Optional[str] = None,
+    capture: bool = False,
+    on_line: Optional[Callable[[str], None]] = None,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> CommandResult:
+    """Runs a command to completion, keeping track of it in `running_processes`
+    while it runs.
+
+    If the command's output is captured, it is read line by line as it is
+    produced, so the pipe never fills up and only the last `tail_lines` lines
+    are ever held in memory.
+
+    :param command: The command to run
+    :param label: If provided, the command's output is captured and printed
+        line by line, prefixed with this label
+    :param capture: If True, the command's stdout and stderr are captured
+        instead of being printed
+    :param on_line: If provided, the command's output is captured and this
+        function is called with each line of it, without the trailing newline.
+        Carriage returns, like those used by progress bars, also end a line.
+    :param tail_lines: The number of lines of captured output to keep
+    :param timeout: If provided, the command is terminated if it does not
+        finish within this many seconds
+    :param kwargs: Passed to subprocess.Popen
+    :return: The result of the finished command
+    """
+    piped = capture or label is not None or on_line is not None
+    if piped:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.STDOUT
+        kwargs["universal_newlines"] = True
+
+    tail: Deque[str] = deque(maxlen=tail_lines)
+
+    def read_output(stream: IO[str]) -> None:
+        for line in stream:
+            line = line.rstrip("\n")
+            tail.append(line)
+            if label is not None:
+                _print_labelled(label, line)
+            if on_line is not None:
+                on_line(line)
+
+    with tracing.span(
+        _span_name(command), "process", command=" ".join(command)
+    ) as span:
+        process = subprocess.Popen(command, **kwargs)
+        running_processes.add(process)
+        reader = None
+        timed_out = False
+        try:
+            if piped:
+                assert process.stdout is not None
+                reader = Thread(
+                    target=read_output, args=(process.stdout,), daemon=True
+                )
+                reader.start()
+
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                _terminate(process)
+
+            if reader is not None:
+                reader.join()
+        finally:
+            running_processes.remove(process)
+        span.set("returncode", process.returncode)
+
+    return CommandResult(command, process.returncode, list(tail), timed_out)
+
+
+def _span_name(command: List[str]) -> str:
+    """Names a command for tracing by its executable and up to two
+    subcommands, like "docker compose pull". Arguments that look like flags or
+    paths are skipped, so that similar commands are grouped together.
+    """
+    words = [os.path.basename(command[0])]
+    for argument in command[1:]:
+        if len(words) == 3:
+            break
+        if _SUBCOMMAND_PATTERN.match(argument):
+            words.append(argument)
+    return " ".join(words)
+
+
+_SUBCOMMAND_PATTERN = re.compile(r"^[a-z][a-z0-9-]*$")
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    """Asks the process to stop, then kills it if it does not stop in time"""
+    process.terminate()
+    try:
+        process.wait(_TERMINATE_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class TaskResult(NamedTuple):
+    label: str
+    command: List[str]
+    returncode: Optional[int]
+    """The exit code of the command, or None if the command was never started"""
+    duration: Optional[float] = None
+    """How long the command ran for, in seconds, or None if it was never
+    started
+    """
+    output: Optional[List[str]] = None
+    """The last lines of output from the command, if its output was captured
+    instead of printed
+    """
+
+
+class ProcessGroup:
+    """Runs a group of independent commands at the same time.
+
+    The output of each command is prefixed with the label of the task it belongs
+    to, so that interleaved output can still be followed.
+    """
+
+    def __init__(
+        self, max_workers: Optional[int] = None, print_output: bool = True
+    ):
+        """
+        :param max_workers: The maximum number of commands to run at once.
+            Defaults to the number of CPUs.
+        :param print_output: If False, the output of each command is captured
+            instead of printed, and is only shown if the command fails
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.print_output = print_output
+        self._tasks: Dict[str, List[str]] = {}
+        self._popen_kwargs: Dict[str, dict] = {}
+
+    def add(self, label: str, command: List[str], **kwargs) -> None:
+        """Adds a command to the group. It will not be started until `run` is
+        called.
+
+        :param label: A unique name for this task, used to prefix its output
+        :param command: The command to run
+        :param kwargs: Passed to `execute`
+        """
+        if label in self._tasks:
+            raise ValueError(f"A task with label '{label}' already exists")
+        self._tasks[label] = command
+        self._popen_kwargs[label] = kwargs
+
+    def run(
+        self, print_commands=True, exit_on_failure=True
+    ) -> Dict[str, TaskResult]:
+        """Runs every task in the group, at most `max_workers` at a time.
+
+        :param print_commands: If True, each command will be printed before
+            being run
+        :param exit_on_failure: If True, the application will exit if any
+            command results in a non-zero exit code. Tasks that have not
+            started yet are cancelled once a failure is seen.
+        :return: The result of each task, by label
+        """
+        results: Dict[str, TaskResult] = {
+            label: TaskResult(label, command, None)
+            for label, command in self._tasks.items()
+        }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {
+                executor.submit(self._run_task, label, print_commands)
+                for label in self._tasks
+            }
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    result = future.result()
+                    results[result.label] = result
+                    if result.returncode != 0 and exit_on_failure:
+                        for other in pending:
+                            other.cancel()
+
+        if running_processes.interrupted:
+            # A signal was sent to the commands before they finished
+            print_utils.fail_translate("general.interrupted")
+
+        if exit_on_failure:
+            for result in results.values():
+                if result.returncode is not None and result.returncode != 0:
+                    if result.output is not None:
+                        # The user hasn't seen the command's output yet
+                        print("\n".join(result.output), file=sys.stderr)
+                    print_utils.fail_translate(
+                        "general.task-failed",
+                        label=result.label,
+                        returncode=result.returncode,
+                    )
+
+        return results
+
+    def _run_task(self, label: str, print_commands: bool) -> TaskResult:
+        command = self._tasks[label]
+        if print_commands:
+            _print_labelled(
+                label, " ".join(command), print_utils.Color.MAGENTA
+            )
+
+        started_at = time.monotonic()
+        if self.print_output:
+            result = execute(command, label=label, **self._popen_kwargs[label])
+        else:
+            result = execute(
+                command, capture=True, **self._popen_kwargs[label]
+            )
+        return TaskResult(
+            label,
+            command,
+            result.returncode,
+            time.monotonic() - started_at,
+            None if self.print_output else result.output,
+        )
+
+
+def _print_labelled(
+    label: str, line: str, color=print_utils.Color.END
+) -> None:
+    with _output_lock:
+        print_utils.print_color(f"[{label}] ", print_utils.Color.BLUE, end="")
+        print_utils.print_color(line, color, flush=True)
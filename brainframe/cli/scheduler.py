@@ -0,0 +1,179 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from . import print_utils
+from . import process_utils
+from . import tracing
+
+
+class Step(NamedTuple):
+    name: str
+    function: Callable[[], Any]
+    depends_on: Sequence[str]
+
+
+class StepTiming(NamedTuple):
+    start: float
+    """Seconds since the scheduler was created that the step started at"""
+    duration: float
+
+
+class StepScheduler:
+    """Runs the steps of an operation, starting each step as soon as every step
+    it depends on has finished. Steps that don't depend on each other are run at
+    the same time.
+
+    Steps are run on worker threads, so they must not prompt the user for input.
+    Any questions should be asked before the scheduler is run.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.results: Dict[str, Any] = {}
+        """The value returned by each finished step, by name"""
+        self.timings: Dict[str, StepTiming] = {}
+        self.created_at = time.monotonic()
+        """The monotonic clock time that step timings are relative to"""
+
+        self._steps: Dict[str, Step] = {}
+
+    def add(
+        self,
+        name: str,
+        function: Callable[[], Any],
+        depends_on: Sequence[str] = (),
+    ) -> None:
+        """Adds a step. It will not be started until `run` is called.
+
+        :param name: A unique name for the step
+        :param function: The function that performs the step
+        :param depends_on: The names of steps that must finish before this one
+            can start. These may be steps that finished in a previous call to
+            `run`.
+        """
+        if name in self._steps:
+            raise ValueError(f"A step with name '{name}' already exists")
+        for dependency in depends_on:
+            if dependency not in self._steps:
+                raise ValueError(
+                    f"Step '{name}' depends on unknown step '{dependency}'"
+                )
+
+        self._steps[name] = Step(name, function, depends_on)
+
+    def run(self) -> None:
+        """Runs every step that has not been run yet, and waits for them to
+        finish. If a step raises an exception, no new steps are started, any
+        running commands are stopped, and the exception is re-raised once the
+        running steps have finished.
+        """
+        remaining = [
+            s for s in self._steps.values() if s.name not in self.results
+        ]
+        running: Dict[Future, Step] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(remaining) > 0 or len(running) > 0:
+                if error is None:
+                    for step in self._ready_steps(remaining):
+                        remaining.remove(step)
+                        future = executor.submit(self._run_step, step)
+                        running[future] = step
+
+                if len(running) == 0:
+                    # Nothing can be started, which only happens if a previous
+                    # step failed
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    exception = future.exception()
+                    if exception is not None and error is None:
+                        error = exception
+                        self._stop_running_commands()
+                    elif exception is None:
+                        self.results[step.name] = future.result()
+
+        if error is not None:
+            raise error
+
+    def print_timing_report(self) -> None:
+        """Prints how long each step took and when it started"""
+        if len(self.timings) == 0:
+            return
+
+        total = busy_time(self.timings.values())
+        serial_total = sum(t.duration for t in self.timings.values())
+
+        print()
+        print_utils.translate("general.timing-report-header")
+        name_width = max(len(name) for name in self.timings)
+        for name, timing in sorted(
+            self.timings.items(), key=lambda item: item[1].start
+        ):
+            print(
+                f"  {name:<{name_width}}  "
+                f"+{timing.start:7.1f}s  {timing.duration:7.1f}s"
+            )
+        print_utils.translate(
+            "general.timing-report-total",
+            total=f"{total:.1f}",
+            serial_total=f"{serial_total:.1f}",
+        )
+
+    def _ready_steps(self, remaining: List[Step]) -> List[Step]:
+        return [
+            step
+            for step in remaining
+            if all(d in self.results for d in step.depends_on)
+        ]
+
+    def _run_step(self, step: Step) -> Any:
+        start = time.monotonic()
+        try:
+            with tracing.span(step.name, "step"):
+                return step.function()
+        finally:
+            end = time.monotonic()
+            self.timings[step.name] = StepTiming(
+                start=start - self.created_at, duration=end - start
+            )
+
+    @staticmethod
+    def _stop_running_commands() -> None:
+        try:
+            process_utils.running_processes.send_signal(signal.SIGTERM)
+        except RuntimeError:
+            # No commands are running
+            return
+        print_utils.warning_translate("general.stopping-remaining-steps")
+
+
+def busy_time(timings: Iterable[StepTiming]) -> float:
+    """
+    :return: The amount of time that at least one step was running for. Time
+        spent between calls to `StepScheduler.run` is not counted.
+    """
+    busy = 0.0
+    busy_until = float("-inf")
+    for timing in sorted(timings):
+        end = timing.start + timing.duration
+        if end <= busy_until:
+            continue
+        busy += end - max(timing.start, busy_until)
+        busy_until = end
+    return busy
@@ -0,0 +1,225 @@
+import heapq
+import os
+import stat
+from pathlib import Path
+from threading import Event
+from threading import Lock
+from threading import Thread
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from . import parallel_walk
+from . import print_utils
+
+PER_FILE_COST = 256 * 1024
+"""How many bytes of copying each file is treated as costing on top of its
+size when shards are balanced. Creating a file, setting its attributes and
+checking it on the other side take about as long as copying this much data,
+so a shard of many small files isn't given as many bytes as one of a few large
+files.
+"""
+
+MAX_AUTO_SHARDS = 8
+"""The most shards that are picked automatically. Past this, more copies at
+once rarely help even on fast storage.
+"""
+
+UNKNOWN_DEVICE_SHARDS = 2
+"""The number of shards picked automatically when the type of storage can't
+be found, like for network filesystems
+"""
+
+_SYS_DEV_BLOCK = Path("/sys/dev/block")
+
+_PROGRESS_INTERVAL = 5
+"""How often, in seconds, copying progress is printed"""
+
+
+class Shard(NamedTuple):
+    paths: List[str]
+    """Paths relative to the root that was scanned, of everything other than
+    directories
+    """
+    bytes: int
+
+
+class ShardPlan(NamedTuple):
+    shards: List[Shard]
+    """Shards with no paths are left out"""
+    directories: List[str]
+    """Every directory under the root, relative to it, including the root
+    itself as "."
+    """
+    errors: List[OSError]
+
+    @property
+    def files(self) -> int:
+        return sum(len(s.paths) for s in self.shards)
+
+    @property
+    def bytes(self) -> int:
+        return sum(s.bytes for s in self.shards)
+
+
+def plan(
+    root: Path,
+    count: int,
+    exclude_names: Iterable[str] = (),
+    exclude: Iterable[Path] = (),
+) -> ShardPlan:
+    """Splits a directory tree into shards that take about as long to copy as
+    each other, using the files' sizes and how many of them there are. The tree
+    is read on multiple threads.
+
+    Files are handed out largest first, each to the shard with the least work
+    so far, which keeps the slowest shard close to the average.
+
+    :param root: The directory tree to split
+    :param count: The number of shards to split it into
+    :param exclude_names: Files and directories with these names are left
+        out, wherever they are in the tree
+    :param exclude: Paths that are left out, along with everything under them
+    :return: The plan
+    """
+    excluded_names = set(exclude_names)
+    excluded = {str(p) for p in exclude}
+    lock = Lock()
+    entries_found: List[Tuple[int, str]] = []
+    directories = ["."]
+
+    def relative(path: str) -> str:
+        return os.path.relpath(path, root)
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        subdirectories = []
+        found = []
+        for entry in entries:
+            if entry.name in excluded_names or entry.path in excluded:
+                continue
+            try:
+                stat_result = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                # Deleted since the directory was read
+                continue
+            if stat.S_ISDIR(stat_result.st_mode):
+                subdirectories.append(entry.path)
+                continue
+            size = (
+                stat_result.st_size if stat.S_ISREG(stat_result.st_mode) else 0
+            )
+            found.append((size, relative(entry.path)))
+        with lock:
+            entries_found.extend(found)
+            directories.extend(relative(d) for d in subdirectories)
+        return subdirectories
+
+    errors = parallel_walk.walk([str(root)], visit)
+
+    # Longest processing time first
+    entries_found.sort(reverse=True)
+    paths: List[List[str]] = [[] for _ in range(count)]
+    sizes = [0] * count
+    loads = [(0, i) for i in range(count)]
+    for size, path in entries_found:
+        load, i = heapq.heappop(loads)
+        paths[i].append(path)
+        sizes[i] += size
+        heapq.heappush(loads, (load + size + PER_FILE_COST, i))
+
+    shards = [Shard(p, s) for p, s in zip(paths, sizes) if len(p) > 0]
+    return ShardPlan(shards, sorted(directories), errors)
+
+
+def auto_count(paths: Iterable[Path]) -> int:
+    """Picks how many shards to copy between some paths with, from the type of
+    storage they're on. Spinning disks slow down when asked to read or write in
+    several places at once, so they get a single shard. Solid state storage
+    gets one shard per CPU, up to MAX_AUTO_SHARDS.
+
+    :param paths: The paths that will be read from and written to
+    :return: The number of shards
+    """
+    rotational = [is_rotational(p) for p in paths]
+    if any(r is True for r in rotational):
+        return 1
+    if any(r is None for r in rotational):
+        return UNKNOWN_DEVICE_SHARDS
+    return max(1, min(MAX_AUTO_SHARDS, os.cpu_count() or 1))
+
+
+def is_rotational(path: Path) -> Optional[bool]:
+    """
+    :return: True if the path is on a spinning disk, False if it's on solid
+        state storage, or None if the type of storage couldn't be found
+    """
+    try:
+        device = os.stat(path).st_dev
+        block_path = _SYS_DEV_BLOCK / f"{os.major(device)}:{os.minor(device)}"
+        block_path = block_path.resolve(strict=True)
+    except (OSError, RuntimeError):
+        # Filesystems without a block device, like network filesystems and
+        # tmpfs, aren't listed
+        return None
+
+    # Partitions keep their queue settings in the disk they belong to
+    for candidate in (block_path, block_path.parent):
+        try:
+            value = (candidate / "queue" / "rotational").read_text()
+        except OSError:
+            continue
+        return value.strip() == "1"
+    return None
+
+
+class Progress:
+    """Adds up progress reported by the commands copying each shard, and
+    periodically prints it as one report
+    """
+
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self._lock = Lock()
+        self._finished = Event()
+
+    def add(self, files: int, size: int) -> None:
+        with self._lock:
+            self.files += files
+            self.bytes += size
+
+    def rsync_line(self, line: str) -> None:
+        """Reads a line of output from rsync run with
+        --out-format="%l %n", which is printed for every path it copies
+        """
+        size, _, name = line.partition(" ")
+        if not size.isdigit() or name.endswith("/"):
+            return
+        self.add(1, int(size))
+
+    def start(self) -> None:
+        Thread(target=self._print_periodically, daemon=True).start()
+
+    def finish(self) -> None:
+        self._finished.set()
+
+    def print(self) -> None:
+        with self._lock:
+            files, size = self.files, self.bytes
+        percent = 100 * size / self.total_bytes if self.total_bytes else 100
+        print_utils.translate(
+            "backup.progress",
+            files=files,
+            total_files=self.total_files,
+            size=print_utils.format_bytes(size),
+            total_size=print_utils.format_bytes(self.total_bytes),
+            percent=f"{min(percent, 100):.0f}",
+        )
+
+    def _print_periodically(self) -> None:
+        while not self._finished.wait(_PROGRESS_INTERVAL):
+            self.print()
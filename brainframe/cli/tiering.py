@@ -0,0 +1,604 @@
+import errno
+import fnmatch
+import json
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import yaml
+
+from . import compose_override
+from . import config
+from . import native_copy
+from . import os_utils
+from . import parallel_walk
+from . import walk_index
+
+INDEX_FILE_NAME = "storage-tier.sqlite3"
+"""The name of the index of the data path, which is kept in the install path"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirectories TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    cold_path TEXT
+);
+CREATE INDEX IF NOT EXISTS files_by_directory ON files (directory);
+CREATE TABLE IF NOT EXISTS orphans (
+    cold_path TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+ALWAYS_EXCLUDED = ["postgres/*"]
+"""Globs of paths that are never moved, whatever the policy. The database
+rewrites its old files in place, which a move could lose.
+"""
+
+_PARTIAL_SUFFIX = ".tier-partial"
+"""Added to the name of copies that are still being written"""
+
+_LINK_SUFFIX = ".tier-link"
+"""Added to the name of links that are about to replace a moved file"""
+
+_TEMPORARY_SUFFIXES = (_PARTIAL_SUFFIX, _LINK_SUFFIX)
+"""Files with these suffixes are left behind by moves that were interrupted,
+and aren't part of the data
+"""
+
+
+class Policy(NamedTuple):
+    min_age: float
+    """The number of seconds since a file was last modified before it can be
+    moved to the cold path
+    """
+    min_size: int
+    """The smallest file, in bytes, that's worth moving"""
+    include: List[str]
+    """Globs of paths relative to the data path that may be moved. If empty,
+    every path may be moved.
+    """
+    exclude: List[str]
+    """Globs of paths relative to the data path that are never moved"""
+
+    def matches(self, relative_path: str) -> bool:
+        """
+        :return: True if the path is selected by the include and exclude globs
+        """
+        if any(fnmatch.fnmatch(relative_path, g) for g in self.exclude):
+            return False
+        return len(self.include) == 0 or any(
+            fnmatch.fnmatch(relative_path, g) for g in self.include
+        )
+
+    def is_cold(
+        self, relative_path: str, size: int, mtime_ns: int, now: float
+    ) -> bool:
+        """
+        :return: True if the file should be moved to the cold path
+        """
+        return (
+            size >= self.min_size
+            and now - mtime_ns / 1e9 >= self.min_age
+            and self.matches(relative_path)
+        )
+
+
+class TierFile(NamedTuple):
+    path: str
+    """The path of the file relative to the data path"""
+    size: int
+    mtime_ns: int
+    cold_path: Optional[str]
+    """Where the file was moved to, if it's in the cold path. The file in the
+    data path is then a symbolic link to this path.
+    """
+
+
+class ScanResult(NamedTuple):
+    files: List[TierFile]
+    orphans: List[TierFile]
+    """Files in the cold path whose links in the data path were deleted, as
+    they were last indexed
+    """
+    scanned: int
+    """The number of directories that were read, instead of being taken from
+    the index
+    """
+    errors: List[OSError]
+
+
+class MoveResult(NamedTuple):
+    moved: List[TierFile]
+    """The files that were moved, as they are after moving"""
+    bytes: int
+    skipped: int
+    """The number of files that changed or disappeared before they could be
+    moved, and were left where they were
+    """
+    errors: List[str]
+
+
+def index_path(install_path: Path) -> Path:
+    return install_path / INDEX_FILE_NAME
+
+
+def scan(data_path: Path, cold_path: Path, index: Path) -> ScanResult:
+    """Finds every regular file in the data path, and every link to a file that
+    was moved to the cold path. Directories are read on multiple threads, and
+    only directories that changed since the last scan are read at all. The
+    rest are taken from the index, which is updated to match.
+
+    Files with more than one hard link are left out, since moving them would
+    separate them from their other links.
+
+    :param data_path: The data path to scan
+    :param cold_path: The path that cold files are moved to
+    :param index: The path of the index database
+    :return: The files that were found
+    """
+    known_directories, known_files, known_orphans = _load_index(index)
+    cold_prefix = str(cold_path) + os.sep
+    cache = walk_index.DirectoryCache(data_path, known_directories)
+    relative = cache.relative
+
+    lock = Lock()
+    changed: Dict[str, Tuple[int, List[str]]] = {}
+    found: Dict[str, List[TierFile]] = {}
+    link_targets: Set[str] = set()
+
+    def visit(directory: str, entries: List[os.DirEntry]) -> List[str]:
+        relative_dir = relative(directory)
+        subdirectories = []
+        files = []
+        targets = []
+        for entry in entries:
+            if entry.name.endswith(_TEMPORARY_SUFFIXES):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path != str(cold_path):
+                    subdirectories.append(entry.name)
+            elif entry.is_symlink():
+                target = os.readlink(entry.path)
+                targets.append(_absolute_target(entry.path, target))
+                if target.startswith(cold_prefix):
+                    files.append(_cold_file(relative(entry.path), target))
+            elif entry.is_file(follow_symlinks=False):
+                stat_result = entry.stat(follow_symlinks=False)
+                if stat_result.st_nlink == 1:
+                    files.append(
+                        TierFile(
+                            path=relative(entry.path),
+                            size=stat_result.st_size,
+                            mtime_ns=stat_result.st_mtime_ns,
+                            cold_path=None,
+                        )
+                    )
+
+        with lock:
+            changed[relative_dir] = (
+                cache.mtimes[relative_dir],
+                subdirectories,
+            )
+            found[relative_dir] = files
+            link_targets.update(targets)
+        return [os.path.join(directory, name) for name in subdirectories]
+
+    errors = parallel_walk.walk([str(data_path)], visit, cached=cache)
+
+    # Directories that weren't read, either because they didn't change or
+    # because they couldn't be, keep what the index already knew about them
+    unchanged = [d for d in cache.seen if d not in found]
+    all_files = [f for files in found.values() for f in files]
+    for relative_dir in unchanged:
+        all_files += known_files.get(relative_dir, [])
+
+    # Cold files whose links disappeared from a directory that was read
+    # again, or along with a directory that no longer exists. The index
+    # forgets those links below, so orphans are kept in the index until
+    # they're deleted, in case this scan is only a dry run. A link that was
+    # only moved to another directory, or that points to the file some other
+    # way, still keeps its file.
+    seen = set(cache.seen)
+    gone = [d for d in known_files if d not in seen]
+    candidates = {
+        f.cold_path: f
+        for relative_dir in list(found) + gone
+        for f in known_files.get(relative_dir, [])
+        if f.cold_path is not None
+    }
+    candidates.update(
+        (f.cold_path, f) for f in known_orphans if f.cold_path is not None
+    )
+    link_targets.update(f.cold_path for f in all_files if f.cold_path)
+    orphans = [
+        f
+        for cold_file, f in sorted(candidates.items())
+        if cold_file not in link_targets
+        and os.path.lexists(cold_file)
+        and is_orphaned(data_path, f)
+    ]
+
+    _save_index(
+        index,
+        seen=cache.seen,
+        changed={d: changed[d] for d in found},
+        found=found,
+        orphans=orphans,
+    )
+
+    return ScanResult(
+        files=all_files,
+        orphans=orphans,
+        scanned=len(found),
+        errors=errors,
+    )
+
+
+def is_orphaned(data_path: Path, file: TierFile) -> bool:
+    """
+    :return: True if the file was moved to the cold path, and its link in the
+        data path is gone or no longer leads to it
+    """
+    if file.cold_path is None:
+        return False
+    link_path = str(data_path / file.path)
+    try:
+        target = _absolute_target(link_path, os.readlink(link_path))
+    except FileNotFoundError:
+        return True
+    except OSError as exc:
+        # Something other than a link is there now
+        return exc.errno == errno.EINVAL
+    return target != os.path.normpath(file.cold_path)
+
+
+def move_to_cold(
+    data_path: Path,
+    cold_path: Path,
+    files: List[TierFile],
+    policy: Policy,
+    now: float,
+    workers: int,
+) -> MoveResult:
+    """Moves files to the cold path on multiple threads, and replaces each with
+    a symbolic link to its new location. Each file is checked against the
+    policy again right before it's moved, since the index may be out of date.
+
+    A file is first copied next to its final location in the cold path, then
+    renamed into place, and then the link replaces it in the data path in a
+    single rename. A file is never missing from both places, even if the move
+    is interrupted.
+    """
+
+    def move(file: TierFile) -> Optional[TierFile]:
+        source = data_path / file.path
+        before = os.lstat(source)
+        if (
+            not stat.S_ISREG(before.st_mode)
+            or before.st_nlink != 1
+            or not policy.is_cold(
+                file.path, before.st_size, before.st_mtime_ns, now
+            )
+        ):
+            return None
+
+        target = cold_path / file.path
+        _make_parents(data_path, cold_path, Path(file.path).parent)
+        temp_path = target.with_name(target.name + _PARTIAL_SUFFIX)
+        _copy(source, temp_path, before)
+
+        after = os.lstat(source)
+        if _identity(after) != _identity(before):
+            # The file was written to while it was being copied
+            temp_path.unlink()
+            return None
+        os.replace(temp_path, target)
+
+        link_path = source.with_name(f".{source.name}{_LINK_SUFFIX}")
+        try:
+            # Left behind if an earlier move was interrupted
+            link_path.unlink()
+        except FileNotFoundError:
+            pass
+        os.symlink(str(target), link_path)
+        if os_utils.is_root():
+            os.lchown(link_path, before.st_uid, before.st_gid)
+        os.replace(link_path, source)
+
+        return file._replace(
+            size=before.st_size,
+            mtime_ns=before.st_mtime_ns,
+            cold_path=str(target),
+        )
+
+    return _run_parallel(move, files, workers)
+
+
+def recall(data_path: Path, files: List[TierFile], workers: int) -> MoveResult:
+    """Moves files back from the cold path to where their links are in the
+    data path, on multiple threads.
+    """
+
+    def move(file: TierFile) -> Optional[TierFile]:
+        if file.cold_path is None:
+            return None
+        link_path = data_path / file.path
+        if (
+            not link_path.is_symlink()
+            or os.readlink(link_path) != file.cold_path
+        ):
+            return None
+
+        cold_file = Path(file.cold_path)
+        cold_stat = os.lstat(cold_file)
+        temp_path = link_path.with_name(link_path.name + _PARTIAL_SUFFIX)
+        _copy(cold_file, temp_path, cold_stat)
+        os.replace(temp_path, link_path)
+        cold_file.unlink()
+
+        return file._replace(
+            size=cold_stat.st_size,
+            mtime_ns=cold_stat.st_mtime_ns,
+            cold_path=None,
+        )
+
+    return _run_parallel(move, files, workers)
+
+
+def cold_links(index: Path) -> Dict[str, TierFile]:
+    """
+    :return: Every file that was moved to the cold path as of the last scan or
+        move, by its path relative to the data path
+    """
+    if not index.is_file():
+        return {}
+    with walk_index.connect(index, _SCHEMA) as connection:
+        return {
+            path: TierFile(path, size, mtime_ns, cold_path)
+            for path, size, mtime_ns, cold_path in connection.execute(
+                "SELECT path, size, mtime_ns, cold_path FROM files "
+                "WHERE cold_path IS NOT NULL"
+            )
+        }
+
+
+def record_moves(index: Path, files: List[TierFile]) -> None:
+    """Updates the index with files that were moved, so that the index knows
+    which links lead to the cold path before their directories are read again
+    """
+    with walk_index.connect(index, _SCHEMA) as connection:
+        connection.executemany(
+            "UPDATE files SET size = ?, mtime_ns = ?, cold_path = ? "
+            "WHERE path = ?",
+            [(f.size, f.mtime_ns, f.cold_path, f.path) for f in files],
+        )
+
+
+def cold_mount_changes(
+    install_path: Path, data_path: Path, cold_path: Path
+) -> Dict[str, Any]:
+    """Every service that mounts the data path also needs the cold path,
+    mounted at the same path it has on the host, so that links to it work
+    inside the container.
+
+    :return: Changes to the override file that mount the cold path
+    """
+    compose_path = install_path / "docker-compose.yml"
+    compose = yaml.safe_load(compose_path.read_text()) or {}
+    override_file = compose_override.override_path(install_path)
+    override: Dict[str, Any] = {}
+    if override_file.is_file():
+        override = yaml.safe_load(override_file.read_text()) or {}
+
+    mount = f"{cold_path}:{cold_path}"
+    services = {}
+    for name, service in (compose.get("services") or {}).items():
+        sources = [_volume_source(v) for v in service.get("volumes") or []]
+        if not any(_is_data_path(s, data_path) for s in sources):
+            continue
+
+        # Compose replaces the list of volumes in the override file as a
+        # whole, so volumes that are already there are kept
+        existing = ((override.get("services") or {}).get(name) or {}).get(
+            "volumes"
+        ) or []
+        if mount not in existing:
+            services[name] = {"volumes": existing + [mount]}
+
+    return {"services": services} if len(services) > 0 else {}
+
+
+def _run_parallel(
+    move: Callable[[TierFile], Optional[TierFile]],
+    files: List[TierFile],
+    workers: int,
+) -> MoveResult:
+    moved: List[TierFile] = []
+    skipped = 0
+    errors: List[str] = []
+    lock = Lock()
+
+    def work(file: TierFile) -> None:
+        nonlocal skipped
+        try:
+            result = move(file)
+        except OSError as exc:
+            with lock:
+                errors.append(f"{file.path}: {exc}")
+            return
+        with lock:
+            if result is None:
+                skipped += 1
+            else:
+                moved.append(result)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so that unexpected errors are raised
+        list(executor.map(work, files))
+
+    return MoveResult(
+        moved=moved,
+        bytes=sum(f.size for f in moved),
+        skipped=skipped,
+        errors=errors,
+    )
+
+
+def _copy(source: Path, destination: Path, source_stat: os.stat_result):
+    """Copies a file with its permissions, times and owner, and makes sure it's
+    on disk before the original is replaced
+    """
+    native_copy.copy_file(str(source), str(destination), source_stat)
+    with destination.open("rb") as copied:
+        os.fsync(copied.fileno())
+
+
+def _make_parents(data_path: Path, cold_path: Path, relative: Path) -> None:
+    """Makes the directories leading to a file in the cold path, giving them
+    the same permissions and owners as their counterparts in the data path
+    """
+    current_hot = data_path
+    current_cold = cold_path
+    for part in relative.parts:
+        current_hot = current_hot / part
+        current_cold = current_cold / part
+        if current_cold.is_dir():
+            continue
+        hot_stat = current_hot.stat()
+        # Another thread may be making the same directory
+        current_cold.mkdir(exist_ok=True)
+        os.chmod(current_cold, stat.S_IMODE(hot_stat.st_mode))
+        if os_utils.is_root():
+            os.chown(current_cold, hot_stat.st_uid, hot_stat.st_gid)
+
+
+def _identity(stat_result: os.stat_result) -> Tuple[int, int, int]:
+    return stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+def _cold_file(relative_path: str, target: str) -> TierFile:
+    try:
+        target_stat = os.stat(target)
+        size, mtime_ns = target_stat.st_size, target_stat.st_mtime_ns
+    except OSError:
+        # The cold path isn't available. The file is still known to be cold.
+        size, mtime_ns = 0, 0
+    return TierFile(relative_path, size, mtime_ns, target)
+
+
+def _absolute_target(link_path: str, target: str) -> str:
+    """
+    :return: The path a symbolic link leads to, made absolute if the link is
+        relative to the directory it's in
+    """
+    return os.path.normpath(os.path.join(os.path.dirname(link_path), target))
+
+
+def _volume_source(volume: Any) -> str:
+    if isinstance(volume, dict):
+        return str(volume.get("source", ""))
+    return str(volume).split(":")[0]
+
+
+def _is_data_path(source: str, data_path: Path) -> bool:
+    return config.data_path.env_var_name in source or source.startswith(
+        str(data_path)
+    )
+
+
+def _load_index(
+    index: Path,
+) -> Tuple[
+    Dict[str, Tuple[int, List[str]]], Dict[str, List[TierFile]], List[TierFile]
+]:
+    """
+    :return: The modification time and subdirectories of each directory, the
+        files in each directory, and the orphans that haven't been deleted yet
+    """
+    directories: Dict[str, Tuple[int, List[str]]] = {}
+    files: Dict[str, List[TierFile]] = {}
+    orphans: List[TierFile] = []
+    if not index.is_file():
+        return directories, files, orphans
+
+    with walk_index.connect(index, _SCHEMA) as connection:
+        for path, mtime_ns, subdirectories in connection.execute(
+            "SELECT path, mtime_ns, subdirectories FROM directories"
+        ):
+            directories[path] = (mtime_ns, json.loads(subdirectories))
+        for path, directory, size, mtime_ns, cold_path in connection.execute(
+            "SELECT path, directory, size, mtime_ns, cold_path FROM files"
+        ):
+            files.setdefault(directory, []).append(
+                TierFile(path, size, mtime_ns, cold_path)
+            )
+        for cold_path, path, size, mtime_ns in connection.execute(
+            "SELECT cold_path, path, size, mtime_ns FROM orphans"
+        ):
+            orphans.append(TierFile(path, size, mtime_ns, cold_path))
+    return directories, files, orphans
+
+
+def _save_index(
+    index: Path,
+    seen: List[str],
+    changed: Dict[str, Tuple[int, List[str]]],
+    found: Dict[str, List[TierFile]],
+    orphans: List[TierFile],
+) -> None:
+    is_new = not index.exists()
+    with walk_index.connect(index, _SCHEMA) as connection:
+        # Directories that weren't walked to no longer exist
+        walk_index.forget_unseen(connection, seen, "directories")
+        connection.execute(
+            "DELETE FROM files WHERE directory NOT IN (SELECT path FROM seen)"
+        )
+
+        for directory, (mtime_ns, subdirectories) in changed.items():
+            connection.execute(
+                "INSERT OR REPLACE INTO directories "
+                "(path, mtime_ns, subdirectories) VALUES (?, ?, ?)",
+                (directory, mtime_ns, json.dumps(subdirectories)),
+            )
+            connection.execute(
+                "DELETE FROM files WHERE directory = ?", (directory,)
+            )
+            connection.executemany(
+                "INSERT INTO files "
+                "(path, directory, size, mtime_ns, cold_path) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (f.path, directory, f.size, f.mtime_ns, f.cold_path)
+                    for f in found[directory]
+                ],
+            )
+
+        connection.execute("DELETE FROM orphans")
+        connection.executemany(
+            "INSERT INTO orphans (cold_path, path, size, mtime_ns) "
+            "VALUES (?, ?, ?, ?)",
+            [(f.cold_path, f.path, f.size, f.mtime_ns) for f in orphans],
+        )
+
+    if is_new:
+        walk_index.share_with_group(index)
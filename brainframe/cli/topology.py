@@ -0,0 +1,109 @@
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+_CPU_PATH = Path("/sys/devices/system/cpu")
+_NODE_PATH = Path("/sys/devices/system/node")
+_MEMINFO_PATH = Path("/proc/meminfo")
+
+
+class PhysicalCore(NamedTuple):
+    node: int
+    """The NUMA node that the core belongs to"""
+    package: int
+    core: int
+    cpus: List[int]
+    """The logical CPUs (hyperthreads) that share this core"""
+
+
+class HostTopology(NamedTuple):
+    cores: List[PhysicalCore]
+    """Every online physical core, ordered by NUMA node and then by CPU"""
+    memory_bytes: int
+
+    @property
+    def nodes(self) -> List[int]:
+        return sorted({c.node for c in self.cores})
+
+    @property
+    def cpu_count(self) -> int:
+        return sum(len(c.cpus) for c in self.cores)
+
+
+def read_host() -> HostTopology:
+    """Reads the CPU and memory layout of this machine from /sys and /proc.
+    Machines without NUMA information are treated as having one node.
+    """
+    online = parse_cpu_list((_CPU_PATH / "online").read_text())
+
+    node_of_cpu: Dict[int, int] = {}
+    for node_path in sorted(_NODE_PATH.glob("node[0-9]*")):
+        node = int(node_path.name[len("node") :])
+        for cpu in parse_cpu_list((node_path / "cpulist").read_text()):
+            node_of_cpu[cpu] = node
+
+    cores: Dict[Tuple[int, int], List[int]] = {}
+    for cpu in online:
+        topology_path = _CPU_PATH / f"cpu{cpu}" / "topology"
+        package = _read_int(topology_path / "physical_package_id", default=0)
+        core = _read_int(topology_path / "core_id", default=cpu)
+        cores.setdefault((package, core), []).append(cpu)
+
+    physical_cores = [
+        PhysicalCore(
+            node=node_of_cpu.get(cpus[0], 0),
+            package=package,
+            core=core,
+            cpus=sorted(cpus),
+        )
+        for (package, core), cpus in cores.items()
+    ]
+    physical_cores.sort(key=lambda c: (c.node, c.cpus[0]))
+
+    return HostTopology(cores=physical_cores, memory_bytes=_memory_total())
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parses a CPU list in the kernel's format, like "0-3,8,10-11" """
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if part == "":
+            continue
+        first, _, last = part.partition("-")
+        cpus += range(int(first), int(last or first) + 1)
+    return cpus
+
+
+def format_cpu_list(cpus: Iterable[int]) -> str:
+    """Formats CPUs in the kernel's CPU list format, which is also what
+    Docker's cpuset option expects, like "0-3,8,10-11"
+    """
+    ranges: List[List[int]] = []
+    for cpu in sorted(set(cpus)):
+        if len(ranges) > 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}"
+        for first, last in ranges
+    )
+
+
+def _memory_total() -> int:
+    for line in _MEMINFO_PATH.read_text().splitlines():
+        if line.startswith("MemTotal:"):
+            # The value is always in kibibytes, despite saying "kB"
+            return int(line.split()[1]) * 1024
+    raise RuntimeError(f"MemTotal is missing from {_MEMINFO_PATH}")
+
+
+def _read_int(path: Path, default: int) -> int:
+    try:
+        return int(path.read_text().strip())
+    except (OSError, ValueError):
+        return default
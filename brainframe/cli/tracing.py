@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from . import print_utils
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    """The kind of work, like "process", "http" or "file" """
+    start: float
+    """When the span started, in seconds since the recorder started"""
+    duration: float
+    thread_id: int
+    args: Dict[str, Any]
+
+
+class _NullSpan:
+    """Returned by span() when tracing is disabled, so that disabled spans cost
+    no more than a function call and a context manager with empty methods
+    """
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *_exc_info: Any) -> None:
+        pass
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+class _ActiveSpan:
+    def __init__(
+        self,
+        recorder: "_Recorder",
+        name: str,
+        category: str,
+        args: Dict[str, Any],
+    ):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.args = args
+        self._start = 0.0
+
+    def __enter__(self) -> "_ActiveSpan":
+        self._start = time.perf_counter()
+        return self
+
+    def set(self, key: str, value: Any) -> None:
+        """Adds a detail to the trace that is only known once the work is
+        underway, like a response's status code
+        """
+        self.args[key] = value
+
+    def __exit__(self, exc_type: Any, *_exc_info: Any) -> None:
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.recorder.add(
+            Span(
+                name=self.name,
+                category=self.category,
+                start=self._start - self.recorder.started_at,
+                duration=end - self._start,
+                thread_id=threading.get_ident(),
+                args=self.args,
+            )
+        )
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.spans: List[Span] = []
+        self.thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if span.thread_id not in self.thread_names:
+                name = threading.current_thread().name
+                self.thread_names[span.thread_id] = name
+
+
+_NULL_SPAN = _NullSpan()
+_recorder: Optional[_Recorder] = None
+
+
+def enable() -> None:
+    """Starts recording spans. Until this is called, span() does nothing."""
+    global _recorder
+    if _recorder is None:
+        _recorder = _Recorder()
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def span(
+    name: str, category: str, **args: Any
+) -> Union[_NullSpan, _ActiveSpan]:
+    """Records how long the code in a with block takes.
+
+        with tracing.span("docker-compose pull", "process"):
+            ...
+
+    :param name: A short description of the work, which spans are grouped by
+        in the summary
+    :param category: The kind of work, like "process", "http" or "file"
+    :param args: Details to include in the trace, like a URL
+    :return: A context manager that yields an object with a set(key, value)
+        method for adding details as the work happens
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return _ActiveSpan(_recorder, name, category, args)
+
+
+def print_summary() -> None:
+    """Prints the total time spent on each kind of work, longest first"""
+    if _recorder is None:
+        return
+
+    totals: Dict[tuple, List[float]] = defaultdict(list)
+    for recorded in _recorder.spans:
+        totals[(recorded.category, recorded.name)].append(recorded.duration)
+
+    rows = []
+    for (category, name), durations in sorted(
+        totals.items(), key=lambda item: sum(item[1]), reverse=True
+    ):
+        rows.append(
+            [
+                category,
+                name,
+                len(durations),
+                f"{sum(durations):.2f}s",
+                f"{max(durations):.2f}s",
+            ]
+        )
+
+    print()
+    print_utils.translate(
+        "general.timings-header",
+        wall_time=f"{time.perf_counter() - _recorder.started_at:.2f}",
+    )
+    print_utils.print_table(
+        ["CATEGORY", "NAME", "COUNT", "TOTAL", "MAX"], rows
+    )
+
+
+def write_chrome_trace(path: Path) -> None:
+    """Writes every recorded span in the Chrome trace event format, which can
+    be opened in Perfetto or chrome://tracing
+    """
+    if _recorder is None:
+        return
+
+    pid = os.getpid()
+    events: List[Dict[str, Any]] = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": thread_id,
+            "args": {"name": name},
+        }
+        for thread_id, name in _recorder.thread_names.items()
+    ]
+    for recorded in _recorder.spans:
+        events.append(
+            {
+                "name": recorded.name,
+                "cat": recorded.category,
+                "ph": "X",
+                "ts": recorded.start * 1_000_000,
+                "dur": recorded.duration * 1_000_000,
+                "pid": pid,
+                "tid": recorded.thread_id,
+                "args": {k: str(v) for k, v in recorded.args.items()},
+            }
+        )
+
+    path.write_text(json.dumps({"traceEvents": events}))
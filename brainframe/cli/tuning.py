@@ -0,0 +1,129 @@
+from typing import Any
+from typing import Dict
+from typing import List
+
+from . import topology
+
+HEAVY_MEMORY_FRACTION = 0.6
+"""The fraction of the host's memory shared by the heavy services"""
+
+LIGHT_MEMORY_FRACTION = 0.2
+"""The fraction of the host's memory reserved for every other service. The
+rest is left for the host and the page cache.
+"""
+
+SHM_FRACTION = 0.1
+"""The fraction of the host's memory shared by the heavy services' /dev/shm,
+which is where decoded video frames are passed between processes
+"""
+
+LIGHT_CORE_FRACTION = 0.25
+"""The fraction of physical cores set aside for services that aren't heavy"""
+
+_MIB = 1024 * 1024
+
+
+def plan_placement(
+    host: topology.HostTopology, heavy: List[str], light: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """Decides which CPUs each service may run on and how much memory it may
+    use, or is guaranteed. Heavy services get physical cores of their own, split along NUMA
+    nodes when there are enough of them, while the remaining services share a
+    smaller set of cores. Hyperthreads of the same core are always kept
+    together.
+
+    :param host: The machine's topology
+    :param heavy: Services that do most of the work, like inference
+    :param light: Every other service
+    :return: Compose settings for each service, by service name. A setting
+        of None means that any existing value should be removed.
+    """
+    # Without at least two cores there's nothing to separate, so any pinning
+    # from a previous run on different hardware is removed
+    settings: Dict[str, Dict[str, Any]] = {
+        service: {"cpuset": None} for service in heavy + light
+    }
+
+    cores = host.cores
+    if len(cores) >= 2:
+        heavy_cores = cores
+        light_cores: List[topology.PhysicalCore] = []
+        if len(light) > 0 and len(heavy) > 0:
+            light_count = max(1, int(len(cores) * LIGHT_CORE_FRACTION))
+            light_count = min(light_count, len(cores) - 1)
+            # Light services take cores from the end, so that heavy services
+            # get whole NUMA nodes starting from the first one
+            heavy_cores = cores[:-light_count]
+            light_cores = cores[-light_count:]
+        elif len(heavy) == 0:
+            light_cores = cores
+
+        for service, service_cores in zip(
+            heavy, _split_cores(heavy_cores, len(heavy))
+        ):
+            settings[service]["cpuset"] = _cpuset(service_cores)
+        for service in light:
+            settings[service]["cpuset"] = _cpuset(light_cores)
+
+    memory = host.memory_bytes
+    for service in heavy:
+        settings[service]["mem_limit"] = _size(
+            memory * HEAVY_MEMORY_FRACTION / len(heavy)
+        )
+        settings[service]["shm_size"] = _size(
+            memory * SHM_FRACTION / len(heavy)
+        )
+    for service in light:
+        # Light services, like the database, can need much more than their
+        # share for a while. A hard limit would get them killed, so they only
+        # get a reservation, which the kernel reclaims down to when memory is
+        # short.
+        settings[service]["mem_limit"] = None
+        settings[service]["mem_reservation"] = _size(
+            memory * LIGHT_MEMORY_FRACTION / len(light)
+        )
+
+    return settings
+
+
+def _split_cores(
+    cores: List[topology.PhysicalCore], parts: int
+) -> List[List[topology.PhysicalCore]]:
+    """Splits cores into contiguous groups, one per service. If there are at
+    least as many NUMA nodes as services, whole nodes are handed out so that
+    no service's memory accesses cross nodes.
+    """
+    if parts == 0:
+        return []
+    if len(cores) < parts:
+        # Not enough cores to go around, so everyone shares
+        return [cores] * parts
+
+    nodes: Dict[int, List[topology.PhysicalCore]] = {}
+    for core in cores:
+        nodes.setdefault(core.node, []).append(core)
+    if len(nodes) >= parts:
+        node_groups = _split_evenly(list(nodes.values()), parts)
+        return [[c for node in group for c in node] for group in node_groups]
+
+    return _split_evenly(cores, parts)
+
+
+def _split_evenly(items: List, parts: int) -> List[List]:
+    size, remainder = divmod(len(items), parts)
+    groups = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < remainder else 0)
+        groups.append(items[start:end])
+        start = end
+    return groups
+
+
+def _cpuset(cores: List[topology.PhysicalCore]) -> str:
+    return topology.format_cpu_list(cpu for core in cores for cpu in core.cpus)
+
+
+def _size(size_bytes: float) -> str:
+    """Formats a size the way Compose expects it, rounded down to MiB"""
+    return f"{int(size_bytes) // _MIB}m"
@@ -0,0 +1,104 @@
+import grp
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from . import os_utils
+
+
+class DirectoryCache:
+    """Decides which directories a walk has to read again, using the
+    modification times that the last walk saw. Adding, removing or renaming
+    anything in a directory changes its modification time, so a directory with
+    the same time still has the same entries.
+
+    Instances are passed to parallel_walk.walk as its `cached` argument.
+    """
+
+    def __init__(self, root: Path, known: Dict[str, Tuple[int, List[str]]]):
+        """
+        :param root: The directory being walked. Paths are relative to it.
+        :param known: The modification time and subdirectories of each
+            directory the last walk saw
+        """
+        self.root = root
+        self.known = known
+        self.seen: List[str] = []
+        """Every directory that was walked to, whether or not it was read"""
+        self.mtimes: Dict[str, int] = {}
+        """The modification times of the directories that have to be read,
+        from before they were read
+        """
+        self._lock = Lock()
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def __call__(self, directory: str) -> Optional[List[str]]:
+        relative_dir = self.relative(directory)
+        mtime_ns = os.lstat(directory).st_mtime_ns
+        with self._lock:
+            self.seen.append(relative_dir)
+            known = self.known.get(relative_dir)
+            if known is None or known[0] != mtime_ns:
+                # The time from before the directory is read is kept, so that
+                # changes made while it's being read are picked up next time
+                self.mtimes[relative_dir] = mtime_ns
+                return None
+        return [os.path.join(directory, name) for name in known[1]]
+
+
+@contextmanager
+def connect(path: Path, schema: str) -> Iterator[sqlite3.Connection]:
+    """Opens an index, creating its tables if they don't exist yet. Changes
+    are committed when the block exits without an error.
+    """
+    connection = sqlite3.connect(str(path), timeout=10)
+    try:
+        with connection:
+            connection.executescript(schema)
+            yield connection
+    finally:
+        connection.close()
+
+
+def forget_unseen(
+    connection: sqlite3.Connection, seen: Iterable[str], table: str
+) -> None:
+    """Deletes rows for directories that a walk didn't reach, since they no
+    longer exist. Afterwards, the directories that were reached are left in a
+    temporary "seen" table, for deleting other rows that belong to them.
+
+    :param connection: The open index
+    :param seen: Every directory the walk reached
+    :param table: The table of directories, keyed by a "path" column
+    """
+    connection.execute("CREATE TEMP TABLE seen (path TEXT PRIMARY KEY)")
+    connection.executemany(
+        "INSERT OR IGNORE INTO seen (path) VALUES (?)", [(d,) for d in seen]
+    )
+    connection.execute(
+        f"DELETE FROM {table} WHERE path NOT IN (SELECT path FROM seen)"
+    )
+
+
+def share_with_group(path: Path) -> None:
+    """Lets members of the BrainFrame group write to an index that was just
+    made. Indexes are made by whoever runs the command first, which is often
+    root.
+    """
+    if not os_utils.is_root():
+        return
+    try:
+        os.chown(path, -1, grp.getgrnam("brainframe").gr_gid)
+        os.chmod(path, 0o664)
+    except (KeyError, OSError):
+        pass
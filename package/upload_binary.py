@@ -3,6 +3,8 @@ a CloudFront invalidation to make those changes live.
 """
 
 import argparse
+import hashlib
+import json
 import os
 import uuid
 from io import BytesIO
@@ -10,6 +12,8 @@ from pathlib import Path
 
 import boto3
 from brainframe.cli import __version__
+from brainframe.cli import delta
+from brainframe.cli.downloads import file_sha256
 from brainframe.cli.print_utils import fail
 
 ssm = boto3.client("ssm")
@@ -19,6 +23,10 @@ cloudfront = boto3.client("cloudfront")
 
 _COMPANY_NAMES = ["aotu", "dilililabs"]
 
+_BINARY_KEY = "releases/brainframe-cli/brainframe"
+_LATEST_KEY = "releases/brainframe-cli/latest"
+_DELTA_PREFIX = "releases/brainframe-cli/deltas/"
+
 
 def main():
     stage = os.environ.get("STAGE", "dev")
@@ -32,11 +40,24 @@ def main():
         f"/content-delivery/bucket/releases/{stage}/bucket-name"
     )
 
+    # Make a patch from the release being replaced before it's overwritten
+    if not args.no_patch:
+        _upload_patch(bucket_name, args.binary_path)
+
     # Upload the binary
     s3.upload_file(
         Filename=str(args.binary_path),
         Bucket=bucket_name,
-        Key="releases/brainframe-cli/brainframe",
+        Key=_BINARY_KEY,
+    )
+
+    # Upload the binary's checksum, in the format used by sha256sum, so the
+    # self-update command can verify its download
+    checksum = f"{file_sha256(args.binary_path)}  brainframe\n"
+    s3.upload_fileobj(
+        Fileobj=BytesIO(checksum.encode("utf-8")),
+        Bucket=bucket_name,
+        Key="releases/brainframe-cli/brainframe.sha256",
     )
 
     # Upload a latest tag, containing the latest version number
@@ -44,7 +65,7 @@ def main():
     s3.upload_fileobj(
         Fileobj=version_tag_file,
         Bucket=bucket_name,
-        Key="releases/brainframe-cli/latest",
+        Key=_LATEST_KEY,
     )
 
     for company_name in _COMPANY_NAMES:
@@ -75,9 +96,67 @@ def _parse_args() -> argparse.Namespace:
         default=Path("dist/brainframe"),
     )
 
+    parser.add_argument(
+        "--no-patch",
+        action="store_true",
+        help="If provided, no patch from the previous release is published",
+    )
+
     return parser.parse_args()
 
 
+def _upload_patch(bucket_name: str, binary_path: Path) -> None:
+    """Uploads a patch from the currently published release to this one, and
+    adds it to the index of patches that the self-update command uses
+    """
+    try:
+        old_version = _get_object(bucket_name, _LATEST_KEY).decode().strip()
+        old_binary = _get_object(bucket_name, _BINARY_KEY)
+    except s3.exceptions.NoSuchKey:
+        print("No release has been published yet, so no patch was made")
+        return
+    if old_version == __version__:
+        print(
+            f"Version {__version__} is being republished, so no patch was made"
+        )
+        return
+
+    patch = delta.make_patch(old_binary, binary_path.read_bytes())
+    patch_info = delta.PatchInfo(
+        from_version=old_version,
+        to_version=__version__,
+        file_name=f"{old_version}-{__version__}.patch",
+        size=len(patch),
+        sha256=hashlib.sha256(patch).hexdigest(),
+    )
+    s3.upload_fileobj(
+        Fileobj=BytesIO(patch),
+        Bucket=bucket_name,
+        Key=_DELTA_PREFIX + patch_info.file_name,
+    )
+    print(
+        f"Uploaded a {len(patch)} byte patch from {old_version} to "
+        f"{__version__}"
+    )
+
+    index_key = _DELTA_PREFIX + "index.json"
+    try:
+        index = json.loads(_get_object(bucket_name, index_key))
+    except s3.exceptions.NoSuchKey:
+        index = {}
+    index = delta.add_to_index(index, patch_info)
+    s3.upload_fileobj(
+        Fileobj=BytesIO(json.dumps(index, indent=2).encode("utf-8")),
+        Bucket=bucket_name,
+        Key=index_key,
+    )
+
+
+def _get_object(bucket_name: str, key: str) -> bytes:
+    response = s3.get_object(Bucket=bucket_name, Key=key)
+    return response["Body"].read()
+
+
 def _get_parameter(name: str) -> str:
     response = ssm.get_parameter(Name=name)
     return response["Parameter"]["Value"]